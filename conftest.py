@@ -0,0 +1,26 @@
+"""
+Shared pytest fixtures.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from modules.config import Config
+
+
+@pytest.fixture(autouse=True)
+def files_in_tmp_path(tmp_path, monkeypatch):
+    """Write the log and capacity state files of loaded configs to ``tmp_path``."""
+    load_config = Config._load_config
+
+    def load_into_tmp_path(self):
+        load_config(self)
+        if self.daemon.log_file:
+            self.daemon.log_file = str(tmp_path / Path(self.daemon.log_file).name)
+        if self.bandwidth.capacity_state_file:
+            self.bandwidth.capacity_state_file = str(
+                tmp_path / Path(self.bandwidth.capacity_state_file).name
+            )
+
+    monkeypatch.setattr(Config, '_load_config', load_into_tmp_path)
@@ -8,6 +8,7 @@ Main daemon script that coordinates bandwidth monitoring and management.
 import sys
 import time
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import signal
 import logging
 import argparse
@@ -22,6 +23,10 @@ from modules.openwrt_client import OpenWRTClient
 from modules.jellyfin_client import JellyfinClient
 from modules.bandwidth_manager import BandwidthManager
 from modules.network_utils import NetworkUtils
+from modules.capacity import SATURATION, CapacityEstimator
+from modules.triggers import ActivityLogWatcher, ReallocationTrigger
+from modules.restart_policy import restart_needed
+from modules.stream_session import StreamSession, SessionDiff, diff_sessions, index_sessions
 
 
 class JellyDemon:
@@ -38,9 +43,29 @@ class JellyDemon:
         self.jellyfin = JellyfinClient(self.config.jellyfin)
         self.bandwidth_manager = BandwidthManager(self.config.bandwidth)
         self.network_utils = NetworkUtils(self.config.network)
+        self.capacity = CapacityEstimator(
+            self.openwrt.get_capacity_hints,
+            ttl=self.config.bandwidth.capacity_ttl,
+            state_file=self.config.bandwidth.capacity_state_file
+        )
         self.bandwidth_history = deque()
+        # Whether the last limits held streams below their demand, and the
+        # Jellyfin rate those limits allowed; tells a full link apart
+        self._demand_exceeds_limits = False
+        self._expected_jellyfin_mbps = 0.0
         self.current_external_users = set()
+        # Sessions of external streamers by session id, and the last change feed
+        self.current_sessions: Dict[str, StreamSession] = {}
+        self.last_session_diff = SessionDiff()
         self._usage_above_threshold = None
+        self._collector_pool = None
+        self.last_cycle_timings: Dict[str, float] = {}
+        # Seconds the last client rate query took, and that the Jellyfin
+        # collector spent waiting for it
+        self._client_rates_time = 0.0
+        self._client_rates_wait = 0.0
+        self.trigger = ReallocationTrigger(debounce=self.config.daemon.reallocation_debounce)
+        self.activity_watcher = None
         
         # Setup signal handlers
         signal.signal(signal.SIGTERM, self._signal_handler)
@@ -52,6 +77,7 @@ class JellyDemon:
         """Handle shutdown signals gracefully."""
         self.logger.info(f"Received signal {signum}, shutting down...")
         self.running = False
+        self.trigger.interrupt()
     
     def validate_connectivity(self) -> bool:
         """Validate connectivity to all required services."""
@@ -73,17 +99,38 @@ class JellyDemon:
     def get_current_bandwidth_usage(self) -> float:
         """Get averaged upload bandwidth usage from router."""
         try:
-            usage = self.openwrt.get_bandwidth_usage()
-
-            if self.config.router.jellyfin_ip:
-                jf_usage = self.openwrt.get_bandwidth_usage(self.config.router.jellyfin_ip)
-                usage = max(usage - jf_usage, 0)
-                self.logger.debug(
-                    f"Subtracting Jellyfin traffic {jf_usage:.2f} Mbps from total"
+            now = time.time()
+            jellyfin_ip = self.config.router.jellyfin_ip
+            if jellyfin_ip:
+                # Total and Jellyfin counters come from one sampling window
+                sample = self.openwrt.sample_upload_rates([jellyfin_ip])
+                jf_usage = sample.per_ip.get(jellyfin_ip)
+                # Streams that want more than their limits yet do not get
+                # what the limits allow are held back by the uplink itself
+                saturated = (
+                    jf_usage is not None and self._demand_exceeds_limits and
+                    jf_usage < SATURATION * self._expected_jellyfin_mbps
                 )
+                self.capacity.observe(sample.total_mbps, now, saturated=saturated)
+                if jf_usage is None:
+                    # The Jellyfin counter has no baseline this cycle (new or
+                    # reset); its traffic must not count as other usage
+                    self.logger.debug("Jellyfin traffic unknown this cycle, keeping the average")
+                    usage = None
+                else:
+                    usage = max(sample.total_mbps - jf_usage, 0)
+                    self.logger.debug(
+                        f"Subtracting Jellyfin traffic {jf_usage:.2f} Mbps from total"
+                    )
+            else:
+                usage = self.openwrt.get_bandwidth_usage()
+                self.capacity.observe(usage, now)
 
-            now = time.time()
-            self.bandwidth_history.append((now, usage))
+            if usage is not None:
+                self.bandwidth_history.append((now, usage))
+            elif not self.bandwidth_history:
+                # Nothing to average yet: count everything as other usage
+                self.bandwidth_history.append((now, sample.total_mbps))
 
             # Remove samples older than spike_duration window
             window = self.config.bandwidth.spike_duration * 60
@@ -91,39 +138,87 @@ class JellyDemon:
                 self.bandwidth_history.popleft()
 
             avg_usage = sum(u for _, u in self.bandwidth_history) / len(self.bandwidth_history)
-            self.logger.debug(
-                f"Current upload usage: {avg_usage:.2f} Mbps (raw {usage:.2f} Mbps)"
-            )
+            raw = f"{usage:.2f} Mbps" if usage is not None else "unknown"
+            self.logger.debug(f"Current upload usage: {avg_usage:.2f} Mbps (raw {raw})")
             return avg_usage
         except Exception as e:
             self.logger.error(f"Failed to get bandwidth usage: {e}")
             return 0.0
     
     def get_external_streamers(self) -> Dict[str, Dict[str, Any]]:
-        """Get list of users streaming from external IPs."""
+        """
+        Get the sessions streaming to external IPs.
+
+        Every session is its own allocation unit, so a user streaming on
+        two devices gets two shares.
+
+        Returns:
+            Dictionary keyed by session id with ``user_id``, ``ip``,
+            ``session_data``, ``user_data`` and, when measured,
+            ``measured_mbps``
+        """
         try:
             # Get active sessions from Jellyfin
             sessions = self.jellyfin.get_active_sessions()
             external_sessions = {}
             
-            for session in sessions:
-                user_id = session.get('UserId')
-                remote_endpoint = session.get('RemoteEndPoint', '')
+            for raw in sessions:
+                # Keep only the fields the daemon uses, parsed once
+                session = StreamSession.from_dict(raw)
+                user_id = session.user_id
                 
-                if user_id and remote_endpoint:
-                    # Extract IP from endpoint (format: "IP:PORT")
-                    client_ip = remote_endpoint.split(':')[0]
+                if user_id and session.endpoint:
+                    client_ip = session.ip
                     
                     # Check if IP is external
                     if self.network_utils.is_external_ip(client_ip):
-                        external_sessions[user_id] = {
+                        external_sessions[session.id or user_id] = {
+                            'user_id': user_id,
                             'ip': client_ip,
                             'session_data': session,
-                            'user_data': self.jellyfin.get_user_info(user_id)
                         }
-                        self.logger.debug(f"External streamer found: {user_id} from {client_ip}")
+                        self.logger.debug(
+                            f"External streamer found: {user_id} from {client_ip} "
+                            f"(session {session.id})"
+                        )
+
+            # Look up user details and measured per-client upload; the router
+            # query runs on the collector pool when running concurrently
+            client_ips = sorted({s['ip'] for s in external_sessions.values()})
+            measure = (
+                self.config.router.client_accounting != 'off' and bool(client_ips)
+            )
+            def measure_rates():
+                start = time.perf_counter()
+                rates = self.openwrt.get_client_upload_rates(client_ips)
+                self._client_rates_time = time.perf_counter() - start
+                return rates
+
+            rates_future = (
+                self._collector_pool.submit(measure_rates)
+                if measure and self._collector_pool is not None else None
+            )
+            # Served from the user directory, at most one /Users request
+            for streamer in external_sessions.values():
+                streamer['user_data'] = self.jellyfin.get_user_info(streamer['user_id'])
+            wait_start = time.perf_counter()
+            if rates_future is not None:
+                client_rates = rates_future.result()
+            else:
+                client_rates = measure_rates() if measure else {}
+            self._client_rates_wait = time.perf_counter() - wait_start
+
+            # Sessions behind the same client IP share its measured rate
+            sessions_per_ip = {}
+            for streamer in external_sessions.values():
+                sessions_per_ip[streamer['ip']] = sessions_per_ip.get(streamer['ip'], 0) + 1
+            for streamer in external_sessions.values():
+                if streamer['ip'] in client_rates:
+                    streamer['measured_mbps'] = (
+                        client_rates[streamer['ip']] / sessions_per_ip[streamer['ip']]
+                    )
             
-            self.logger.info(f"Found {len(external_sessions)} external streamers")
+            self.logger.info(f"Found {len(external_sessions)} external streams")
             return external_sessions
             
         except Exception as e:
@@ -134,14 +229,19 @@ class JellyDemon:
                                   current_usage: float):
         """Calculate and apply bandwidth limits for external users."""
         if not external_streamers:
+            self._demand_exceeds_limits = False
+            self._expected_jellyfin_mbps = 0.0
             self.logger.debug("No external streamers, skipping bandwidth calculation")
+            if self.config.bandwidth.enforcement != 'jellyfin' and self.openwrt.shaper.active:
+                # Drop the classes of clients that stopped streaming
+                self.apply_router_limits({}, {})
             return
         
         try:
             # Calculate available bandwidth
             total_bandwidth = self.config.bandwidth.total_upload_mbps
             if total_bandwidth == 0:
-                total_bandwidth = self.openwrt.get_total_bandwidth()
+                total_bandwidth = self.capacity.capacity()
 
             available_bandwidth = total_bandwidth - current_usage - self.config.bandwidth.reserved_bandwidth
 
@@ -159,42 +259,170 @@ class JellyDemon:
                 from modules.bandwidth_manager import EqualSplitAlgorithm
 
                 algo = EqualSplitAlgorithm()
-                user_limits = algo.calculate_limits(
+                session_limits = algo.calculate_limits(
                     external_streamers, available_bandwidth, self.config.bandwidth
                 )
             else:
-                user_limits = self.bandwidth_manager.calculate_limits(
+                session_limits = self.bandwidth_manager.calculate_limits(
                     external_streamers, available_bandwidth
                 )
+
+            demands = self.bandwidth_manager.demands(external_streamers)
+            self._demand_exceeds_limits = sum(demands.values()) > sum(session_limits.values())
+            self._expected_jellyfin_mbps = sum(
+                min(limit, demands.get(key, limit)) for key, limit in session_limits.items()
+            )
             
+            enforcement = self.config.bandwidth.enforcement
+            if enforcement != 'jellyfin':
+                # Per-device: every client IP is shaped to its sessions' sum
+                self.apply_router_limits(external_streamers, session_limits)
+                if enforcement == 'router':
+                    return
+
             # Apply limits to Jellyfin users
-            for user_id, limit in user_limits.items():
-                session = external_streamers.get(user_id, {}).get('session_data')
+            for user_id, shares in self._shares_by_user(external_streamers, session_limits).items():
+                # Jellyfin caps each of a user's remote streams at the policy
+                # limit, so capping every stream at the mean share keeps the
+                # user within the sum of their sessions' shares
+                limit = sum(shares.values()) / len(shares)
+                sessions = [
+                    external_streamers[unit_id]['session_data'] for unit_id in shares
+                    if external_streamers.get(unit_id, {}).get('session_data')
+                ]
+                if enforcement == 'hybrid':
+                    # The router enforces live streams; the policy only
+                    # steers new sessions, so never restart playback
+                    sessions = []
                 if self.config.daemon.dry_run:
                     policy = self.jellyfin.get_user_policy(user_id) or {}
                     old_bps = policy.get('RemoteClientBitrateLimit', 0) or 0
                     old_limit = old_bps / 1_000_000
-                    state = "playing" if session and session.get('NowPlayingItem') else "idle"
+                    playing = [
+                        s for s in map(StreamSession.coerce, sessions) if s.playing
+                    ]
+                    state = "playing" if playing else "idle"
                     msg = (
                         f"[DRY RUN] Would change user {user_id} from {old_limit:.2f} Mbps "
                         f"to {limit:.2f} Mbps ({state})"
                     )
-                    if session and session.get('NowPlayingItem'):
-                        msg += f" - would restart stream (session {session.get('Id')})"
+                    for session in playing:
+                        needed, reason = restart_needed(
+                            session, old_bps, int(limit * 1_000_000),
+                            self.config.jellyfin.quality_ladder_mbps
+                        )
+                        if needed or not self.config.jellyfin.skip_unneeded_restarts:
+                            msg += f" - would restart stream (session {session.id})"
+                        else:
+                            msg += f" - no restart needed ({reason})"
                     self.logger.info(msg)
                     continue
 
-                self.jellyfin.set_user_bandwidth_limit(user_id, limit, session)
+                if len(sessions) > 1:
+                    # Units are keyed by session id, so the shares double as
+                    # per-device limits for command delivery
+                    self.jellyfin.set_user_bandwidth_limit(
+                        user_id, limit, sessions, session_limits=shares
+                    )
+                else:
+                    self.jellyfin.set_user_bandwidth_limit(
+                        user_id, limit, sessions[0] if sessions else None
+                    )
                     
         except Exception as e:
             self.logger.error(f"Failed to calculate/apply limits: {e}")
+    
+    @staticmethod
+    def _shares_by_user(external_streamers: Dict[str, Dict[str, Any]],
+                        session_limits: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+        """Group the per-session limits by user: ``{user_id: {session key: limit}}``."""
+        shares: Dict[str, Dict[str, float]] = {}
+        for unit_id, limit in session_limits.items():
+            user_id = external_streamers.get(unit_id, {}).get('user_id', unit_id)
+            shares.setdefault(user_id, {})[unit_id] = limit
+        return shares
+
+    def apply_router_limits(self, external_streamers: Dict[str, Dict[str, Any]],
+                            session_limits: Dict[str, float]) -> bool:
+        """
+        Enforce session limits as per-client-IP shaping on the router.
+        
+        Sessions streaming from the same IP share one ceiling (the sum of
+        their limits).
+        """
+        ip_limits: Dict[str, float] = {}
+        for unit_id, limit in session_limits.items():
+            ip = external_streamers.get(unit_id, {}).get('ip')
+            if ip:
+                ip_limits[ip] = ip_limits.get(ip, 0.0) + limit
+
+        if self.config.daemon.dry_run:
+            for ip, limit in sorted(ip_limits.items()):
+                self.logger.info(f"[DRY RUN] Would shape upload to {ip} at {limit:.2f} Mbps")
+            return True
+
+        applied = self.openwrt.apply_client_limits(ip_limits, self.config.router.jellyfin_ip)
+        if applied and ip_limits:
+            self.logger.info(
+                "Router shaping: " + ", ".join(
+                    f"{ip}={limit:.2f} Mbps" for ip, limit in sorted(ip_limits.items())
+                )
+            )
+        return applied
     
+    def _collect(self):
+        """
+        Gather router usage and Jellyfin streamers for one cycle.
+
+        In concurrent mode the router sample runs on the collector pool while
+        the Jellyfin collectors run on the calling thread (fanning their user
+        lookups out over the same pool), so the cycle waits for
+        max(router, jellyfin) instead of their sum.
+
+        Returns:
+            Tuple of (current usage in Mbps, external streamers, timings)
+        """
+        def timed(func):
+            start = time.perf_counter()
+            result = func()
+            return result, time.perf_counter() - start
+
+        # Set by get_external_streamers: its router query counts as router time
+        self._client_rates_time = self._client_rates_wait = 0.0
+        start = time.perf_counter()
+        if self.config.daemon.concurrent_collection:
+            if self._collector_pool is None:
+                self._collector_pool = ThreadPoolExecutor(
+                    max_workers=self.config.daemon.collector_workers,
+                    thread_name_prefix='jellydemon-collector'
+                )
+            router_future = self._collector_pool.submit(timed, self.get_current_bandwidth_usage)
+            external_streamers, jellyfin_time = timed(self.get_external_streamers)
+            current_usage, router_time = router_future.result()
+        else:
+            current_usage, router_time = timed(self.get_current_bandwidth_usage)
+            external_streamers, jellyfin_time = timed(self.get_external_streamers)
+
+        timings = {
+            'router': router_time + self._client_rates_time,
+            'jellyfin': max(jellyfin_time - self._client_rates_wait, 0.0),
+            'collect': time.perf_counter() - start,
+        }
+        return current_usage, external_streamers, timings
+
+    def _shutdown_collectors(self):
+        """Stop the collector worker pool if it was started."""
+        if self._collector_pool is not None:
+            self._collector_pool.shutdown(wait=False)
+            self._collector_pool = None
+
     def run_single_cycle(self):
         """Run a single monitoring/adjustment cycle."""
         self.logger.debug("Starting monitoring cycle")
+        cycle_start = time.perf_counter()
 
-        # Get current bandwidth usage
-        current_usage = self.get_current_bandwidth_usage()
+        # Get current bandwidth usage and external streamers
+        current_usage, external_streamers, timings = self._collect()
 
         above = current_usage > self.config.bandwidth.low_usage_threshold
         if self._usage_above_threshold is not None:
@@ -208,22 +436,79 @@ class JellyDemon:
                 )
         self._usage_above_threshold = above
 
-        # Get external streamers
-        external_streamers = self.get_external_streamers()
-
-        new_users = set(external_streamers.keys())
-        for user_id in new_users - self.current_external_users:
-            ip = external_streamers[user_id].get('ip', 'unknown')
-            self.logger.info(f"User {user_id} started streaming from {ip}")
-        for user_id in self.current_external_users - new_users:
-            self.logger.info(f"User {user_id} stopped streaming")
-        self.current_external_users = new_users
+        sessions = index_sessions(
+            StreamSession.coerce(s['session_data'])
+            for s in external_streamers.values() if s.get('session_data')
+        )
+        diff = diff_sessions(self.current_sessions, sessions)
+        # A user starts with their first session and stops with their last
+        streaming = {session.user_id for session in sessions.values()}
+        for session in diff.started:
+            if session.user_id not in self.current_external_users:
+                self.current_external_users.add(session.user_id)
+                self.logger.info(f"User {session.user_id} started streaming from {session.ip}")
+        for session in diff.stopped:
+            if session.user_id in self.current_external_users and session.user_id not in streaming:
+                self.current_external_users.discard(session.user_id)
+                self.logger.info(f"User {session.user_id} stopped streaming")
+        for old, new in diff.changed:
+            if old.item_id != new.item_id:
+                change = f"switched to item {new.item_id}"
+            elif old.is_paused != new.is_paused:
+                change = "paused" if new.is_paused else "resumed"
+            else:
+                change = "changed stream"
+            self.logger.debug(f"Session {new.id} of user {new.user_id} {change}")
+        self.current_sessions = sessions
+        self.last_session_diff = diff
 
         # Calculate and apply bandwidth limits
+        allocate_start = time.perf_counter()
         self.calculate_and_apply_limits(external_streamers, current_usage)
+        self.jellyfin.dispatch_restarts()
+        timings['allocate'] = time.perf_counter() - allocate_start
+        timings['total'] = time.perf_counter() - cycle_start
+        timings['saved'] = max(timings['router'] + timings['jellyfin'] - timings['collect'], 0.0)
+        self.last_cycle_timings = timings
 
+        self.logger.debug(
+            f"Cycle timings: router {timings['router']:.3f}s, "
+            f"jellyfin {timings['jellyfin']:.3f}s, "
+            f"collect {timings['collect']:.3f}s (saved {timings['saved']:.3f}s), "
+            f"allocate {timings['allocate']:.3f}s, total {timings['total']:.3f}s"
+        )
+        if self.config.router.use_ssh and self.logger.isEnabledFor(logging.DEBUG):
+            ssh = self.openwrt.ssh.stats()
+            latency = ssh['last_connect_latency']
+            self.logger.debug(
+                f"Router SSH: {'connected' if ssh['connected'] else 'disconnected'}, "
+                f"{ssh['connects']} connects, {ssh['reconnects']} reconnects, "
+                f"{ssh['failures']} failures"
+                + (f", last connect {latency:.3f}s" if latency is not None else "")
+                + (f", last error: {ssh['last_error']}" if ssh['last_error'] else "")
+            )
         self.logger.debug("Monitoring cycle completed")
     
+    def _start_event_sources(self):
+        """Start the session event sources that trigger early re-allocation."""
+        self.jellyfin.start_session_tracking(
+            on_playback_change=lambda: self.trigger.notify('session')
+        )
+        interval = self.config.jellyfin.activity_poll_interval
+        if interval > 0:
+            self.activity_watcher = ActivityLogWatcher(
+                self.jellyfin.get_activity_entries, self.trigger.notify,
+                interval=interval, paused=lambda: self.jellyfin.sessions_live
+            )
+            self.activity_watcher.start()
+    
+    def _stop_event_sources(self):
+        """Stop the session event sources."""
+        self.jellyfin.stop_session_tracking()
+        if self.activity_watcher is not None:
+            self.activity_watcher.stop()
+            self.activity_watcher = None
+    
     def run(self):
         """Main daemon loop."""
         if not self.validate_connectivity():
@@ -240,18 +525,25 @@ class JellyDemon:
             self.logger.error(f"Failed to write PID file {pid_path}: {e}")
             return 1
 
+        self.openwrt.start_telemetry()
+        self._start_event_sources()
+
         self.logger.info("Starting JellyDemon main loop")
         self.running = True
         
         try:
             while self.running:
                 self.run_single_cycle()
+                if not self.running:
+                    break
                 
-                # Sleep for configured interval
-                for _ in range(self.config.daemon.update_interval):
-                    if not self.running:
-                        break
-                    time.sleep(1)
+                # Sleep for configured interval, or less if sessions changed
+                reasons = self.trigger.wait(self.config.daemon.update_interval)
+                if reasons and self.running:
+                    self.logger.info(
+                        f"Early re-allocation after {len(reasons)} event(s): "
+                        f"{', '.join(sorted(set(reasons)))}"
+                    )
                     
         except Exception as e:
             self.logger.error(f"Unexpected error in main loop: {e}")
@@ -259,6 +551,13 @@ class JellyDemon:
 
         finally:
             self.logger.info("JellyDemon shutting down")
+            self._shutdown_collectors()
+            self.openwrt.stop_telemetry()
+            self._stop_event_sources()
+            self.jellyfin.shutdown_restarts()
+            self.jellyfin.session.log_latency()
+            if self.config.bandwidth.enforcement != 'jellyfin' and not self.config.daemon.dry_run:
+                self.openwrt.clear_client_limits()
             if pid_path.exists():
                 try:
                     pid_path.unlink()
@@ -278,6 +577,8 @@ class JellyDemon:
                 except Exception as e:
                     self.logger.error(f"Failed to restore user limits: {e}")
 
+            self.openwrt.close()
+
         return 0
 
 
@@ -0,0 +1,316 @@
+"""
+Array-backed allocation solvers shared by the bandwidth algorithms.
+
+The streamer set is turned into parallel columns once per cycle and each
+solver works on whole columns. NumPy is used when it is installed; the
+same solvers run on plain lists otherwise.
+"""
+
+import math
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+Column = Union[Sequence[float], 'np.ndarray']
+Bound = Union[float, Column]
+
+# Weight below which a segment of the fill counts as flat (rounding noise)
+_EPSILON = 1e-9
+
+
+class Columns:
+    """Streamer set as parallel columns (user ids, demand, weight, min, max, limit)."""
+
+    __slots__ = ('user_ids', 'demand', 'weight', 'floor', 'cap', 'limit')
+
+    def __init__(self, user_ids: Iterable[str], demand: Optional[Iterable[float]] = None,
+                 weight: Optional[Iterable[float]] = None, floor: Optional[Bound] = None,
+                 cap: Optional[Bound] = None):
+        """
+        Build the columns.
+
+        Args:
+            user_ids: User ids, in column order
+            demand: Estimated demand per user in Mbps
+            weight: Priority weight per user
+            floor: Minimum limit per user in Mbps, or one for everyone
+            cap: Maximum limit per user in Mbps, or one for everyone
+        """
+        self.user_ids = list(user_ids)
+        self.demand = _column(demand) if demand is not None else None
+        self.weight = _column(weight) if weight is not None else None
+        # One bound for everyone stays a scalar; the solvers broadcast it
+        self.floor = floor if floor is None or _scalar(floor) else _column(floor)
+        self.cap = cap if cap is None or _scalar(cap) else _column(cap)
+        # Allocated limit per user, set by limits()
+        self.limit: Optional[Column] = None
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def clamp(self, values: Column) -> Column:
+        """Clamp ``values`` to each user's ``[floor, cap]``."""
+        return clip(
+            values,
+            self.floor if self.floor is not None else 0.0,
+            self.cap if self.cap is not None else math.inf
+        )
+
+    def limits(self, values: Column) -> Dict[str, float]:
+        """Store a solver result as the limit column and map it to ``{user_id: limit}``."""
+        self.limit = values
+        return dict(zip(self.user_ids, to_list(values)))
+
+
+def _column(values: Iterable[float]) -> Column:
+    if np is not None:
+        return np.fromiter(values, dtype=float)
+    return [float(v) for v in values]
+
+
+def _bound(value: Bound, n: int) -> Column:
+    """Broadcast a scalar floor or cap to a column."""
+    if isinstance(value, (int, float)):
+        return np.full(n, float(value)) if np is not None else [float(value)] * n
+    return np.asarray(value, dtype=float) if np is not None else [float(v) for v in value]
+
+
+def _sum(values: Column) -> float:
+    return float(values.sum()) if np is not None else sum(values)
+
+
+def _scalar(value: Bound) -> bool:
+    return isinstance(value, (int, float))
+
+
+def clip(values: Column, floor: Bound, cap: Bound) -> Column:
+    """Clamp every value to ``[floor, cap]`` (one bound for all, or one per value)."""
+    if np is not None:
+        return np.clip(values, floor, cap)
+    if _scalar(floor) and _scalar(cap):
+        return [max(floor, min(cap, v)) for v in values]
+    n = len(values)
+    return [max(f, min(c, v)) for v, f, c in zip(values, _bound(floor, n), _bound(cap, n))]
+
+
+def to_list(values: Column) -> List[float]:
+    """Solver result as a list of floats."""
+    if np is not None and isinstance(values, np.ndarray):
+        return values.tolist()
+    return list(values)
+
+
+def equal_split(n: int, budget: float, floor: Bound, cap: Bound) -> Column:
+    """The same share for everyone, clamped to ``[floor, cap]``."""
+    if _scalar(floor) and _scalar(cap):
+        return _bound(max(floor, min(cap, budget / n)), n)
+    return clip(_bound(budget / n, n), floor, cap)
+
+
+def weighted_split(weights: Column, budget: float, floor: Bound, cap: Bound) -> Column:
+    """Shares proportional to ``weights``, each clamped to ``[floor, cap]``."""
+    total = _sum(weights)
+    if np is not None:
+        return np.clip(weights * (budget / total), floor, cap)
+    return clip([w * budget / total for w in weights], floor, cap)
+
+
+def demand_split(demands: Column, budget: float, floor: Bound, cap: Bound) -> Column:
+    """Demands, scaled down proportionally if they exceed ``budget``, clamped."""
+    total = _sum(demands)
+    scale = budget / total if total > budget else 1.0
+    if np is not None:
+        return np.clip(demands * scale, floor, cap)
+    return clip([d * scale for d in demands], floor, cap)
+
+
+def water_fill(budget: float, floors: Bound, caps: Bound, n: Optional[int] = None,
+               weights: Optional[Column] = None) -> Column:
+    """
+    Max-min fair split of ``budget`` between users with floors and caps.
+
+    Raises a common water level and gives each user
+    ``min(cap, max(level * weight, floor))``; the level is chosen so the
+    shares sum to ``budget`` exactly, unless every cap is reached first.
+    Runs in O(n log n): the fill is evaluated at every floor and cap at
+    once from sorted prefix sums.
+
+    Args:
+        budget: Bandwidth to distribute (at least the sum of the floors)
+        floors: Minimum share per user, or one for everyone
+        caps: Maximum share per user (not below the floor), or one for everyone
+        n: Number of users, needed when both bounds are scalars
+        weights: Relative share per user (default: equal)
+
+    Returns:
+        Shares in user order
+    """
+    if n is None:
+        n = len(caps) if not isinstance(caps, (int, float)) else len(floors)
+    if n == 0:
+        return _bound(0.0, 0)
+    floors, caps = _bound(floors, n), _bound(caps, n)
+    weights = _bound(1.0 if weights is None else weights, n)
+    if np is not None:
+        return _water_fill_numpy(budget, floors, caps, weights)
+    return _water_fill_python(budget, floors, caps, weights)
+
+
+def _water_fill_numpy(budget: float, floors: 'np.ndarray', caps: 'np.ndarray',
+                      weights: 'np.ndarray') -> 'np.ndarray':
+    if caps.sum() <= budget:
+        return caps.copy()
+    # Work in level space: user i rises between floor/weight and cap/weight
+    floor_levels, cap_levels = floors / weights, caps / weights
+    by_floor, by_cap = np.argsort(floor_levels), np.argsort(cap_levels)
+    floor_levels, cap_levels = floor_levels[by_floor], cap_levels[by_cap]
+    floor_sums = np.concatenate(([0.0], np.cumsum(floors[by_floor])))
+    cap_sums = np.concatenate(([0.0], np.cumsum(caps[by_cap])))
+    floor_weights = np.concatenate(([0.0], np.cumsum(weights[by_floor])))
+    cap_weights = np.concatenate(([0.0], np.cumsum(weights[by_cap])))
+
+    points = np.union1d(floor_levels, cap_levels)
+    # Users at or above their floor, and users already at their cap
+    above_floor = np.searchsorted(floor_levels, points, side='right')
+    at_cap = np.searchsorted(cap_levels, points, side='right')
+    rising = floor_weights[above_floor] - cap_weights[at_cap]
+    filled = (floor_sums[-1] - floor_sums[above_floor]) + cap_sums[at_cap] + points * rising
+
+    k = int(np.searchsorted(filled, budget))
+    level = points[0]
+    if k > 0:
+        level = points[k - 1]
+        if rising[k - 1] > _EPSILON:
+            level += (budget - filled[k - 1]) / rising[k - 1]
+    return np.minimum(caps, np.maximum(level * weights, floors))
+
+
+def _water_fill_python(budget: float, floors: List[float], caps: List[float],
+                       weights: List[float]) -> List[float]:
+    if sum(caps) <= budget:
+        return list(caps)
+    by_floor = sorted(zip((f / w for f, w in zip(floors, weights)), floors, weights))
+    by_cap = sorted(zip((c / w for c, w in zip(caps, weights)), caps, weights))
+    floor_levels = [level for level, _, _ in by_floor]
+    cap_levels = [level for level, _, _ in by_cap]
+    floor_sums = [0.0] + list(accumulate(f for _, f, _ in by_floor))
+    cap_sums = [0.0] + list(accumulate(c for _, c, _ in by_cap))
+    floor_weights = [0.0] + list(accumulate(w for _, _, w in by_floor))
+    cap_weights = [0.0] + list(accumulate(w for _, _, w in by_cap))
+
+    def filled(level: float):
+        above_floor = bisect_right(floor_levels, level)
+        at_cap = bisect_right(cap_levels, level)
+        rising = floor_weights[above_floor] - cap_weights[at_cap]
+        fill = (floor_sums[-1] - floor_sums[above_floor]) + cap_sums[at_cap] + level * rising
+        return fill, rising
+
+    points = sorted(set(floor_levels) | set(cap_levels))
+    # Binary search for the first point where the fill reaches the budget
+    lo, hi = 0, len(points) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if filled(points[mid])[0] >= budget:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    level = points[0]
+    if lo > 0:
+        fill, rising = filled(points[lo - 1])
+        level = points[lo - 1]
+        if rising > _EPSILON:
+            level += (budget - fill) / rising
+    return [min(c, max(level * w, f)) for f, c, w in zip(floors, caps, weights)]
+
+
+def water_fill_segments(budgets: Column, counts: Sequence[int], floors: Bound,
+                        caps: Bound) -> Column:
+    """
+    Equal-weight water fills of consecutive segments of rows, solved together.
+
+    Segment ``s`` is the next ``counts[s]`` rows and splits ``budgets[s]``
+    between them. The result is what :func:`water_fill` gives for each
+    segment on its own, but with NumPy all segments are solved in one pass:
+    rows are offset by segment so one sort and one set of prefix sums cover
+    every segment.
+
+    Args:
+        budgets: Bandwidth of each segment
+        counts: Number of rows in each segment (at least one)
+        floors: Minimum share per row, or one for every row
+        caps: Maximum share per row (not below the floor), or one for every row
+
+    Returns:
+        Shares in row order
+    """
+    n = sum(counts)
+    if n == 0:
+        return _bound(0.0, 0)
+    budgets, floors, caps = _bound(budgets, len(counts)), _bound(floors, n), _bound(caps, n)
+    if np is not None and np.isfinite(caps).all():
+        return _water_fill_segments_numpy(budgets, np.asarray(counts), floors, caps)
+    return _water_fill_segments_python(to_list(budgets), counts, to_list(floors), to_list(caps))
+
+
+def _water_fill_segments_numpy(budgets: 'np.ndarray', counts: 'np.ndarray',
+                               floors: 'np.ndarray', caps: 'np.ndarray') -> 'np.ndarray':
+    segments = np.arange(len(counts))
+    row_segment = np.repeat(segments, counts)
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    # Shift each segment's values past the previous one's, so sorting by
+    # key orders rows by segment, then by value
+    offset = row_segment * (float(caps.max() - floors.min()) + 1.0)
+    floor_keys, cap_keys = floors + offset, caps + offset
+    by_floor, by_cap = np.argsort(floor_keys), np.argsort(cap_keys)
+    floor_sums = np.concatenate(([0.0], np.cumsum(floors[by_floor])))
+    cap_sums = np.concatenate(([0.0], np.cumsum(caps[by_cap])))
+    floor_keys, cap_keys = floor_keys[by_floor], cap_keys[by_cap]
+
+    # Candidate levels: every floor and cap, by segment then value
+    keys = np.concatenate((floor_keys, cap_keys))
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    levels = np.concatenate((floors[by_floor], caps[by_cap]))[order]
+    point_segment = np.concatenate((row_segment[by_floor], row_segment[by_cap]))[order]
+    first, last = starts[point_segment], starts[point_segment + 1]
+    above_floor = np.searchsorted(floor_keys, keys, side='right')
+    at_cap = np.searchsorted(cap_keys, keys, side='right')
+    rising = above_floor - at_cap
+    filled = (floor_sums[last] - floor_sums[above_floor]) + \
+        (cap_sums[at_cap] - cap_sums[first]) + levels * rising
+
+    # Points short of the budget come first in each segment; the level lies
+    # between the last of them and the next point
+    short = np.bincount(
+        point_segment, weights=filled < budgets[point_segment], minlength=len(counts)
+    ).astype(int)
+    previous = 2 * starts[:-1] + np.maximum(short - 1, 0)
+    level = levels[previous]
+    step = (short > 0) & (rising[previous] > _EPSILON)
+    level[step] += (budgets[step] - filled[previous][step]) / rising[previous][step]
+
+    shares = np.minimum(caps, np.maximum(level[row_segment], floors))
+    full = np.add.reduceat(caps, starts[:-1]) <= budgets
+    return np.where(full[row_segment], caps, shares)
+
+
+def _water_fill_segments_python(budgets: List[float], counts: Sequence[int],
+                                floors: List[float], caps: List[float]) -> List[float]:
+    shares = []
+    start = 0
+    for budget, count in zip(budgets, counts):
+        end = start + count
+        if count == 1:
+            shares.append(min(caps[start], max(budget, floors[start])))
+        else:
+            shares.extend(_water_fill_python(
+                budget, floors[start:end], caps[start:end], [1.0] * count
+            ))
+        start = end
+    return shares
@@ -3,9 +3,18 @@ Bandwidth management algorithms and calculations.
 """
 
 import logging
-from typing import Dict, Any, TYPE_CHECKING
+import math
+from typing import Dict, Any, List, Optional, Set, Union, TYPE_CHECKING
 from abc import ABC, abstractmethod
 
+from .allocation import (
+    Columns, clip, demand_split, equal_split, to_list, water_fill, water_fill_segments,
+    weighted_split
+)
+from .groups import GroupConfig, GroupIndex
+from .households import SiteCeilings, site_key
+from .stream_session import StreamSession
+
 if TYPE_CHECKING:
     from .config import BandwidthConfig
 
@@ -17,15 +26,16 @@ class BandwidthAlgorithm(ABC):
     def calculate_limits(self, external_streamers: Dict[str, Dict[str, Any]], 
                         available_bandwidth: float, config: 'BandwidthConfig') -> Dict[str, float]:
         """
-        Calculate bandwidth limits for external users.
+        Calculate bandwidth limits for external streams.
         
         Args:
-            external_streamers: Dictionary of external streaming users
+            external_streamers: External sessions (the allocation units),
+                keyed by session id
             available_bandwidth: Available bandwidth in Mbps
             config: Bandwidth configuration
             
         Returns:
-            Dictionary mapping user_id to bandwidth limit in Mbps
+            Dictionary mapping session key to bandwidth limit in Mbps
         """
         pass
 
@@ -39,14 +49,28 @@ class EqualSplitAlgorithm(BandwidthAlgorithm):
         if not external_streamers or available_bandwidth <= 0:
             return {}
         
-        num_users = len(external_streamers)
-        per_user_bandwidth = available_bandwidth / num_users
-        
-        # Apply min/max constraints
-        per_user_bandwidth = max(config.min_per_user, per_user_bandwidth)
-        per_user_bandwidth = min(config.max_per_user, per_user_bandwidth)
-        
-        return {user_id: per_user_bandwidth for user_id in external_streamers.keys()}
+        columns = Columns(external_streamers, floor=config.min_per_user, cap=config.max_per_user)
+        return columns.limits(equal_split(
+            len(columns), available_bandwidth, columns.floor, columns.cap
+        ))
+
+
+# Allocation ratios (admin:premium:regular = 3:2:1)
+ADMIN_RATIO = 3.0
+PREMIUM_RATIO = 2.0
+REGULAR_RATIO = 1.0
+
+
+def user_priority(user_data: Dict[str, Any]) -> float:
+    """Priority ratio of a streamer from its user policy."""
+    user_info = user_data.get('user_data') or {}
+    policy = user_info.get('Policy', {})
+    
+    if policy.get('IsAdministrator', False):
+        return ADMIN_RATIO
+    elif policy.get('IsDisabled', False) is False and policy.get('EnableAllFolders', False):
+        return PREMIUM_RATIO
+    return REGULAR_RATIO
 
 
 class PriorityBasedAlgorithm(BandwidthAlgorithm):
@@ -65,56 +89,15 @@ class PriorityBasedAlgorithm(BandwidthAlgorithm):
         if not external_streamers or available_bandwidth <= 0:
             return {}
         
-        # Categorize users by priority
-        admin_users = []
-        premium_users = []
-        regular_users = []
-        
-        for user_id, user_data in external_streamers.items():
-            user_info = user_data.get('user_data', {})
-            policy = user_info.get('Policy', {})
-            
-            if policy.get('IsAdministrator', False):
-                admin_users.append(user_id)
-            elif policy.get('IsDisabled', False) is False and policy.get('EnableAllFolders', False):
-                premium_users.append(user_id)
-            else:
-                regular_users.append(user_id)
-        
-        # Allocation ratios (admin:premium:regular = 3:2:1)
-        admin_ratio = 3.0
-        premium_ratio = 2.0
-        regular_ratio = 1.0
-        
-        total_weight = (len(admin_users) * admin_ratio + 
-                       len(premium_users) * premium_ratio + 
-                       len(regular_users) * regular_ratio)
-        
-        if total_weight == 0:
-            return {}
-        
-        # Calculate bandwidth per weight unit
-        bandwidth_per_unit = available_bandwidth / total_weight
-        
-        user_limits = {}
-        
-        # Assign bandwidth based on priority
-        for user_id in admin_users:
-            limit = bandwidth_per_unit * admin_ratio
-            limit = max(config.min_per_user, min(config.max_per_user, limit))
-            user_limits[user_id] = limit
-        
-        for user_id in premium_users:
-            limit = bandwidth_per_unit * premium_ratio
-            limit = max(config.min_per_user, min(config.max_per_user, limit))
-            user_limits[user_id] = limit
-        
-        for user_id in regular_users:
-            limit = bandwidth_per_unit * regular_ratio
-            limit = max(config.min_per_user, min(config.max_per_user, limit))
-            user_limits[user_id] = limit
-        
-        return user_limits
+        # Weight each user by priority (admin:premium:regular = 3:2:1)
+        columns = Columns(
+            external_streamers,
+            weight=(user_priority(user_data) for user_data in external_streamers.values()),
+            floor=config.min_per_user, cap=config.max_per_user
+        )
+        return columns.limits(weighted_split(
+            columns.weight, available_bandwidth, columns.floor, columns.cap
+        ))
 
 
 class DemandBasedAlgorithm(BandwidthAlgorithm):
@@ -133,71 +116,57 @@ class DemandBasedAlgorithm(BandwidthAlgorithm):
         if not external_streamers or available_bandwidth <= 0:
             return {}
         
-        # Calculate required bandwidth for each user
-        user_demands = {}
-        total_demand = 0
-        
-        for user_id, user_data in external_streamers.items():
-            session_data = user_data.get('session_data', {})
-            demand = self._estimate_required_bandwidth(session_data)
-            user_demands[user_id] = demand
-            total_demand += demand
-        
-        # If total demand is within available bandwidth, allocate as demanded
-        if total_demand <= available_bandwidth:
-            user_limits = {}
-            for user_id, demand in user_demands.items():
-                limit = max(config.min_per_user, min(config.max_per_user, demand))
-                user_limits[user_id] = limit
-            return user_limits
-        
-        # If demand exceeds available bandwidth, scale proportionally
-        scale_factor = available_bandwidth / total_demand
-        user_limits = {}
-        
-        for user_id, demand in user_demands.items():
-            scaled_limit = demand * scale_factor
-            limit = max(config.min_per_user, min(config.max_per_user, scaled_limit))
-            user_limits[user_id] = limit
-        
-        return user_limits
+        # Estimate the required bandwidth of each user, then scale all
+        # demands down proportionally if they exceed the budget
+        columns = Columns(
+            external_streamers, demand=self._demands(external_streamers),
+            floor=config.min_per_user, cap=config.max_per_user
+        )
+        return columns.limits(demand_split(
+            columns.demand, available_bandwidth, columns.floor, columns.cap
+        ))
+    
+    def _demands(self, external_streamers: Dict[str, Dict[str, Any]]):
+        """Estimated demand of each streamer, in Mbps."""
+        return (
+            self._estimate_required_bandwidth(
+                user_data.get('session_data', {}), user_data.get('measured_mbps')
+            )
+            for user_data in external_streamers.values()
+        )
     
-    def _estimate_required_bandwidth(self, session_data: Dict[str, Any]) -> float:
+    def _estimate_required_bandwidth(self, session_data: Union[StreamSession, Dict[str, Any]],
+                                     measured_mbps: Optional[float] = None) -> float:
         """
         Estimate required bandwidth for a session.
         
         Args:
-            session_data: Jellyfin session data
+            session_data: Session record or raw Jellyfin session data
+            measured_mbps: Upload rate measured on the router, if available
             
         Returns:
             Estimated bandwidth requirement in Mbps
         """
-        # Check if transcoding is active
-        transcoding_info = session_data.get('TranscodingInfo', {})
-        if transcoding_info:
-            # Use transcoding bitrate if available
-            bitrate = transcoding_info.get('Bitrate', 0)
-            if bitrate > 0:
-                return bitrate / 1_000_000  # Convert to Mbps
+        if not session_data:
+            # Nothing to parse: the common case for router-only streamers
+            return measured_mbps or 5.0
+        session = StreamSession.coerce(session_data)
+
+        # Use transcoding bitrate if available
+        if session.transcode_bitrate:
+            return session.transcode_bitrate / 1_000_000  # Convert to Mbps
+
+        # Prefer real throughput measured by the router over metadata
+        if measured_mbps:
+            return measured_mbps
         
         # Check media item bitrate
-        now_playing = session_data.get('NowPlayingItem', {})
-        media_bitrate = now_playing.get('Bitrate', 0)
-        if media_bitrate > 0:
-            return media_bitrate / 1_000_000  # Convert to Mbps
+        if session.source_bitrate:
+            return session.source_bitrate / 1_000_000  # Convert to Mbps
         
         # Estimate based on resolution/quality
-        video_stream = None
-        media_streams = now_playing.get('MediaStreams', [])
-        for stream in media_streams:
-            if stream.get('Type') == 'Video':
-                video_stream = stream
-                break
-        
-        if video_stream:
-            width = video_stream.get('Width', 0)
-            height = video_stream.get('Height', 0)
-            
+        height = session.video_height
+        if height is not None:
             # Rough estimates based on resolution
             if height >= 2160:  # 4K
                 return 25.0
@@ -212,6 +181,281 @@ class DemandBasedAlgorithm(BandwidthAlgorithm):
         return 5.0  # 5 Mbps default
 
 
+class WaterFillingAlgorithm(DemandBasedAlgorithm):
+    """
+    Water-filling algorithm - max-min fair shares that never exceed the budget.
+    
+    Shares are filled up to each user's estimated demand first, then the
+    remaining budget is spread further up to ``max_per_user``, so
+    bandwidth left by capped or low-demand users goes to everyone else.
+    When the budget cannot give every user ``min_per_user``, admission is
+    deterministic: users admitted in the previous round first, then by
+    priority (admin, premium, regular), then by user id. Users that are not
+    admitted share what is left below the floor.
+    """
+    
+    def __init__(self):
+        self.admitted: Set[str] = set()
+    
+    def calculate_limits(self, external_streamers: Dict[str, Dict[str, Any]], 
+                        available_bandwidth: float, config: 'BandwidthConfig') -> Dict[str, float]:
+        """Allocate max-min fair shares within ``available_bandwidth``."""
+        if not external_streamers or available_bandwidth <= 0:
+            return {}
+        
+        floor, cap = config.min_per_user, config.max_per_user
+        users = sorted(
+            external_streamers,
+            key=lambda user_id: (
+                user_id not in self.admitted,
+                -user_priority(external_streamers[user_id]),
+                user_id
+            )
+        )
+        
+        # Admit as many users at the floor as fit, keeping a positive
+        # remainder for the others (a limit of 0 would mean unlimited)
+        admitted = users
+        if len(users) * floor > available_bandwidth:
+            admitted = users[:max(math.ceil(available_bandwidth / floor) - 1, 0)]
+        rejected = users[len(admitted):]
+        self.admitted = set(admitted)
+        
+        user_limits = {}
+        budget = available_bandwidth
+        if rejected:
+            budget = len(admitted) * floor
+            share = (available_bandwidth - budget) / len(rejected)
+            user_limits.update({user_id: share for user_id in rejected})
+        
+        columns = Columns(
+            admitted,
+            demand=self._demands({user_id: external_streamers[user_id] for user_id in admitted}),
+            floor=floor, cap=cap
+        )
+        shares = water_fill(budget, columns.floor, columns.clamp(columns.demand))
+        # Spread what demand left over, up to max_per_user
+        shares = water_fill(budget, shares, columns.cap)
+        user_limits.update(columns.limits(shares))
+        return user_limits
+
+
+class HierarchicalAlgorithm(DemandBasedAlgorithm):
+    """
+    Hierarchical algorithm - configured groups, then users, then sessions.
+    
+    Streamers are assigned to the groups of ``config.groups`` through the
+    index built at config load. The budget is water-filled across the
+    active groups by weight, honouring each group's guaranteed
+    ``min_mbps`` and ``max_mbps`` ceiling. Each group's share is then
+    water-filled across its users, and each user's share across their
+    sessions, between ``min_per_user`` and ``max_per_user`` per session, so
+    an account with three streams gets one user share, not three. At every
+    level shares are filled up to the estimated demand first and the rest
+    is spread up to the ceilings.
+    """
+    
+    def calculate_limits(self, external_streamers: Dict[str, Dict[str, Any]], 
+                        available_bandwidth: float, config: 'BandwidthConfig') -> Dict[str, float]:
+        """Allocate group shares, then user and session shares within each group."""
+        if not external_streamers or available_bandwidth <= 0:
+            return {}
+        
+        if config.group_index is None:  # config built without Config (tests, tools)
+            config.group_index = GroupIndex.from_config(config.groups)
+        index = config.group_index
+        
+        members: Dict[str, List[str]] = {}
+        groups: Dict[str, GroupConfig] = {}
+        for user_id, user_data in external_streamers.items():
+            group = index.group_of(
+                user_data.get('user_id', user_id), user_data.get('user_data'), user_data.get('ip')
+            )
+            members.setdefault(group.name, []).append(user_id)
+            groups[group.name] = group
+        
+        return self._fill_groups(
+            members, self._clipped_demands(external_streamers, config), available_bandwidth, config,
+            weights={name: group.weight for name, group in groups.items()},
+            floors={name: group.min_mbps for name, group in groups.items()},
+            ceilings={name: group.max_mbps for name, group in groups.items()},
+            owners=self._owners(external_streamers)
+        )
+    
+    @staticmethod
+    def _owners(external_streamers: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """User id of each streamer key."""
+        return {key: data.get('user_id', key) for key, data in external_streamers.items()}
+    
+    def _clipped_demands(self, external_streamers: Dict[str, Dict[str, Any]],
+                         config: 'BandwidthConfig') -> Dict[str, float]:
+        """Estimated demand of each streamer, clamped to the per-user bounds."""
+        columns = Columns(
+            external_streamers, demand=self._demands(external_streamers),
+            floor=config.min_per_user, cap=config.max_per_user
+        )
+        return columns.limits(columns.clamp(columns.demand))
+    
+    def _fill_groups(self, members: Dict[str, List[str]], demands: Dict[str, float],
+                     available_bandwidth: float, config: 'BandwidthConfig',
+                     weights: Dict[str, float], floors: Dict[str, float],
+                     ceilings: Dict[str, Optional[float]],
+                     owners: Optional[Dict[str, str]] = None) -> Dict[str, float]:
+        """
+        Water-fill the budget across groups, then users, then sessions.
+        
+        Args:
+            members: Streamer keys of each group
+            demands: Clipped demand of each streamer, in Mbps
+            available_bandwidth: Budget in Mbps
+            config: Bandwidth configuration
+            weights: Weight of each group
+            floors: Guaranteed share of each group, in Mbps
+            ceilings: Ceiling of each group in Mbps (None for no ceiling)
+            owners: User id of each streamer key (default: every key is
+                its own user)
+            
+        Returns:
+            Dictionary mapping streamer key to bandwidth limit in Mbps
+        """
+        floor, cap = config.min_per_user, config.max_per_user
+        
+        # Group level: guaranteed floors (scaled down if they do not fit),
+        # ceilings, and the demand of the group's sessions
+        names = list(members)
+        group_weights = [weights[name] for name in names]
+        group_ceilings = [
+            min(ceilings[name] or math.inf, len(members[name]) * cap) for name in names
+        ]
+        group_floors = [
+            min(floors[name], ceiling) for name, ceiling in zip(names, group_ceilings)
+        ]
+        if sum(group_floors) > available_bandwidth:
+            group_floors = [f * available_bandwidth / sum(group_floors) for f in group_floors]
+        wanted = [
+            max(group_floor, min(ceiling, sum(demands[key] for key in members[name])))
+            for name, group_floor, ceiling in zip(names, group_floors, group_ceilings)
+        ]
+        shares = water_fill(available_bandwidth, group_floors, wanted, weights=group_weights)
+        shares = water_fill(available_bandwidth, shares, group_ceilings, weights=group_weights)
+        
+        # User level within each group, session level within each user; the
+        # fills of every group (and of every user) are solved together
+        owners = owners or {}
+        users: List[List[str]] = []
+        users_per_group = []
+        for name in names:
+            sessions: Dict[str, List[str]] = {}
+            for key in members[name]:
+                sessions.setdefault(owners.get(key, key), []).append(key)
+            users.extend(sessions.values())
+            users_per_group.append(len(sessions))
+        
+        user_floors = [
+            user_floor
+            for share, count in zip(to_list(shares), users_per_group)
+            for user_floor in [min(floor, share / count)] * count
+        ]
+        user_ceilings = [len(keys) * cap for keys in users]
+        user_demands = [
+            max(user_floor, min(ceiling, sum(demands[key] for key in keys)))
+            for keys, user_floor, ceiling in zip(users, user_floors, user_ceilings)
+        ]
+        user_shares = water_fill_segments(shares, users_per_group, user_floors, user_demands)
+        user_shares = water_fill_segments(shares, users_per_group, user_shares, user_ceilings)
+        
+        # Fill each user's share up to the demand of their sessions, then up
+        # to max_per_user
+        sessions_per_user = [len(keys) for keys in users]
+        keys = [key for user_keys in users for key in user_keys]
+        columns = Columns(
+            keys, demand=(demands[key] for key in keys),
+            floor=[
+                session_floor
+                for share, count in zip(to_list(user_shares), sessions_per_user)
+                for session_floor in [min(floor, share / count)] * count
+            ],
+            cap=cap
+        )
+        wanted = clip(columns.demand, columns.floor, math.inf)
+        session_shares = water_fill_segments(user_shares, sessions_per_user, columns.floor, wanted)
+        session_shares = water_fill_segments(
+            user_shares, sessions_per_user, session_shares, columns.cap
+        )
+        return columns.limits(session_shares)
+
+
+class HouseholdAlgorithm(HierarchicalAlgorithm):
+    """
+    Household algorithm - sessions grouped by remote site, then water-filled.
+    
+    Sessions from the same client IP (or IPv6 /64) share a household
+    downlink, so each site is one group: sites get equal weight, each is
+    capped at its downlink ceiling (configured, or learned from the
+    measured per-client rates) and whatever a capped site cannot take goes
+    to the other sites instead of being pushed at a saturated link.
+    """
+    
+    def __init__(self):
+        self.ceilings: Optional[SiteCeilings] = None
+        # Site limits of the previous allocation, compared with the
+        # measured rates to learn ceilings
+        self.site_limits: Dict[str, float] = {}
+    
+    def calculate_limits(self, external_streamers: Dict[str, Dict[str, Any]], 
+                        available_bandwidth: float, config: 'BandwidthConfig') -> Dict[str, float]:
+        """Allocate site shares, then session shares within each site."""
+        if not external_streamers or available_bandwidth <= 0:
+            return {}
+        
+        if self.ceilings is None:
+            self.ceilings = SiteCeilings(
+                config.site_ceilings, config.site_ceiling_mbps, config.learn_site_ceilings
+            )
+        demands = self._clipped_demands(external_streamers, config)
+        
+        members: Dict[str, List[str]] = {}
+        for user_id, user_data in external_streamers.items():
+            site = site_key(user_data.get('ip') or user_id, config.ipv6_site_prefix)
+            members.setdefault(site, []).append(user_id)
+        
+        for site, keys in members.items():
+            measured = [external_streamers[key].get('measured_mbps') for key in keys]
+            if site not in self.site_limits or None in measured:
+                continue
+            sessions = [
+                StreamSession.coerce(external_streamers[key].get('session_data'))
+                for key in keys
+            ]
+            if any(session.is_paused or not session.playing for session in sessions):
+                # A paused stream receives nothing, which is not a slow link
+                self.ceilings.skip(site)
+                continue
+            # Judge the link against the streams' bitrate; the default demand
+            # estimate prefers the measured rate, which would hide the limit
+            bitrate = sum(
+                min(self._estimate_required_bandwidth(session), config.max_per_user)
+                for session in sessions
+            )
+            self.ceilings.observe(
+                site, self.site_limits[site], sum(measured), bitrate,
+                minimum=config.min_per_user * len(keys)
+            )
+        self.ceilings.touch(members)
+        
+        limits = self._fill_groups(
+            members, demands, available_bandwidth, config,
+            weights=dict.fromkeys(members, 1.0),
+            floors=dict.fromkeys(members, 0.0),
+            ceilings={site: self.ceilings.ceiling(site) for site in members},
+            owners=self._owners(external_streamers)
+        )
+        self.site_limits = {
+            site: sum(limits[key] for key in keys) for site, keys in members.items()
+        }
+        return limits
+
+
 class BandwidthManager:
     """Manager for bandwidth calculation and allocation."""
     
@@ -228,7 +472,10 @@ class BandwidthManager:
         algorithms = {
             'equal_split': EqualSplitAlgorithm,
             'priority_based': PriorityBasedAlgorithm,
-            'demand_based': DemandBasedAlgorithm
+            'demand_based': DemandBasedAlgorithm,
+            'water_filling': WaterFillingAlgorithm,
+            'hierarchical': HierarchicalAlgorithm,
+            'household': HouseholdAlgorithm
         }
         
         algorithm_class = algorithms.get(algorithm_name)
@@ -242,16 +489,16 @@ class BandwidthManager:
     def calculate_limits(self, external_streamers: Dict[str, Dict[str, Any]], 
                         available_bandwidth: float) -> Dict[str, float]:
         """
-        Calculate bandwidth limits for external users.
+        Calculate bandwidth limits for external streams.
         
         Args:
-            external_streamers: Dictionary of external streaming users
+            external_streamers: External sessions keyed by session id
             available_bandwidth: Available bandwidth in Mbps
             
         Returns:
-            Dictionary mapping user_id to bandwidth limit in Mbps
+            Dictionary mapping session key to bandwidth limit in Mbps
         """
-        self.logger.debug(f"Calculating limits for {len(external_streamers)} users "
+        self.logger.debug(f"Calculating limits for {len(external_streamers)} streams "
                          f"with {available_bandwidth:.2f} Mbps available")
         
         # Ensure minimum available bandwidth
@@ -273,6 +520,18 @@ class BandwidthManager:
             self.logger.debug(f"Calculated limit for {username}: {limit:.2f} Mbps")
         
         return user_limits
+
+    def demands(self, external_streamers: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+        """
+        Estimate the bandwidth each stream would use without a limit.
+
+        Args:
+            external_streamers: External sessions keyed by session id
+
+        Returns:
+            Dictionary mapping session key to estimated demand in Mbps
+        """
+        return dict(zip(external_streamers, DemandBasedAlgorithm()._demands(external_streamers)))
     
     def change_algorithm(self, algorithm_name: str):
         """Change the bandwidth calculation algorithm."""
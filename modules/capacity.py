@@ -0,0 +1,219 @@
+"""
+Uplink capacity estimation with a persistent, TTL-bound cache.
+"""
+
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+DEFAULT_CAPACITY_MBPS = 100.0
+
+# Streams receiving below this fraction of what they were allowed (while
+# wanting more) mean the uplink itself is full
+SATURATION = 0.8
+
+# Confidence assigned to each source of an estimate
+_SQM_CONFIDENCE = 0.9
+_PEAK_MAX_CONFIDENCE = 0.7
+_PHY_CONFIDENCE = 0.2
+_DEFAULT_CONFIDENCE = 0.1
+
+
+@dataclass
+class CapacityEstimate:
+    """A capacity value together with where it came from."""
+    mbps: float
+    source: str  # sqm, peak, phy or default
+    confidence: float
+    updated: float  # wall-clock time of the estimate
+
+
+class CapacityEstimator:
+    """
+    Learn the achievable uplink capacity.
+
+    The SQM shaper rate is the best signal, since it is the ceiling the
+    router actually enforces. Without SQM, rates observed while the link was
+    saturated (streams wanted more than they were allowed and still could
+    not get their allowance) measure the capacity itself; their peak
+    replaces the PHY/default guess once enough of them back it
+    (``min_confidence``). Other rates are capped by the limits this daemon
+    hands out, so their peak is only a lower bound: trusting it would let
+    low limits lower the estimate, which lowers the limits further. Both
+    peaks decay with ``peak_half_life`` so one bad sample does not stick
+    forever. The port's PHY speed (often 1000 Mbps on a much slower line)
+    caps a saturated peak, and is used on its own when nothing else is
+    known.
+
+    Router hints are fetched at most once per ``ttl`` seconds, and the
+    estimate and observed peak are saved to ``state_file`` so a restart
+    does not start from scratch.
+    """
+
+    def __init__(self, fetch_hints: Callable[[], Dict[str, Optional[float]]],
+                 ttl: float = 3600, state_file: Optional[str] = None,
+                 peak_samples_for_confidence: int = 100, min_confidence: float = 0.5,
+                 peak_half_life: float = 7 * 24 * 3600):
+        """
+        Initialize the estimator and load any saved state.
+
+        Args:
+            fetch_hints: Returns router hints ``{'sqm': Mbps, 'phy': Mbps}``
+                (either may be None)
+            ttl: Seconds an estimate is reused before hints are fetched again
+            state_file: JSON file the estimate is persisted to (None disables)
+            peak_samples_for_confidence: Saturated observations after
+                which their peak reaches its maximum confidence
+            min_confidence: Confidence a saturated peak needs before it
+                replaces the PHY/default estimate
+            peak_half_life: Seconds after which an unrefreshed peak counts
+                half as much
+        """
+        self.fetch_hints = fetch_hints
+        self.ttl = ttl
+        self.state_file = Path(state_file) if state_file else None
+        self.peak_samples_for_confidence = peak_samples_for_confidence
+        self.min_confidence = min_confidence
+        self.peak_half_life = peak_half_life
+        self.logger = logging.getLogger('jellydemon.capacity')
+
+        self.estimate: Optional[CapacityEstimate] = None
+        # Peak of the rates seen while saturated, and their number
+        self.peak_mbps = 0.0
+        self.peak_time = 0.0  # wall-clock time of the peak
+        self.samples = 0
+        # Peak of all rates: a lower bound only
+        self.floor_mbps = 0.0
+        self.floor_time = 0.0
+        self.hints: Dict[str, Optional[float]] = {}
+        self._load()
+
+    def observe(self, total_mbps: float, now: Optional[float] = None, saturated: bool = False):
+        """
+        Record a measured total upload rate.
+
+        Args:
+            total_mbps: Total upload rate in Mbps
+            now: Wall-clock time of the sample (defaults to now)
+            saturated: Whether the link was full while it was measured
+        """
+        if total_mbps is None or total_mbps <= 0:
+            return
+        now = time.time() if now is None else now
+        raised = False
+        if total_mbps > self.current_floor(now):
+            self.floor_mbps, self.floor_time = total_mbps, now
+            raised = True
+        if saturated:
+            self.samples += 1
+            if total_mbps > self.current_peak(now):
+                self.peak_mbps, self.peak_time = total_mbps, now
+                raised = True
+        # A higher rate lifts the estimate when it beats it by more than 1%
+        if (raised and self.estimate and self.estimate.source != 'sqm' and
+                total_mbps > self.estimate.mbps * 1.01):
+            self._recompute()
+
+    def _decayed(self, mbps: float, since: float, now: Optional[float]) -> float:
+        if mbps <= 0:
+            return 0.0
+        age = max((time.time() if now is None else now) - since, 0.0)
+        return mbps * 0.5 ** (age / self.peak_half_life)
+
+    def current_peak(self, now: Optional[float] = None) -> float:
+        """Peak of the saturated rates in Mbps, decayed by its age."""
+        return self._decayed(self.peak_mbps, self.peak_time, now)
+
+    def current_floor(self, now: Optional[float] = None) -> float:
+        """Peak of all observed rates in Mbps (a lower bound), decayed by its age."""
+        return self._decayed(self.floor_mbps, self.floor_time, now)
+
+    def peak_confidence(self) -> float:
+        """Confidence in the saturated peak, from the number of saturated samples."""
+        return _PEAK_MAX_CONFIDENCE * min(self.samples / self.peak_samples_for_confidence, 1.0)
+
+    def capacity(self) -> float:
+        """Current capacity estimate in Mbps, refreshing it if it expired."""
+        if self.estimate is None or time.time() - self.estimate.updated >= self.ttl:
+            self.refresh()
+        elif (self.estimate.confidence < self.min_confidence and
+                self.peak_confidence() >= self.min_confidence):
+            # The observed peak became trustworthy: prefer it to the guess
+            self._recompute()
+        return self.estimate.mbps
+
+    def refresh(self) -> CapacityEstimate:
+        """Fetch router hints and recompute the estimate."""
+        try:
+            self.hints = self.fetch_hints() or {}
+        except Exception as e:
+            self.logger.warning(f"Failed to fetch capacity hints: {e}")
+        return self._recompute()
+
+    def _recompute(self) -> CapacityEstimate:
+        sqm = self.hints.get('sqm')
+        phy = self.hints.get('phy')
+        floor = self.current_floor()
+
+        if sqm:
+            estimate = CapacityEstimate(sqm, 'sqm', _SQM_CONFIDENCE, time.time())
+        elif self.peak_mbps > 0 and self.peak_confidence() >= self.min_confidence:
+            peak = max(self.current_peak(), floor)
+            mbps = min(peak, phy) if phy else peak
+            estimate = CapacityEstimate(mbps, 'peak', self.peak_confidence(), time.time())
+        elif phy:
+            estimate = CapacityEstimate(max(phy, floor), 'phy', _PHY_CONFIDENCE, time.time())
+        else:
+            estimate = CapacityEstimate(max(DEFAULT_CAPACITY_MBPS, floor), 'default',
+                                        _DEFAULT_CONFIDENCE, time.time())
+
+        if self.estimate is None or (estimate.mbps, estimate.source) != (
+                self.estimate.mbps, self.estimate.source):
+            self.logger.info(
+                f"Uplink capacity estimate: {estimate.mbps:.2f} Mbps "
+                f"(source {estimate.source}, confidence {estimate.confidence:.2f})"
+            )
+        self.estimate = estimate
+        self._save()
+        return estimate
+
+    def _load(self):
+        if self.state_file is None or not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            self.peak_mbps = float(state.get('peak_mbps', 0.0))
+            self.peak_time = float(state.get('peak_time') or time.time())
+            self.samples = int(state.get('samples', 0))
+            self.floor_mbps = float(state.get('floor_mbps', 0.0))
+            self.floor_time = float(state.get('floor_time') or time.time())
+            self.hints = state.get('hints', {})
+            if state.get('estimate'):
+                self.estimate = CapacityEstimate(**state['estimate'])
+            self.logger.debug(f"Loaded capacity state from {self.state_file}")
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable capacity state {self.state_file}: {e}")
+
+    def _save(self):
+        if self.state_file is None:
+            return
+        state = {
+            'estimate': asdict(self.estimate) if self.estimate else None,
+            'peak_mbps': self.peak_mbps,
+            'peak_time': self.peak_time,
+            'samples': self.samples,
+            'floor_mbps': self.floor_mbps,
+            'floor_time': self.floor_time,
+            'hints': self.hints,
+        }
+        try:
+            tmp = self.state_file.with_suffix(self.state_file.suffix + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            tmp.replace(self.state_file)
+        except Exception as e:
+            self.logger.warning(f"Failed to save capacity state: {e}")
@@ -5,8 +5,11 @@ Configuration management for JellyDemon.
 import yaml
 from pathlib import Path
 from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
+
+from .groups import GroupIndex
+from .households import SiteCeilings
 
 
 @dataclass
@@ -19,6 +22,23 @@ class RouterConfig:
     luci_port: int = 80
     use_ssh: bool = False
     jellyfin_ip: Optional[str] = None
+    measurement_mode: str = "sample"  # "sample" (1 s snapshot) or "delta" (since last cycle)
+    telemetry: bool = False  # stream counters over one long-lived channel
+    telemetry_interval_ms: int = 500
+    telemetry_window: float = 5.0  # seconds of telemetry averaged per reading
+    telemetry_command: Optional[str] = None  # local stand-in for the router loop
+    client_accounting: str = "off"  # "off", "conntrack" or "iptables"
+    ubus_path: str = "/ubus"
+    wan_cache_ttl: int = 300  # seconds the WAN device name is cached
+    ssh_keepalive: int = 15  # seconds between SSH keepalive packets
+    ssh_max_backoff: float = 60.0  # upper bound for SSH reconnect delay
+    ssh_command_timeout: float = 30.0  # seconds a router command may run
+    sqm_min_interval: float = 2.0  # seconds between two live SQM rate changes
+    sqm_persist_delay: float = 300.0  # seconds before a rate change is saved to UCI
+    shaping_device: str = "br-lan"  # LAN device facing the Jellyfin server
+    shaping_ifb: str = "ifb-jd"  # IFB device holding per-client classes
+    connect_timeout: float = 3.05  # seconds to connect to LuCI/ubus
+    read_timeout: float = 10.0  # seconds to wait for a LuCI/ubus response
 
 
 @dataclass
@@ -28,6 +48,25 @@ class JellyfinConfig:
     port: int
     api_key: str
     use_https: bool = False
+    limit_tolerance: float = 0.05  # relative change below which a limit is not rewritten
+    limit_verify_interval: int = 300  # seconds before a cached limit is checked against the server
+    user_cache_ttl: int = 300  # seconds the /Users snapshot is reused
+    websocket: bool = False  # track sessions over the server WebSocket
+    websocket_interval_ms: int = 1500
+    activity_poll_interval: int = 0  # seconds between ActivityLog polls (0 = off)
+    restart_concurrency: int = 0  # parallel background restarts (0 = restart inline)
+    restart_delay: float = 0.8  # seconds between Stop and PlayNow
+    restart_deadline: float = 10.0  # seconds a background restart may take
+    restart_batch_size: int = 0  # restarts per cycle, largest savings first (0 = all)
+    max_transcodes: int = 0  # skip restarts that would exceed this many transcodes (0 = off)
+    limit_delivery: str = "restart"  # "restart" or "command" (SetMaxStreamingBitrate, restart fallback)
+    command_support_ttl: int = 3600  # seconds a client's advertised command support is remembered
+    skip_unneeded_restarts: bool = True  # leave streams alone that already fit the new limit
+    quality_ladder_mbps: List[float] = None  # client quality rungs (default: Jellyfin's)
+    connect_timeout: float = 3.05  # seconds to connect to the API
+    read_timeout: float = 10.0  # seconds to wait for an API response
+    http_retries: int = 2  # retries for failed GET requests (POSTs are never retried)
+    http_pool_size: int = 10  # keep-alive connections to the server
     
     @property
     def base_url(self) -> str:
@@ -54,6 +93,16 @@ class BandwidthConfig:
     total_upload_mbps: float = 0
     spike_duration: int = 3  # minutes to average usage over
     low_usage_threshold: float = 0.0  # non-Jellyfin usage threshold for equal-split
+    enforcement: str = "jellyfin"  # jellyfin, router or hybrid
+    capacity_ttl: int = 3600  # seconds an estimated uplink capacity is reused
+    capacity_state_file: Optional[str] = "jellydemon_capacity.json"
+    groups: List[Dict[str, Any]] = None  # weighted groups for the hierarchical algorithm
+    group_index: Optional[GroupIndex] = field(default=None, init=False, repr=False)
+    # Household algorithm: downlink ceilings of remote sites in Mbps
+    site_ceiling_mbps: float = 0.0  # default per site, 0 = none
+    site_ceilings: Dict[str, float] = None  # per client IP or network
+    learn_site_ceilings: bool = True  # learn from measured per-client rates
+    ipv6_site_prefix: int = 64  # IPv6 clients in one such network share a site
 
 
 @dataclass
@@ -67,6 +116,9 @@ class DaemonConfig:
     dry_run: bool = False
     backup_user_settings: bool = True
     pid_file: str = "/tmp/jellydemon.pid"
+    concurrent_collection: bool = False  # poll router and Jellyfin in parallel
+    collector_workers: int = 4
+    reallocation_debounce: float = 2.0  # quiet seconds that end a burst of session events
 
 
 class Config:
@@ -104,12 +156,20 @@ class Config:
         # Validate router config
         if not self.router.host:
             raise ValueError("Router host is required")
+        if self.router.measurement_mode not in ("sample", "delta"):
+            raise ValueError("measurement_mode must be 'sample' or 'delta'")
+        if self.router.client_accounting not in ("off", "conntrack", "iptables"):
+            raise ValueError("client_accounting must be 'off', 'conntrack' or 'iptables'")
+        if self.router.telemetry_interval_ms < 100:
+            raise ValueError("telemetry_interval_ms must be at least 100")
         
         # Validate Jellyfin config
         if not self.jellyfin.host:
             raise ValueError("Jellyfin host is required")
         if not self.jellyfin.api_key:
             raise ValueError("Jellyfin API key is required")
+        if self.jellyfin.limit_delivery not in ("restart", "command"):
+            raise ValueError("limit_delivery must be 'restart' or 'command'")
         
         # Validate network config
         if not self.network.internal_ranges:
@@ -122,6 +182,28 @@ class Config:
             raise ValueError("spike_duration must be greater than zero")
         if self.bandwidth.low_usage_threshold < 0:
             raise ValueError("low_usage_threshold must be non-negative")
+        if self.bandwidth.enforcement not in ("jellyfin", "router", "hybrid"):
+            raise ValueError("enforcement must be 'jellyfin', 'router' or 'hybrid'")
+        if self.bandwidth.enforcement != "jellyfin" and not self.router.jellyfin_ip:
+            raise ValueError("router and hybrid enforcement require router.jellyfin_ip")
+        try:
+            self.bandwidth.group_index = GroupIndex.from_config(self.bandwidth.groups)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid bandwidth groups: {e}")
+        if not 1 <= self.bandwidth.ipv6_site_prefix <= 128:
+            raise ValueError("ipv6_site_prefix must be between 1 and 128")
+        if self.bandwidth.site_ceiling_mbps < 0:
+            raise ValueError("site_ceiling_mbps must be non-negative")
+        if any(mbps <= 0 for mbps in (self.bandwidth.site_ceilings or {}).values()):
+            raise ValueError("site_ceilings must be positive")
+        try:
+            SiteCeilings(self.bandwidth.site_ceilings)
+        except ValueError as e:
+            raise ValueError(f"Invalid site_ceilings: {e}")
+
+        # Validate daemon config
+        if self.daemon.collector_workers < 2:
+            raise ValueError("collector_workers must be at least 2")
     
     def reload(self):
         """Reload configuration from file."""
@@ -0,0 +1,89 @@
+"""
+Rate calculation from raw byte counters read across cycles.
+"""
+
+import logging
+from typing import Dict, Optional, Tuple
+
+
+class CounterTracker:
+    """
+    Turn raw, monotonically increasing byte counters into rates.
+
+    Each reading is compared against the previous reading for the same key,
+    so no sleep is needed between two snapshots and the rate covers the whole
+    time since the last cycle. Counter wraparound (32 or 64 bit) is detected
+    when the wrapped delta is plausible for the link; anything else that goes
+    backwards (router reboot, interface reset, flushed iptables counters) is
+    treated as a reset and re-baselined.
+    """
+
+    WIDTHS = (32, 64)
+
+    def __init__(self, max_rate_mbps: float = 10_000.0):
+        """
+        Initialize the tracker.
+
+        Args:
+            max_rate_mbps: Highest rate considered plausible when deciding
+                whether a smaller counter value is a wraparound or a reset
+        """
+        self.max_rate_mbps = max_rate_mbps
+        self.logger = logging.getLogger('jellydemon.counters')
+        self._last: Dict[str, Tuple[int, float]] = {}
+
+    def update(self, key: str, value: int, timestamp: float) -> Optional[float]:
+        """
+        Record a counter reading and return the rate since the previous one.
+
+        Args:
+            key: Counter name (e.g. interface or IP)
+            value: Raw byte counter value
+            timestamp: Monotonic timestamp of the reading in seconds
+
+        Returns:
+            Rate in Mbps, or None if there is no usable previous reading
+        """
+        previous = self._last.get(key)
+        self._last[key] = (value, timestamp)
+        if previous is None:
+            return None
+
+        prev_value, prev_time = previous
+        elapsed = timestamp - prev_time
+        if elapsed <= 0:
+            # Clock went backwards - the router rebooted
+            self.logger.debug(f"Counter {key} clock went backwards, re-baselining")
+            return None
+
+        delta = value - prev_value
+        if delta < 0:
+            delta = self._wrapped_delta(prev_value, value, elapsed)
+            if delta is None:
+                self.logger.info(f"Counter {key} was reset, re-baselining")
+                return None
+            self.logger.debug(f"Counter {key} wrapped around")
+
+        return delta * 8 / elapsed / 1_000_000
+
+    def _wrapped_delta(self, prev_value: int, value: int, elapsed: float) -> Optional[int]:
+        """Return the delta assuming a wraparound, if one is plausible."""
+        for width in self.WIDTHS:
+            limit = 1 << width
+            if prev_value >= limit:
+                continue
+            delta = limit - prev_value + value
+            if delta * 8 / elapsed / 1_000_000 <= self.max_rate_mbps:
+                return delta
+        return None
+
+    def has(self, key: str) -> bool:
+        """Check whether a baseline reading exists for ``key``."""
+        return key in self._last
+
+    def reset(self, key: Optional[str] = None):
+        """Forget the baseline for ``key``, or for every counter."""
+        if key is None:
+            self._last.clear()
+        else:
+            self._last.pop(key, None)
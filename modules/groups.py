@@ -0,0 +1,125 @@
+"""
+Bandwidth groups and the membership index built from them at config load.
+"""
+
+import ipaddress
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class GroupConfig:
+    """A bandwidth group: who belongs to it and what share it gets."""
+    name: str
+    weight: float = 1.0
+    min_mbps: float = 0.0  # guaranteed to the group while it has streamers
+    max_mbps: Optional[float] = None  # ceiling for the whole group
+    users: List[str] = field(default_factory=list)  # user ids
+    user_names: List[str] = field(default_factory=list)
+    policy_flags: List[str] = field(default_factory=list)  # e.g. IsAdministrator
+    ip_ranges: List[str] = field(default_factory=list)
+
+
+# Streamers that match no group
+DEFAULT_GROUP = GroupConfig(name="default")
+
+
+class GroupIndex:
+    """
+    Precomputed group membership.
+
+    Each rule type is turned into a hash lookup once, so matching a
+    streamer costs one lookup per rule type (one per distinct prefix
+    length for IP ranges) however many groups and rules there are. When a
+    streamer matches several groups, the one listed first wins.
+    """
+
+    def __init__(self, groups: List[GroupConfig]):
+        """
+        Build the index.
+
+        Args:
+            groups: Groups in priority order
+
+        Raises:
+            ValueError: For invalid weights, bounds, names or IP ranges
+        """
+        self.groups = list(groups)
+        self._by_user_id: Dict[str, int] = {}
+        self._by_name: Dict[str, int] = {}
+        self._by_flag: Dict[str, int] = {}
+        # (version, prefix length) -> {masked network address: group position}
+        self._by_network: Dict[tuple, Dict[int, int]] = {}
+
+        names = set()
+        for position, group in enumerate(self.groups):
+            if group.name in names or group.name == DEFAULT_GROUP.name:
+                raise ValueError(f"Duplicate or reserved group name '{group.name}'")
+            names.add(group.name)
+            if group.weight <= 0:
+                raise ValueError(f"Group '{group.name}' weight must be positive")
+            if group.min_mbps < 0:
+                raise ValueError(f"Group '{group.name}' min_mbps must not be negative")
+            if group.max_mbps is not None and not 0 < group.max_mbps >= group.min_mbps:
+                raise ValueError(f"Group '{group.name}' max_mbps must be positive and at least min_mbps")
+
+            for user_id in group.users:
+                self._by_user_id.setdefault(user_id, position)
+            for user_name in group.user_names:
+                self._by_name.setdefault(user_name.lower(), position)
+            for flag in group.policy_flags:
+                self._by_flag.setdefault(flag, position)
+            for ip_range in group.ip_ranges:
+                network = ipaddress.ip_network(ip_range, strict=False)
+                table = self._by_network.setdefault((network.version, network.prefixlen), {})
+                table.setdefault(int(network.network_address), position)
+
+    @classmethod
+    def from_config(cls, groups: Optional[List[Dict[str, Any]]]) -> 'GroupIndex':
+        """Build the index from the ``groups`` list of the bandwidth config."""
+        return cls([GroupConfig(**group) for group in groups or []])
+
+    def __bool__(self) -> bool:
+        return bool(self.groups)
+
+    def _network_match(self, ip: Optional[str]) -> Optional[int]:
+        if not ip or not self._by_network:
+            return None
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        value, bits = int(address), address.max_prefixlen
+        best = None
+        for (version, prefixlen), table in self._by_network.items():
+            if version != address.version:
+                continue
+            position = table.get(value >> (bits - prefixlen) << (bits - prefixlen))
+            if position is not None and (best is None or position < best):
+                best = position
+        return best
+
+    def group_of(self, user_id: str, user_data: Optional[Dict[str, Any]] = None,
+                 ip: Optional[str] = None) -> GroupConfig:
+        """
+        Find the group of a streamer.
+
+        Args:
+            user_id: Jellyfin user id
+            user_data: Jellyfin user DTO (name and policy), if known
+            ip: Client IP, if known
+
+        Returns:
+            The first matching group, or DEFAULT_GROUP
+        """
+        user_data = user_data or {}
+        candidates = [self._by_user_id.get(user_id), self._network_match(ip)]
+        name = user_data.get('Name')
+        if name:
+            candidates.append(self._by_name.get(name.lower()))
+        policy = user_data.get('Policy') or {}
+        candidates.extend(
+            position for flag, position in self._by_flag.items() if policy.get(flag)
+        )
+        matched = [position for position in candidates if position is not None]
+        return self.groups[min(matched)] if matched else DEFAULT_GROUP
@@ -0,0 +1,160 @@
+"""
+Remote households (sites) and their downlink ceilings.
+"""
+
+import ipaddress
+import logging
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+@lru_cache(maxsize=65536)  # the same clients come back every cycle
+def site_key(ip: str, ipv6_prefix: int = 64) -> str:
+    """
+    Site of a client IP.
+
+    An IPv4 address is its own site (the household's NAT address); IPv6
+    clients are grouped by their ``/ipv6_prefix`` network.
+    """
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    if address.version == 6:
+        if address.ipv4_mapped is not None:
+            return str(address.ipv4_mapped)
+        return str(ipaddress.ip_network(f"{address}/{ipv6_prefix}", strict=False))
+    return str(address)
+
+
+class SiteCeilings:
+    """
+    Downlink ceilings of remote sites, configured or learned.
+
+    A site that keeps receiving well under both its allocation and the
+    bitrate its streams want, for ``confirm_cycles`` cycles in a row, is
+    limited by its own downlink, so its measured rate plus headroom becomes
+    its learned ceiling (never below the caller's minimum). A site that
+    reaches its learned ceiling gets the ceiling raised by the probe
+    factor, so a link that got faster is found again; the ceiling is
+    dropped once it exceeds the site's demand or the site has been gone
+    for ``ttl`` seconds. Callers skip cycles in which the site's streams
+    are paused, which would otherwise look like a saturated link.
+    """
+
+    # Measured below this fraction of min(allocation, demand) = saturated
+    SATURATION = 0.8
+    HEADROOM = 1.2
+    PROBE = 1.5
+
+    def __init__(self, configured: Optional[Dict[str, float]] = None, default: float = 0.0,
+                 learn: bool = True, ttl: float = 3600, confirm_cycles: int = 3):
+        """
+        Initialize the ceilings.
+
+        Args:
+            configured: Ceiling in Mbps per client IP or network
+            default: Ceiling for sites without a configured or learned one
+                (0 for none)
+            learn: Learn ceilings from measured per-client rates
+            ttl: Seconds a learned ceiling outlives its site's last session
+            confirm_cycles: Saturated cycles in a row before a ceiling is
+                learned or lowered
+
+        Raises:
+            ValueError: For an invalid IP or network
+        """
+        self.logger = logging.getLogger('jellydemon.households')
+        self.default = default
+        self.learn = learn
+        self.ttl = ttl
+        self.confirm_cycles = max(confirm_cycles, 1)
+        # Most specific network first
+        self._configured: List[Tuple[Network, float]] = sorted(
+            ((ipaddress.ip_network(key, strict=False), float(mbps))
+             for key, mbps in (configured or {}).items()),
+            key=lambda item: item[0].prefixlen, reverse=True
+        )
+        # site -> (ceiling in Mbps, monotonic time last seen)
+        self.learned: Dict[str, Tuple[float, float]] = {}
+        # site -> saturated cycles in a row
+        self._saturated: Dict[str, int] = {}
+
+    def configured(self, site: str) -> Optional[float]:
+        """Configured ceiling of a site, if any."""
+        if not self._configured:
+            return None
+        try:
+            network = ipaddress.ip_network(site, strict=False)
+        except ValueError:
+            return None
+        for configured, mbps in self._configured:
+            if configured.version == network.version and configured.overlaps(network):
+                return mbps
+        return None
+
+    def ceiling(self, site: str) -> Optional[float]:
+        """Downlink ceiling of a site in Mbps, or None if it has none."""
+        configured = self.configured(site)
+        if configured is not None:
+            return configured
+        if site in self.learned:
+            return self.learned[site][0]
+        return self.default or None
+
+    def observe(self, site: str, allocated: float, measured: float, demand: float,
+                minimum: float = 0.0, now: Optional[float] = None):
+        """
+        Update the learned ceiling of a site from one cycle.
+
+        Args:
+            site: Site key from ``site_key``
+            allocated: Limit the site had over the cycle, in Mbps
+            measured: Upload rate measured to the site, in Mbps
+            demand: Bitrate the site's streams play at (not the measured
+                rate), in Mbps
+            minimum: Lowest ceiling that may be learned, in Mbps
+            now: Monotonic timestamp (defaults to now)
+        """
+        if not self.learn or measured <= 0 or self.configured(site) is not None:
+            return
+        now = time.monotonic() if now is None else now
+        learned = self.learned.get(site)
+        if measured < self.SATURATION * min(allocated, demand):
+            self._saturated[site] = self._saturated.get(site, 0) + 1
+            if self._saturated[site] < self.confirm_cycles:
+                return
+            ceiling = max(measured * self.HEADROOM, minimum)
+            if learned is None:
+                self.logger.info(f"Site {site} is downlink-limited, ceiling {ceiling:.2f} Mbps")
+            self.learned[site] = (ceiling, now)
+            return
+        self._saturated.pop(site, None)
+        if learned is not None:
+            ceiling = learned[0] * self.PROBE
+            if ceiling >= demand:
+                self.logger.info(f"Site {site} is no longer downlink-limited")
+                del self.learned[site]
+            else:
+                self.learned[site] = (ceiling, now)
+
+    def skip(self, site: str):
+        """Forget a site's saturated streak, for a cycle that cannot be judged."""
+        self._saturated.pop(site, None)
+
+    def touch(self, sites: Iterable[str], now: Optional[float] = None):
+        """Mark sites as active and forget learned ceilings past their TTL."""
+        now = time.monotonic() if now is None else now
+        sites = set(sites)
+        for site in sites:
+            if site in self.learned:
+                self.learned[site] = (self.learned[site][0], now)
+        for site, (_, seen) in list(self.learned.items()):
+            if now - seen > self.ttl:
+                del self.learned[site]
+        for site in list(self._saturated):
+            if site not in sites:
+                del self._saturated[site]
@@ -0,0 +1,121 @@
+"""
+Shared HTTP transport for the Jellyfin and router clients.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Path segments that identify an object rather than an endpoint
+_ID_SEGMENT = re.compile(r'^(?:[0-9a-fA-F]{32}|[0-9a-fA-F-]{36}|\d+)$')
+
+
+def endpoint_name(method: str, url: str) -> str:
+    """Counter key for a request, with ids replaced: ``GET /Users/{id}``."""
+    path = urlsplit(url).path or '/'
+    segments = ['{id}' if _ID_SEGMENT.match(s) else s for s in path.split('/')]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request."""
+
+    def __init__(self, timeout: Tuple[float, float], **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class HTTPTransport(requests.Session):
+    """
+    ``requests.Session`` with real timeouts, pooling, retries and counters.
+
+    Every request gets a (connect, read) timeout unless one is passed
+    explicitly, so a hung server bounds the cycle instead of blocking it.
+    Connections are kept alive in a pool of ``pool_size`` per host. Only
+    idempotent GETs are retried, with exponential backoff, on connection
+    errors and 502/503/504 responses; POSTs are sent once. Latency is
+    counted per endpoint (ids in the path are folded together).
+    """
+
+    def __init__(self, connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 retries: int = 2, backoff: float = 0.3, pool_size: int = 10):
+        """
+        Initialize the transport.
+
+        Args:
+            connect_timeout: Seconds to wait for a TCP connection
+            read_timeout: Seconds to wait between bytes of the response
+            retries: Retries for failed GET requests
+            backoff: Backoff factor between retries, in seconds
+            pool_size: Keep-alive connections kept per host
+        """
+        super().__init__()
+        self.logger = logging.getLogger('jellydemon.http')
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=backoff, status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET'}), raise_on_status=False
+        )
+        adapter = TimeoutHTTPAdapter(
+            self.timeout, max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        # endpoint -> [count, errors, total seconds, max seconds]
+        self._latency: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, *args, **kwargs):
+        key = endpoint_name(method, url)
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                counter = self._latency.setdefault(key, [0, 0, 0.0, 0.0])
+                counter[0] += 1
+                counter[1] += failed
+                counter[2] += elapsed
+                counter[3] = max(counter[3], elapsed)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-endpoint request counters.
+
+        Returns:
+            Mapping of endpoint to ``count``, ``errors``, ``avg`` and ``max``
+            (seconds)
+        """
+        with self._lock:
+            return {
+                key: {'count': count, 'errors': errors,
+                      'avg': total / count if count else 0.0, 'max': slowest}
+                for key, (count, errors, total, slowest) in self._latency.items()
+            }
+
+    def log_latency(self, level: int = logging.DEBUG, limit: Optional[int] = 5):
+        """Log the endpoints with the highest average latency."""
+        stats = sorted(self.latency_stats().items(), key=lambda item: item[1]['avg'], reverse=True)
+        for key, s in stats[:limit]:
+            self.logger.log(
+                level,
+                f"{key}: {s['count']} requests, {s['errors']} failed, "
+                f"avg {s['avg'] * 1000:.0f} ms, max {s['max'] * 1000:.0f} ms"
+            )
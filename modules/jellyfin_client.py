@@ -2,12 +2,18 @@
 Jellyfin client for session monitoring and user bandwidth management.
 """
 
-import requests
 import json
 import logging
 import time
-from typing import Dict, Any, List, Optional, TYPE_CHECKING
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple, Union, TYPE_CHECKING
 from urllib.parse import urljoin, urlencode
+
+from .http_transport import HTTPTransport
+from .restart_policy import restart_needed
+from .restarts import RestartOrchestrator, RestartScheduler
+from .session_tracker import SessionTracker
+from .stream_session import StreamSession
+from .user_directory import UserDirectory
 
 if TYPE_CHECKING:
     from .config import JellyfinConfig
@@ -20,18 +26,41 @@ class JellyfinClient:
         """Initialize the Jellyfin client."""
         self.config = config
         self.logger = logging.getLogger('jellydemon.jellyfin')
-        self.session = requests.Session()
+        self.session = HTTPTransport(
+            connect_timeout=config.connect_timeout, read_timeout=config.read_timeout,
+            retries=config.http_retries, pool_size=config.http_pool_size
+        )
         
         # Setup session
-        self.session.timeout = 30
         self.session.headers.update({
             'Authorization': f'MediaBrowser Token={config.api_key}',
             'Content-Type': 'application/json'
         })
         
-        # Cache for user data
-        self._user_cache = {}
+        # All users and their policies, fetched with one request
+        self.users = UserDirectory(self.get_all_users, ttl=config.user_cache_ttl)
         self._original_user_settings = {}
+        self.tracker: Optional[SessionTracker] = None
+        self.restarts: Optional[RestartOrchestrator] = None
+        if config.restart_concurrency > 0:
+            self.restarts = RestartOrchestrator(
+                self, max_concurrent=config.restart_concurrency,
+                delay=config.restart_delay, deadline=config.restart_deadline
+            )
+        self.scheduler: Optional[RestartScheduler] = None
+        if config.restart_batch_size > 0 or config.max_transcodes > 0:
+            self.scheduler = RestartScheduler(
+                self.restarts.submit if self.restarts else self.restart_stream,
+                max_per_cycle=config.restart_batch_size,
+                max_transcodes=config.max_transcodes
+            )
+        # Last limit written per user: user_id -> (bps, monotonic time verified)
+        self._applied_limits: Dict[str, Tuple[int, float]] = {}
+        # Last per-session limit pushed per user: user_id -> {session_id: bps}
+        self._pushed_limits: Dict[str, Dict[str, int]] = {}
+        # SetMaxStreamingBitrate support per client app:
+        # "Client/Version" -> (supported, monotonic time learned)
+        self._command_support: Dict[str, Tuple[bool, float]] = {}
     
     def test_connection(self) -> bool:
         """Test connection to Jellyfin server."""
@@ -55,47 +84,110 @@ class JellyfinClient:
         """
         Get list of active streaming sessions.
         
+        Sessions come from the WebSocket session table when it is live and
+        from polling ``GET /Sessions`` otherwise.
+        
         Returns:
             List of active session objects
         """
         try:
-            url = urljoin(self.config.base_url, '/Sessions')
-            response = self.session.get(url)
+            sessions = self.tracker.sessions() if self.tracker else None
+            if sessions is None:
+                url = urljoin(self.config.base_url, '/Sessions')
+                response = self.session.get(url)
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to get sessions: {response.status_code}")
+                    return []
+                sessions = response.json()
             
-            if response.status_code == 200:
-                sessions = response.json()
-                
-                # Filter for active streaming sessions
-                active_sessions = []
-                for session in sessions:
-                    # Check if session is actively streaming
-                    if (session.get('NowPlayingItem') and 
-                        session.get('PlayState', {}).get('IsPaused', True) is False):
-                        active_sessions.append(session)
-                
-                self.logger.debug(f"Found {len(active_sessions)} active streaming sessions")
-                return active_sessions
-            else:
-                self.logger.error(f"Failed to get sessions: {response.status_code}")
-                return []
+            # Filter for active streaming sessions
+            active_sessions = []
+            for session in sessions:
+                # Check if session is actively streaming
+                if (session.get('NowPlayingItem') and 
+                    session.get('PlayState', {}).get('IsPaused', True) is False):
+                    active_sessions.append(session)
+            
+            self.logger.debug(f"Found {len(active_sessions)} active streaming sessions")
+            return active_sessions
                 
         except Exception as e:
             self.logger.error(f"Error getting active sessions: {e}")
             return []
+    
+    def start_session_tracking(self, on_playback_change: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Track sessions over the server WebSocket instead of polling.
+        
+        Args:
+            on_playback_change: Called from the tracker thread when a stream
+                starts, stops or pauses
+            
+        Returns:
+            True if the tracker was started
+        """
+        if not self.config.websocket:
+            return False
+        if self.tracker is None:
+            self.tracker = SessionTracker(
+                self.config.base_url, self.config.api_key,
+                interval_ms=self.config.websocket_interval_ms,
+                on_user_change=self.users.invalidate,
+                on_playback_change=on_playback_change
+            )
+        return self.tracker.start()
+    
+    @property
+    def sessions_live(self) -> bool:
+        """Whether sessions are currently pushed over the WebSocket."""
+        return self.tracker is not None and self.tracker.live
+    
+    def get_activity_entries(self, min_date: str) -> List[Dict[str, Any]]:
+        """
+        Get activity log entries newer than ``min_date``.
+        
+        Args:
+            min_date: ISO 8601 UTC timestamp
+            
+        Returns:
+            List of activity log entries, oldest first
+        """
+        try:
+            url = urljoin(self.config.base_url, '/System/ActivityLog/Entries')
+            response = self.session.get(url, params={'minDate': min_date, 'hasUserId': 'true'})
+            
+            if response.status_code == 200:
+                entries = response.json().get('Items', [])
+                return sorted(entries, key=lambda e: e.get('Date') or '')
+            else:
+                self.logger.error(f"Failed to get activity log: {response.status_code}")
+                return []
+                
+        except Exception as e:
+            self.logger.error(f"Error getting activity log: {e}")
+            return []
+    
+    def stop_session_tracking(self):
+        """Stop the WebSocket session tracker, if running."""
+        if self.tracker is not None:
+            self.tracker.stop()
     
     def get_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
         """
         Get user information by user ID.
         
+        Served from the user directory; users missing from it (e.g. created
+        since the last refresh) are fetched individually.
+        
         Args:
             user_id: Jellyfin user ID
             
         Returns:
             User information dictionary or None
         """
-        # Check cache first
-        if user_id in self._user_cache:
-            return self._user_cache[user_id]
+        user_info = self.users.get(user_id)
+        if user_info is not None:
+            return user_info
         
         try:
             url = urljoin(self.config.base_url, f'/Users/{user_id}')
@@ -103,7 +195,7 @@ class JellyfinClient:
             
             if response.status_code == 200:
                 user_info = response.json()
-                self._user_cache[user_id] = user_info
+                self.users.put(user_info)
                 return user_info
             else:
                 self.logger.error(f"Failed to get user info for {user_id}: {response.status_code}")
@@ -113,29 +205,39 @@ class JellyfinClient:
             self.logger.error(f"Error getting user info for {user_id}: {e}")
             return None
     
-    def get_user_policy(self, user_id: str) -> Optional[Dict[str, Any]]:
+    def get_user_policy(self, user_id: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
         """
         Get user policy settings.
         
         Args:
             user_id: Jellyfin user ID
+            fresh: Fetch the policy from the server even when the user
+                directory has it (the directory can be ``user_cache_ttl``
+                seconds old)
             
         Returns:
-            User policy dictionary or None
+            User policy dictionary (a copy that may be modified) or None
         """
         try:
-            url = urljoin(self.config.base_url, f'/Users/{user_id}/Policy')
-            response = self.session.get(url)
-
-            if response.status_code == 200:
+            policy = None if fresh else self.users.policy(user_id)
+            if policy is None:
+                url = urljoin(self.config.base_url, f'/Users/{user_id}/Policy')
+                response = self.session.get(url)
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to get user policy for {user_id}: {response.status_code}")
+                    return None
                 policy = response.json()
+                if fresh and isinstance(policy, dict):
+                    self.users.update_policy(user_id, policy)
+
+            if isinstance(policy, dict):
                 bitrate = policy.get('RemoteClientBitrateLimit', 0) or 0
                 self.logger.debug(
                     f"User {user_id} policy RemoteClientBitrateLimit is {bitrate / 1_000_000:.2f} Mbps"
                 )
                 return policy
             else:
-                self.logger.error(f"Failed to get user policy for {user_id}: {response.status_code}")
+                self.logger.error(f"Invalid user policy for {user_id}")
                 return None
                 
         except Exception as e:
@@ -146,21 +248,54 @@ class JellyfinClient:
         self,
         user_id: str,
         limit_mbps: float,
-        session_data: Optional[Dict[str, Any]] = None,
+        session_data: Optional[Union[StreamSession, Dict[str, Any], Sequence[Any]]] = None,
+        session_limits: Optional[Dict[str, float]] = None,
     ) -> bool:
         """
         Set bandwidth limit for a user.
         
+        The policy is only rewritten (and the streams only restarted) when
+        the limit differs from the applied one by more than
+        ``limit_tolerance``. The last applied limit is cached and checked
+        against the server at most every ``limit_verify_interval`` seconds.
+        With command delivery, per-session limits are compared with the
+        ones last pushed, so sessions whose share changed are pushed even
+        when the policy limit stays the same.
+        
         Args:
             user_id: Jellyfin user ID
             limit_mbps: Bandwidth limit in Mbps
+            session_data: Session (record or raw data), or a list of the
+                user's sessions, to restart if the limit changes
+            session_limits: Per-session limits in Mbps by session id, pushed
+                to clients instead of ``limit_mbps`` with command delivery
             
         Returns:
             True if successful, False otherwise
         """
+        # Convert Mbps to bits per second (Jellyfin uses bps)
+        limit_bps = int(limit_mbps * 1_000_000)
+        session_bps: Dict[str, int] = {}
+        if session_limits and self.config.limit_delivery == 'command':
+            session_bps = {
+                session_id: int(mbps * 1_000_000) for session_id, mbps in session_limits.items()
+            }
+        
+        cached = self._applied_limits.get(user_id)
+        if (cached and self._limit_unchanged(cached[0], limit_bps) and
+                time.monotonic() - cached[1] < self.config.limit_verify_interval):
+            self.logger.debug(f"Limit for user {user_id} unchanged, skipping update")
+            self._push_session_limits(user_id, session_data, session_bps)
+            return True
+        
         try:
             # Get current user policy
-            policy = self.get_user_policy(user_id)
+            if cached and self._limit_unchanged(cached[0], limit_bps):
+                # Re-verifying the cached limit has to see the server, not
+                # the user directory snapshot
+                policy = self.get_user_policy(user_id, fresh=True)
+            else:
+                policy = self.get_user_policy(user_id)
             if not policy:
                 self.logger.error(f"Could not get policy for user {user_id}")
                 return False
@@ -174,8 +309,12 @@ class JellyfinClient:
             old_bps = policy.get('RemoteClientBitrateLimit', 0) or 0
             old_limit = old_bps / 1_000_000
             
-            # Convert Mbps to bits per second (Jellyfin uses bps)
-            limit_bps = int(limit_mbps * 1_000_000)
+            if self._limit_unchanged(old_bps, limit_bps):
+                # Server already has this limit - nothing to write or restart
+                self._applied_limits[user_id] = (old_bps, time.monotonic())
+                self.logger.debug(f"Limit for user {user_id} already {old_limit:.2f} Mbps on server")
+                self._push_session_limits(user_id, session_data, session_bps)
+                return True
             
             # Update policy
             policy['RemoteClientBitrateLimit'] = limit_bps
@@ -185,18 +324,26 @@ class JellyfinClient:
             response = self.session.post(url, json=policy)
             
             if response.status_code == 204:  # No Content = Success
+                self._applied_limits[user_id] = (limit_bps, time.monotonic())
+                self.users.update_policy(user_id, policy)
                 user_info = self.get_user_info(user_id)
                 username = user_info.get('Name', user_id) if user_info else user_id
-                state = (
-                    "playing" if session_data and session_data.get('NowPlayingItem') else "idle"
-                )
+                playing = [
+                    s for s in self._session_list(session_data) if StreamSession.coerce(s).playing
+                ]
+                state = "playing" if playing else "idle"
                 msg = (
                     f"Set bandwidth limit for user {username} from {old_limit:.2f} Mbps "
                     f"to {limit_mbps:.2f} Mbps ({state})"
                 )
-                if session_data and session_data.get('NowPlayingItem'):
-                    if self.restart_stream(session_data):
-                        msg += f" - restarted stream (session {session_data.get('Id')})"
+                pushed = {}
+                for raw in playing:
+                    session_id = StreamSession.coerce(raw).id
+                    target = session_bps.get(session_id, limit_bps)
+                    msg += self._deliver_limit(raw, old_bps, limit_bps, target)
+                    pushed[session_id] = target
+                if session_bps:
+                    self._pushed_limits[user_id] = pushed
                 self.logger.info(msg)
                 return True
             else:
@@ -206,7 +353,108 @@ class JellyfinClient:
         except Exception as e:
             self.logger.error(f"Error setting bandwidth limit for {user_id}: {e}")
             return False
+    
+    def _push_session_limits(self, user_id: str,
+                             session_data: Optional[Union[StreamSession, Dict[str, Any], Sequence[Any]]],
+                             session_bps: Dict[str, int]):
+        """
+        Push per-session limits that changed while the policy limit did not.
+        
+        Args:
+            user_id: Jellyfin user ID
+            session_data: The user's sessions (records or raw data)
+            session_bps: Per-session limits in bps by session id (empty
+                without command delivery)
+        """
+        if not session_bps:
+            return
+        previous = self._pushed_limits.get(user_id, {})
+        pushed = {}
+        for raw in self._session_list(session_data):
+            session = StreamSession.coerce(raw)
+            target = session_bps.get(session.id)
+            if not session.playing or target is None:
+                continue
+            old_bps = previous.get(session.id)
+            if old_bps is not None and self._limit_unchanged(old_bps, target):
+                pushed[session.id] = old_bps
+            elif self.push_max_bitrate(session, target):
+                self.logger.info(
+                    f"Pushed {target / 1_000_000:.2f} Mbps to session {session.id} of user {user_id}"
+                )
+                pushed[session.id] = target
+        self._pushed_limits[user_id] = pushed
+    
+    @staticmethod
+    def _session_list(session_data: Optional[Union[StreamSession, Dict[str, Any], Sequence[Any]]]
+                      ) -> List[Union[StreamSession, Dict[str, Any]]]:
+        """One session, a list of sessions or None as a list of sessions."""
+        if not session_data:
+            return []
+        if isinstance(session_data, (StreamSession, dict)):
+            return [session_data]
+        return [s for s in session_data if s]
+    
+    def _deliver_limit(self, session_data: Union[StreamSession, Dict[str, Any]], old_bps: int,
+                       limit_bps: int, session_bps: int) -> str:
+        """
+        Make a playing session pick up a new policy limit.
+        
+        Args:
+            session_data: Playing session of the user (record or raw data)
+            old_bps: Previous policy limit in bps
+            limit_bps: New policy limit in bps
+            session_bps: This session's own limit in bps, pushed to the
+                client with command delivery
+            
+        Returns:
+            Log suffix describing what was done
+        """
+        session = StreamSession.coerce(session_data)
+        command = self.config.limit_delivery == 'command'
+        target = session_bps if command else limit_bps
+        if self.config.skip_unneeded_restarts:
+            needed, reason = restart_needed(
+                session, old_bps, target, self.config.quality_ladder_mbps
+            )
+            if not needed:
+                return f" - no restart needed ({reason})"
+        if command and self.push_max_bitrate(session, target):
+            return f" - pushed to client (session {session.id})"
+        if self.scheduler is not None:
+            # Staggered by dispatch_restarts() at the end of the cycle
+            self.scheduler.request(session, self._freed_bps(session, old_bps, limit_bps))
+            return f" - restart queued (session {session.id})"
+        if self.restarts is not None:
+            # Runs in the background; the result is logged when done
+            self.restarts.submit(session_data)
+            return f" - restart scheduled (session {session.id})"
+        if self.restart_stream(session_data):
+            return f" - restarted stream (session {session.id})"
+        return ""
     
+    def _limit_unchanged(self, old_bps: int, new_bps: int) -> bool:
+        """Check whether two limits are equal within the configured tolerance."""
+        return abs(new_bps - old_bps) <= self.config.limit_tolerance * max(old_bps, new_bps)
+    
+    @staticmethod
+    def _freed_bps(session: StreamSession, old_bps: int, new_bps: int) -> float:
+        """Bandwidth a restart under the new limit frees, in bps."""
+        current = session.transcode_bitrate or old_bps
+        if not current:
+            # Unlimited direct stream: the restart frees the most
+            return float('inf')
+        return current - new_bps
+    
+    def forget_applied_limit(self, user_id: Optional[str] = None):
+        """Drop the cached applied and pushed limits for ``user_id``, or for every user."""
+        if user_id is None:
+            self._applied_limits.clear()
+            self._pushed_limits.clear()
+        else:
+            self._applied_limits.pop(user_id, None)
+            self._pushed_limits.pop(user_id, None)
+    
     def restore_user_bandwidth_limits(self) -> bool:
         """
         Restore original bandwidth limits for all modified users.
@@ -226,6 +474,8 @@ class JellyfinClient:
                     response = self.session.post(url, json=policy)
                     
                     if response.status_code == 204:
+                        self.forget_applied_limit(user_id)
+                        self.users.update_policy(user_id, policy)
                         user_info = self.get_user_info(user_id)
                         username = user_info.get('Name', user_id) if user_info else user_id
                         self.logger.info(f"Restored original bandwidth limit for user {username}")
@@ -321,60 +571,148 @@ class JellyfinClient:
             self.logger.error(f"Error getting users: {e}")
             return []
 
-    def restart_stream(self, session: Dict[str, Any]) -> bool:
-        """Force a client to restart playback for the given session."""
-        session_id = session.get('Id')
-        user_id = session.get('UserId')
-        now_playing = session.get('NowPlayingItem')
-        play_state = session.get('PlayState', {})
+    def supports_bitrate_command(self, session: Union[StreamSession, Dict[str, Any]]) -> Optional[bool]:
+        """
+        Whether a session's client accepts the SetMaxStreamingBitrate command.
+        
+        Answers from the per-client cache first, then from the commands the
+        session advertises in ``Capabilities``. Cached answers expire after
+        ``command_support_ttl`` seconds, so an updated client is picked up.
+        
+        Returns:
+            True or False, or None if the client advertises no capabilities
+        """
+        session = StreamSession.coerce(session)
+        key = session.client_key
+        cached = self._command_support.get(key)
+        if cached is not None:
+            if time.monotonic() - cached[1] < self.config.command_support_ttl:
+                return cached[0]
+            del self._command_support[key]
 
-        if not (session_id and user_id and now_playing):
-            self.logger.warning(
-                f"Cannot restart session; missing data for session {session_id}"
-            )
+        if session.supported_commands is None:
+            return None
+        supported = (
+            session.remote_control and 'SetMaxStreamingBitrate' in session.supported_commands
+        )
+        self._command_support[key] = (supported, time.monotonic())
+        return supported
+
+    def push_max_bitrate(self, session: Union[StreamSession, Dict[str, Any]], limit_bps: int) -> bool:
+        """
+        Apply a new limit to a playing session without restarting it.
+        
+        Sends the SetMaxStreamingBitrate general command; the client
+        switches quality itself. The server acknowledges the dispatch, not
+        the client applying it, so the command is only sent to clients that
+        advertise it; clients with unknown support are restarted instead.
+        
+        Returns:
+            True if the command was delivered to the session
+        """
+        session = StreamSession.coerce(session)
+        session_id = session.id
+        if not session_id or not self.supports_bitrate_command(session):
             return False
 
-        item_id = now_playing.get('Id')
-        position_ticks = play_state.get('PositionTicks', 0)
-        media_source_id = play_state.get('MediaSourceId') or \
-            (now_playing.get('MediaSources') or [{}])[0].get('Id')
+        key = session.client_key
+        try:
+            url = urljoin(self.config.base_url, f'/Sessions/{session_id}/Command')
+            response = self.session.post(url, json={
+                'Name': 'SetMaxStreamingBitrate',
+                'Arguments': {'MaxBitrate': str(limit_bps)}
+            })
+            if response.status_code in (200, 204):
+                return True
 
-        if not (item_id and media_source_id):
-            self.logger.warning(
-                f"Cannot restart session {session_id}; missing media identifiers"
+            self.logger.info(
+                f"SetMaxStreamingBitrate to session {session_id} ({key}) failed "
+                f"({response.status_code}), falling back to a restart"
             )
             return False
 
-        try:
-            stop_url = urljoin(
-                self.config.base_url,
-                f'/Sessions/{session_id}/Playing/Stop'
+        except Exception as e:
+            self.logger.warning(f"Error sending bitrate to session {session_id}: {e}")
+            return False
+
+    def restart_plan(self, session: Union[StreamSession, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Work out how to resume a session after stopping it.
+        
+        Returns:
+            Dictionary with ``session_id``, ``user_id`` and the PlayNow
+            ``params``, or None if the session lacks the required data
+        """
+        session = StreamSession.coerce(session)
+        session_id = session.id
+        user_id = session.user_id
+
+        if not (session_id and user_id and session.playing):
+            self.logger.warning(
+                f"Cannot restart session; missing data for session {session_id}"
             )
-            self.session.post(stop_url, json={})
-            time.sleep(0.8)
+            return None
 
-            resume_url = urljoin(
-                self.config.base_url,
-                f'/Sessions/{session_id}/Playing'
+        if not session.media_source_id:
+            self.logger.warning(
+                f"Cannot restart session {session_id}; missing media identifiers"
             )
-            params = {
+            return None
+
+        return {
+            'session_id': session_id,
+            'user_id': user_id,
+            'params': {
                 'playCommand': 'PlayNow',
-                'itemIds': item_id,
-                'startPositionTicks': position_ticks,
-                'mediaSourceId': media_source_id,
+                'itemIds': session.item_id,
+                'startPositionTicks': session.position_ticks,
+                'mediaSourceId': session.media_source_id,
                 'controllingUserId': user_id
             }
-            response = self.session.post(resume_url, params=params, json={})
+        }
 
-            if response.status_code in (200, 204):
+    def stop_playback(self, session_id: str, timeout: Optional[float] = None):
+        """Send the Stop command to a session."""
+        stop_url = urljoin(
+            self.config.base_url,
+            f'/Sessions/{session_id}/Playing/Stop'
+        )
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        return self.session.post(stop_url, json={}, **kwargs)
+
+    def resume_playback(self, session_id: str, params: Dict[str, Any],
+                        timeout: Optional[float] = None) -> bool:
+        """Send a PlayNow command built by ``restart_plan`` to a session."""
+        resume_url = urljoin(
+            self.config.base_url,
+            f'/Sessions/{session_id}/Playing'
+        )
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        response = self.session.post(resume_url, params=params, json={}, **kwargs)
+        if response.status_code in (200, 204):
+            return True
+
+        self.logger.error(
+            f"Failed to restart stream {session_id}: {response.status_code}"
+        )
+        return False
+
+    def restart_stream(self, session: Union[StreamSession, Dict[str, Any]]) -> bool:
+        """Force a client to restart playback for the given session."""
+        plan = self.restart_plan(session)
+        if plan is None:
+            return False
+
+        session_id = plan['session_id']
+        try:
+            self.stop_playback(session_id)
+            time.sleep(self.config.restart_delay)
+
+            if self.resume_playback(session_id, plan['params']):
                 self.logger.info(
-                    f"Restarted stream for user {user_id} (session {session_id})"
+                    f"Restarted stream for user {plan['user_id']} (session {session_id})"
                 )
                 return True
-
-            self.logger.error(
-                f"Failed to restart stream {session_id}: {response.status_code}"
-            )
             return False
 
         except Exception as e:
@@ -383,8 +721,30 @@ class JellyfinClient:
             )
             return False
 
+    def dispatch_restarts(self) -> List[str]:
+        """
+        Run the queued restarts the transcoder budget allows this cycle.
+        
+        Transcoder load is taken from the ``TranscodingInfo`` of the current
+        sessions.
+        
+        Returns:
+            Ids of the sessions that were restarted
+        """
+        if self.scheduler is None or not self.scheduler.pending:
+            return []
+        in_flight = self.restarts.in_flight if self.restarts else 0
+        return self.scheduler.dispatch(self.get_active_sessions(), in_flight)
+
+    def shutdown_restarts(self):
+        """Wait for background restarts to finish and stop their workers."""
+        if self.scheduler is not None:
+            self.scheduler.clear()
+        if self.restarts is not None:
+            self.restarts.shutdown()
+
     def clear_user_cache(self):
-        """Clear the user information cache."""
-        self._user_cache.clear()
+        """Refresh the user directory on the next lookup."""
+        self.users.invalidate()
         self.logger.debug("User cache cleared")
 
@@ -2,16 +2,57 @@
 OpenWRT router client for bandwidth monitoring and SQM control.
 """
 
-import requests
 import subprocess
 import json
 import logging
-import paramiko
-from typing import Dict, Any, Optional, TYPE_CHECKING
+import ipaddress
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
 from urllib.parse import urljoin
+
+from .accounting import (
+    ACCOUNTING_CHAIN, parse_conntrack, parse_iptables_save, parse_luci_conntrack, rate_flows
+)
+from .counters import CounterTracker
+from .http_transport import HTTPTransport
+from .shaping import ClientShaper
+from .sqm import SQMRateController
+from .ssh_transport import SSHTransport
+from .telemetry import LocalCommandStream, TelemetrySampler
+from .ubus_client import UbusClient
 
 if TYPE_CHECKING:
     from .config import RouterConfig
+
+
+# Prints one counter snapshot: uptime, WAN tx bytes and the FORWARD byte
+# counters of every requested source IP, terminated by a "." line.
+_SNAPSHOT_SCRIPT = """
+WAN_IF=$(uci get network.wan.device 2>/dev/null || echo "eth0")
+snapshot() {{
+    echo "T $(cut -d' ' -f1 /proc/uptime)"
+    echo "W $(cat /sys/class/net/$WAN_IF/statistics/tx_bytes 2>/dev/null || echo 0)"
+    {ip_counters}
+    echo "."
+}}
+"""
+
+_IP_COUNTERS = (
+    "iptables -nvx -L FORWARD | awk -v ips=\"{ips}\" "
+    "'BEGIN {{ n = split(ips, a, \" \"); for (i = 1; i <= n; i++) want[a[i]] = 1 }} "
+    "($8 in want) {{ sum[$8] += $2 }} "
+    "END {{ for (ip in want) print \"I\", ip, sum[ip] + 0 }}'"
+)
+
+
+@dataclass
+class BandwidthSample:
+    """Upload rates measured over one shared sampling window."""
+    total_mbps: float = 0.0
+    per_ip: Dict[str, float] = field(default_factory=dict)
+    interval: float = 0.0
 
 
 class OpenWRTClient:
@@ -21,15 +62,40 @@ class OpenWRTClient:
         """Initialize the OpenWRT client."""
         self.config = config
         self.logger = logging.getLogger('jellydemon.openwrt')
-        self.session = requests.Session()
-        self.ssh_client = None
-        
-        # Setup session with timeout
-        self.session.timeout = 10
+        self.session = HTTPTransport(
+            connect_timeout=config.connect_timeout, read_timeout=config.read_timeout
+        )
+        self.ssh = SSHTransport(
+            config.host, config.ssh_port, config.username, config.password,
+            keepalive=config.ssh_keepalive, max_backoff=config.ssh_max_backoff,
+            command_timeout=config.ssh_command_timeout
+        )
+        self.sqm = SQMRateController(
+            self.ssh.exec, min_interval=config.sqm_min_interval,
+            persist_delay=config.sqm_persist_delay
+        )
+        self.shaper = ClientShaper(
+            self.ssh.exec, lan_device=config.shaping_device, ifb_device=config.shaping_ifb
+        )
+        self.counters = CounterTracker()
+        self._last_counter_time: Optional[float] = None
+        self.telemetry: Optional[TelemetrySampler] = None
+        self._client_counters = None
+        # IPs the last client dump was filtered to (the ones with a baseline)
+        self._client_counter_ips = set()
+        self._accounted_ips = set()
+        # Last ubus counter reading, rated against in delta mode
+        self._luci_snapshot: Optional[Dict[str, Any]] = None
         
         # LuCI endpoints
         self.luci_base = f"http://{config.host}:{config.luci_port}"
-        self.auth_token = None
+        self.ubus = UbusClient(
+            self.session, f"{self.luci_base}{config.ubus_path}",
+            config.username, config.password,
+            timeout=(config.connect_timeout, config.read_timeout)
+        )
+        self._wan_device: Optional[str] = None
+        self._wan_device_expires = 0.0
     
     def test_connection(self) -> bool:
         """Test connection to the router."""
@@ -45,12 +111,8 @@ class OpenWRTClient:
     def _test_ssh_connection(self) -> bool:
         """Test SSH connection to router."""
         try:
-            if self.ssh_client is None:
-                self._connect_ssh()
-            
             # Test command execution
-            stdin, stdout, stderr = self.ssh_client.exec_command('echo "test"')
-            result = stdout.read().decode().strip()
+            result = self._run_ssh('echo "test"').strip()
             return result == "test"
             
         except Exception as e:
@@ -67,82 +129,78 @@ class OpenWRTClient:
             return False
     
     def _connect_ssh(self):
-        """Establish SSH connection to router."""
-        if self.ssh_client is not None:
-            return
-        
-        self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        self.ssh_client.connect(
-            hostname=self.config.host,
-            port=self.config.ssh_port,
-            username=self.config.username,
-            password=self.config.password,
-            timeout=10
-        )
-        self.logger.debug("SSH connection established")
+        """Establish SSH connection to router (no-op while it is alive)."""
+        self.ssh.connect()
     
-    def _authenticate_luci(self) -> bool:
-        """Authenticate with LuCI interface."""
-        if self.auth_token:
-            return True
-        
-        try:
-            # Get login page to retrieve token
-            login_url = f"{self.luci_base}/cgi-bin/luci"
-            response = self.session.get(login_url)
-            
-            # Extract token from response (this may need adjustment based on LuCI version)
-            # For now, we'll try a basic authentication approach
-            auth_data = {
-                'luci_username': self.config.username,
-                'luci_password': self.config.password
-            }
-            
-            auth_response = self.session.post(login_url, data=auth_data)
-            
-            if auth_response.status_code == 200:
-                self.auth_token = True  # Simplified for now
-                self.logger.debug("LuCI authentication successful")
-                return True
-            else:
-                self.logger.error(f"LuCI authentication failed: {auth_response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"LuCI authentication error: {e}")
-            return False
+    def _run_ssh(self, cmd: str) -> str:
+        """Run a command on the router over SSH and return its stdout."""
+        return self.ssh.exec(cmd)[0]
 
     def _ubus_call(self, object: str, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
-        """Helper to invoke ubus methods via LuCI RPC."""
-        if params is None:
-            params = {}
-
-        url = f"{self.luci_base}/cgi-bin/luci/admin/ubus"
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "call",
-            "params": [object, method, params]
-        }
+        """Helper to invoke ubus methods over the authenticated ubus session."""
+        return self.ubus.call(object, method, params)
 
-        response = self.session.post(url, json=payload)
-        if response.status_code != 200:
-            raise RuntimeError(f"ubus call failed: {response.status_code}")
+    def _cache_wan_interface(self, info: Any) -> str:
+        """Cache the WAN device name from a network.interface.wan status reply."""
+        device = None
+        if isinstance(info, dict):
+            device = info.get("l3_device") or info.get("device")
+        if device:
+            self._wan_device = device
+            self._wan_device_expires = time.monotonic() + self.config.wan_cache_ttl
+        return self._wan_device or "wan"
 
-        result = response.json().get("result")
-        if isinstance(result, list) and len(result) > 1:
-            return result[1]
-        return result
+    def _wan_interface_fresh(self) -> bool:
+        return self._wan_device is not None and time.monotonic() < self._wan_device_expires
 
     def _get_wan_interface(self) -> str:
-        """Retrieve the WAN network device name."""
+        """Retrieve the WAN network device name, cached for wan_cache_ttl seconds."""
+        if self._wan_interface_fresh():
+            return self._wan_device
         try:
-            info = self._ubus_call("network.interface.wan", "status")
-            return info.get("l3_device") or info.get("device") or "wan"
+            return self._cache_wan_interface(
+                self._ubus_call("network.interface.wan", "status")
+            )
         except Exception:
-            return "wan"
+            return self._wan_device or "wan"
+
+    def _luci_counters(self, conntrack: bool = False):
+        """
+        Fetch WAN device statistics (and optionally the conntrack list) in a
+        single ubus batch request. The WAN interface lookup joins the batch
+        only when the cached device name has expired.
+
+        Returns:
+            Tuple of (device status dict, conntrack entries or None)
+        """
+        calls = []
+        refresh_wan = not self._wan_interface_fresh()
+        if refresh_wan:
+            calls.append(("network.interface.wan", "status", {}))
+        calls.append(("network.device", "status", {"name": self._wan_device or "wan"}))
+        if conntrack:
+            calls.append(("luci", "getConntrackList", {}))
+
+        results = self.ubus.batch(calls)
+        if refresh_wan:
+            wan_info = results.pop(0)
+            previous = self._wan_device
+            device = self._cache_wan_interface(wan_info if not isinstance(wan_info, Exception) else None)
+            if device != previous:
+                # The device status above was queried under a stale name
+                results[0] = self.ubus.call("network.device", "status", {"name": device})
+
+        device_status = results[0]
+        if isinstance(device_status, Exception):
+            raise device_status
+
+        entries = None
+        if conntrack:
+            listing = results[1]
+            if isinstance(listing, Exception):
+                raise listing
+            entries = listing.get("result", []) if isinstance(listing, dict) else listing
+        return device_status, entries
     
     def get_bandwidth_usage(self, ip: Optional[str] = None) -> float:
         """
@@ -166,76 +224,418 @@ class OpenWRTClient:
 
     def _get_bandwidth_usage_ssh(self, ip: Optional[str] = None) -> float:
         """Get bandwidth usage via SSH."""
-        if self.ssh_client is None:
-            self._connect_ssh()
-
         if ip:
-            cmd = f"""
-            BYTES1=$(iptables -nvx -L FORWARD | awk '$8 == "{ip}" {{sum+=$2}} END {{print sum}}')
-            sleep 1
-            BYTES2=$(iptables -nvx -L FORWARD | awk '$8 == "{ip}" {{sum+=$2}} END {{print sum}}')
-            BPS=$((BYTES2 - BYTES1))
-            echo "scale=2; $BPS * 8 / 1000000" | bc -l
-            """
+            sample = self._measure_ssh([ip])
+            mbps = sample.per_ip.get(ip, 0.0)
         else:
-            cmd = """
-            WAN_IF=$(uci get network.wan.device 2>/dev/null || echo "eth0")
-            TX_BYTES=$(cat /sys/class/net/$WAN_IF/statistics/tx_bytes 2>/dev/null || echo "0")
-            sleep 1
-            TX_BYTES2=$(cat /sys/class/net/$WAN_IF/statistics/tx_bytes 2>/dev/null || echo "0")
-            BPS=$((TX_BYTES2 - TX_BYTES))
-            echo "scale=2; $BPS * 8 / 1000000" | bc -l
-            """
-
-        stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
-        result = stdout.read().decode().strip()
+            sample = self._measure_ssh([])
+            mbps = sample.total_mbps
+
+        self.logger.debug(f"Current upload usage: {mbps:.2f} Mbps")
+        return mbps
+
+    def sample_upload_rates(self, ips: Optional[List[str]] = None,
+                            interval: float = 1.0) -> BandwidthSample:
+        """
+        Measure the WAN upload rate and the upload rate of each IP together.
+
+        Over SSH this is a single remote script with one shared sampling
+        interval, so the total and per-IP numbers cover the same window. In
+        ``delta`` measurement mode no sampling interval is used; rates cover
+        the time since the previous call.
+
+        Args:
+            ips: IP addresses to measure alongside the WAN total
+            interval: Sampling interval in seconds
+
+        Returns:
+            BandwidthSample with rates in Mbps
+        """
+        ips = list(ips or [])
+        sample = self._telemetry_sample(ips)
+        if sample is not None:
+            return sample
 
         try:
-            mbps = float(result)
-            self.logger.debug(f"Current upload usage: {mbps:.2f} Mbps")
-            return mbps
-        except ValueError:
-            self.logger.error(f"Invalid bandwidth reading: {result}")
-            return 0.0
+            if self.config.use_ssh:
+                return self._measure_ssh(ips, interval)
+            return self._sample_upload_rates_luci(ips, interval)
+        except Exception as e:
+            self.logger.error(f"Failed to sample upload rates: {e}")
+            return BandwidthSample(per_ip={ip: 0.0 for ip in ips})
 
-    def _get_bandwidth_usage_luci(self, ip: Optional[str] = None) -> float:
-        """Get bandwidth usage via LuCI API."""
-        if not self._authenticate_luci():
-            return 0.0
+    def start_telemetry(self, ips: Optional[List[str]] = None) -> bool:
+        """
+        Start the streaming telemetry sampler if it is enabled in config.
+
+        The router runs a snapshot loop on one long-lived SSH channel (or the
+        configured ``telemetry_command`` runs locally as a stand-in) and
+        ``sample_upload_rates`` is then served from the in-process buffer.
+
+        Args:
+            ips: IPs to track per-IP counters for (defaults to jellyfin_ip)
+
+        Returns:
+            True if the sampler is running
+        """
+        if not self.config.telemetry:
+            return False
+        if not (self.config.use_ssh or self.config.telemetry_command):
+            self.logger.warning("Router telemetry requires SSH access or a telemetry_command")
+            return False
+
+        if ips is None:
+            ips = [self.config.jellyfin_ip] if self.config.jellyfin_ip else []
+        if self.config.telemetry_command:
+            command = self.config.telemetry_command
+            open_stream = lambda: LocalCommandStream(command)
+        else:
+            open_stream = lambda: self._open_telemetry_channel(ips)
+
+        self.stop_telemetry()
+        self.telemetry = TelemetrySampler(open_stream, ips)
+        self.telemetry.start()
+        self.logger.info(
+            f"Router telemetry started ({self.config.telemetry_interval_ms} ms interval)"
+        )
+        return True
+
+    def stop_telemetry(self):
+        """Stop the streaming telemetry sampler."""
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+
+    def _open_telemetry_channel(self, ips: List[str]):
+        """Start the router-side snapshot loop and return its stdout."""
+        interval = self.config.telemetry_interval_ms / 1000
+        cmd = (
+            self._build_snapshot_script(ips)
+            + f"while true; do snapshot; sleep {interval:g}; done\n"
+        )
+        return self.ssh.open_stream(cmd)
+
+    def _telemetry_sample(self, ips: List[str]) -> Optional[BandwidthSample]:
+        """Serve rates from the telemetry buffer when it is fresh."""
+        if self.telemetry is None:
+            return None
+
+        now = time.monotonic()
+        latest = self.telemetry.buffer.latest_time()
+        max_age = max(3 * self.config.telemetry_interval_ms / 1000, 1.0)
+        if latest is None or now - latest > max_age:
+            return None
+
+        result = self.telemetry.buffer.average(self.config.telemetry_window, now)
+        if result is None:
+            return None
+        total, per_ip = result
+        if any(ip not in per_ip for ip in ips):
+            return None
+        return BandwidthSample(
+            total_mbps=total,
+            per_ip={ip: per_ip[ip] for ip in ips},
+            interval=self.config.telemetry_window
+        )
+
+    def _build_snapshot_script(self, ips: List[str]) -> str:
+        """Build the shell function that prints one counter snapshot."""
+        for ip in ips:
+            # IPs are interpolated into the remote shell script
+            ipaddress.ip_address(ip)
+
+        ip_counters = _IP_COUNTERS.format(ips=' '.join(ips)) if ips else ':'
+        return _SNAPSHOT_SCRIPT.format(ip_counters=ip_counters)
+
+    @staticmethod
+    def _parse_snapshots(output: str) -> List[Dict[str, Any]]:
+        """Parse snapshot script output into a list of counter dictionaries."""
+        snapshots = []
+        current = {'time': 0.0, 'wan': 0, 'ips': {}}
+        for line in output.splitlines():
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == '.':
+                snapshots.append(current)
+                current = {'time': 0.0, 'wan': 0, 'ips': {}}
+            elif parts[0] == 'T' and len(parts) == 2:
+                current['time'] = float(parts[1])
+            elif parts[0] == 'W' and len(parts) == 2:
+                current['wan'] = int(parts[1])
+            elif parts[0] == 'I' and len(parts) == 3:
+                current['ips'][parts[1]] = int(parts[2])
+        return snapshots
+
+    def _read_snapshots_ssh(self, ips: List[str],
+                            interval: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Read one counter snapshot, or two ``interval`` seconds apart."""
+        cmd = self._build_snapshot_script(ips) + "snapshot\n"
+        if interval is not None:
+            cmd += f"sleep {interval:g}\nsnapshot\n"
+
+        output = self._run_ssh(cmd)
+        snapshots = self._parse_snapshots(output)
+        if not snapshots:
+            self.logger.error(f"Invalid bandwidth reading: {output.strip()}")
+        return snapshots
+
+    def _measure_ssh(self, ips: List[str], interval: float = 1.0) -> BandwidthSample:
+        """Measure upload rates over SSH using the configured measurement mode."""
+        if self.config.measurement_mode == 'delta':
+            return self._delta_upload_rates_ssh(ips, interval)
+        return self._sample_upload_rates_ssh(ips, interval)
+
+    def _delta_upload_rates_ssh(self, ips: List[str],
+                                interval: float = 1.0) -> BandwidthSample:
+        """Read one counter snapshot and rate it against the previous cycle."""
+        snapshots = self._read_snapshots_ssh(ips)
+        if not snapshots:
+            return BandwidthSample(per_ip={ip: 0.0 for ip in ips})
+
+        sample = self._update_counters(snapshots[-1], ips)
+        if sample is None:
+            # No WAN baseline yet (first cycle or counter reset); take a sampled
+            # reading instead, which also primes the baseline
+            return self._sample_upload_rates_ssh(ips, interval)
+        return sample
+
+    def _update_counters(self, snapshot: Dict[str, Any],
+                         ips: List[str]) -> Optional[BandwidthSample]:
+        """
+        Feed a snapshot into the counter tracker and return the rates.
+
+        An IP without a baseline yet (new, or its counter was reset) is only
+        baselined and left out of ``per_ip`` for this cycle.
+
+        Returns:
+            The sample, or None if the WAN counter has no baseline
+        """
+        timestamp = snapshot['time']
+        total = self.counters.update('wan', snapshot['wan'], timestamp)
+        per_ip = {}
+        for ip in ips:
+            rate = self.counters.update(f"ip:{ip}", snapshot['ips'].get(ip, 0), timestamp)
+            if rate is not None:
+                per_ip[ip] = rate
+        previous_time, self._last_counter_time = self._last_counter_time, timestamp
+
+        if total is None:
+            return None
+        return BandwidthSample(
+            total_mbps=total,
+            per_ip=per_ip,
+            interval=timestamp - previous_time if previous_time is not None else 0.0
+        )
+
+    def _sample_upload_rates_ssh(self, ips: List[str],
+                                 interval: float = 1.0) -> BandwidthSample:
+        """Take two counter snapshots in one SSH round trip."""
+        snapshots = self._read_snapshots_ssh(ips, interval)
+        if len(snapshots) < 2:
+            return BandwidthSample(per_ip={ip: 0.0 for ip in ips})
+
+        first, second = snapshots[-2], snapshots[-1]
+        elapsed = second['time'] - first['time']
+        if elapsed <= 0:
+            elapsed = interval
+
+        if self.config.measurement_mode == 'delta':
+            for key in ['wan'] + [f"ip:{ip}" for ip in ips]:
+                self.counters.reset(key)
+            self._update_counters(second, ips)
+
+        def rate(before: int, after: int) -> float:
+            return max(after - before, 0) * 8 / elapsed / 1_000_000
+
+        return BandwidthSample(
+            total_mbps=rate(first['wan'], second['wan']),
+            per_ip={
+                ip: rate(first['ips'].get(ip, 0), second['ips'].get(ip, 0))
+                for ip in ips
+            },
+            interval=elapsed
+        )
+
+    def get_client_upload_rates(self, ips: List[str], interval: float = 1.0) -> Dict[str, float]:
+        """
+        Measure the upload rate towards every client IP in one router call.
+
+        A single counter dump (conntrack accounting or iptables-save counters
+        of the accounting chain, per ``router.client_accounting``) is parsed
+        locally, so the cost does not grow with the number of clients.
+
+        Args:
+            ips: External client IP addresses
+            interval: Sampling interval in seconds when no previous dump exists
+
+        Returns:
+            Dictionary mapping client IP to upload rate in Mbps (in delta
+            mode, IPs first seen this cycle are left out until the next)
+        """
+        ips = sorted(set(ips))
+        if not ips or self.config.client_accounting == 'off':
+            return {}
+        if not self.config.use_ssh and self.config.client_accounting != 'conntrack':
+            self.logger.warning("iptables client accounting requires SSH access")
+            return {}
 
         try:
-            iface = self._get_wan_interface()
-            params = {"iface": iface, "limit": 2}
-            if ip:
-                params["ip"] = ip
-
-            url = f"{self.luci_base}/cgi-bin/luci/admin/status/realtime/bandwidth"
-            response = self.session.get(url, params=params)
-            if response.status_code != 200:
-                self.logger.error(f"LuCI bandwidth query failed: {response.status_code}")
-                return 0.0
-
-            data = response.json()
-            records = data.get("data") if isinstance(data, dict) else data
-            if not isinstance(records, list) or len(records) < 2:
-                return 0.0
-
-            t1, t2 = records[-2], records[-1]
-            if len(t1) < 5 or len(t2) < 5:
-                return 0.0
-
-            tx_bytes = t2[3] - t1[3]
-            time_diff = t2[0] - t1[0]
-            if time_diff <= 0:
-                return 0.0
-
-            mbps = (tx_bytes * 8) / time_diff / 1_000_000
-            return mbps
+            for ip in ips:
+                # IPs are interpolated into the remote shell script
+                ipaddress.ip_address(ip)
+
+            if self.config.measurement_mode == 'delta' and self._client_counters is not None:
+                dumps = self._read_client_dumps(ips)
+                if dumps:
+                    previous_time, previous = self._client_counters
+                    self._client_counters = dumps[-1]
+                    current_time, current = dumps[-1]
+                    # IPs missing from the previous dump have no baseline:
+                    # their whole byte counts would read as one interval's
+                    # traffic, so they get a rate from the next cycle on
+                    known = [ip for ip in ips if ip in self._client_counter_ips]
+                    self._client_counter_ips = set(ips)
+                    if current_time > previous_time:
+                        return rate_flows(previous, current, current_time - previous_time, known)
+
+            dumps = self._read_client_dumps(ips, interval)
+            if len(dumps) < 2:
+                self.logger.error("Invalid client accounting reading")
+                return {ip: 0.0 for ip in ips}
+
+            (first_time, first), (second_time, second) = dumps[-2], dumps[-1]
+            self._client_counters = dumps[-1]
+            self._client_counter_ips = set(ips)
+            elapsed = second_time - first_time
+            return rate_flows(first, second, elapsed if elapsed > 0 else interval, ips)
 
         except Exception as e:
-            self.logger.error(f"LuCI bandwidth query error: {e}")
-            return 0.0
-    
+            self.logger.error(f"Failed to get client upload rates: {e}")
+            return {}
+
+    def _read_client_dumps(self, ips: List[str], interval: Optional[float] = None):
+        """Dump client counters once, or twice ``interval`` seconds apart."""
+        if not self.config.use_ssh:
+            return self._read_client_dumps_luci(ips, interval)
+
+        if self.config.client_accounting == 'iptables':
+            ipv4 = [ip for ip in ips if ipaddress.ip_address(ip).version == 4]
+            stale = sorted(self._accounted_ips - set(ipv4))
+            setup = (
+                f"iptables -N {ACCOUNTING_CHAIN} 2>/dev/null\n"
+                f"iptables -C FORWARD -j {ACCOUNTING_CHAIN} 2>/dev/null || "
+                f"iptables -I FORWARD -j {ACCOUNTING_CHAIN}\n"
+                f"for ip in {' '.join(ipv4)}; do iptables -C {ACCOUNTING_CHAIN} -d $ip -j RETURN "
+                f"2>/dev/null || iptables -A {ACCOUNTING_CHAIN} -d $ip -j RETURN; done\n"
+                f"for ip in {' '.join(stale)}; do iptables -D {ACCOUNTING_CHAIN} -d $ip -j RETURN "
+                f"2>/dev/null; done\n"
+            )
+            source = f'iptables-save -c -t filter | grep -F -- "-A {ACCOUNTING_CHAIN} "'
+            parser = parse_iptables_save
+            self._accounted_ips = set(ipv4)
+        else:
+            setup = ""
+            source = "{ cat /proc/net/nf_conntrack 2>/dev/null || conntrack -L -o extended 2>/dev/null; }"
+            if self.config.jellyfin_ip:
+                ipaddress.ip_address(self.config.jellyfin_ip)
+                source += f' | grep -F "src={self.config.jellyfin_ip} "'
+            parser = parse_conntrack
+
+        cmd = (
+            setup
+            + 'dump() {\n'
+            + '    echo "T $(cut -d\' \' -f1 /proc/uptime)"\n'
+            + f'    {source}\n'
+            + '    echo "."\n'
+            + '}\n'
+            + 'dump\n'
+        )
+        if interval is not None:
+            cmd += f"sleep {interval:g}\ndump\n"
+
+        dumps = []
+        timestamp, lines = 0.0, []
+        for line in self._run_ssh(cmd).splitlines():
+            if line.strip() == '.':
+                dumps.append((timestamp, parser(lines, ips)))
+                timestamp, lines = 0.0, []
+            elif line.startswith('T '):
+                timestamp = float(line.split()[1])
+            else:
+                lines.append(line)
+        return dumps
+
+    def _read_client_dumps_luci(self, ips: List[str], interval: Optional[float] = None):
+        """Read the conntrack list over ubus once, or twice ``interval`` apart."""
+        dumps = []
+        for index in range(2 if interval is not None else 1):
+            if index:
+                time.sleep(interval)
+            _, entries = self._luci_counters(conntrack=True)
+            dumps.append((time.monotonic(), parse_luci_conntrack(entries or [], ips)))
+        return dumps
+
+    def _get_bandwidth_usage_luci(self, ip: Optional[str] = None) -> float:
+        """Get bandwidth usage via ubus."""
+        sample = self._sample_upload_rates_luci([ip] if ip else [])
+        return sample.per_ip.get(ip, 0.0) if ip else sample.total_mbps
+
+    def _read_snapshot_luci(self, ips: List[str]) -> Dict[str, Any]:
+        """
+        Read the WAN tx counter and, for ``ips``, the conntrack byte counters
+        in one ubus batch request.
+        """
+        status, entries = self._luci_counters(conntrack=bool(ips))
+        stats = status.get("statistics", {}) if isinstance(status, dict) else {}
+        return {
+            'time': time.monotonic(),
+            'wan': int(stats.get("tx_bytes") or 0),
+            'ips': set(ips),
+            'flows': parse_luci_conntrack(entries or [], ips),
+        }
+
+    def _sample_upload_rates_luci(self, ips: List[str],
+                                  interval: float = 1.0) -> BandwidthSample:
+        """
+        Measure the WAN and per-IP upload rates over ubus.
+
+        Per-IP rates come from the conntrack list, so every reading is one
+        batch however many IPs are measured. In ``delta`` mode a single
+        reading is rated against the previous cycle's; otherwise (and when
+        there is no baseline yet) two readings are taken ``interval``
+        seconds apart.
+        """
+        previous, current = self._luci_snapshot, self._read_snapshot_luci(ips)
+        self._luci_snapshot = current
+        delta = self.config.measurement_mode == 'delta'
+        if delta:
+            total = self.counters.update('wan', current['wan'], current['time'])
+            if total is not None and previous is not None:
+                elapsed = current['time'] - previous['time']
+                # IPs missing from the previous reading have no baseline yet
+                known = [ip for ip in ips if ip in previous['ips']]
+                return BandwidthSample(
+                    total_mbps=total,
+                    per_ip=rate_flows(previous['flows'], current['flows'], elapsed, known),
+                    interval=elapsed
+                )
+
+        time.sleep(interval)
+        first, current = current, self._read_snapshot_luci(ips)
+        self._luci_snapshot = current
+        if delta:
+            self.counters.update('wan', current['wan'], current['time'])
+
+        elapsed = current['time'] - first['time']
+        if elapsed <= 0:
+            elapsed = interval
+        return BandwidthSample(
+            total_mbps=max(current['wan'] - first['wan'], 0) * 8 / elapsed / 1_000_000,
+            per_ip=rate_flows(first['flows'], current['flows'], elapsed, ips),
+            interval=elapsed
+        )
+
     def get_total_bandwidth(self) -> float:
         """
         Get total upload bandwidth capacity in Mbps.
@@ -243,59 +643,74 @@ class OpenWRTClient:
         Returns:
             Total upload bandwidth capacity in Mbps
         """
+        hints = self.get_capacity_hints()
+        mbps = hints.get('sqm') or hints.get('phy') or 100.0  # Default fallback
+        self.logger.debug(f"Total upload capacity: {mbps:.2f} Mbps")
+        return mbps
+    
+    def get_capacity_hints(self) -> Dict[str, Optional[float]]:
+        """
+        Read uplink capacity hints from the router in one round trip.
+        
+        Returns:
+            Dictionary with the enabled SQM upload rate (``sqm``) and the WAN
+            port link speed (``phy``) in Mbps; unknown values are None
+        """
         try:
             if self.config.use_ssh:
-                return self._get_total_bandwidth_ssh()
+                return self._get_capacity_hints_ssh()
             else:
-                return self._get_total_bandwidth_luci()
+                return self._get_capacity_hints_luci()
         except Exception as e:
-            self.logger.error(f"Failed to get total bandwidth: {e}")
-            return 100.0  # Default fallback
+            self.logger.error(f"Failed to get capacity hints: {e}")
+            return {'sqm': None, 'phy': None}
     
-    def _get_total_bandwidth_ssh(self) -> float:
-        """Get total bandwidth capacity via SSH."""
-        if self.ssh_client is None:
-            self._connect_ssh()
-        
-        # Try to get upload speed from SQM configuration
+    @staticmethod
+    def _parse_speed(value: Any) -> Optional[float]:
+        """Parse a link speed such as 1000, "1000" or LuCI's "1000F" into Mbps."""
+        match = re.match(r'\s*(\d+)', str(value)) if value is not None else None
+        if match and int(match.group(1)) > 0:
+            return float(match.group(1))
+        return None
+    
+    @staticmethod
+    def _sqm_mbps(enabled: Any, upload_kbps: Any) -> Optional[float]:
+        try:
+            if str(enabled) == '1' and int(upload_kbps) > 0:
+                return int(upload_kbps) / 1000
+        except (TypeError, ValueError):
+            pass
+        return None
+    
+    def _get_capacity_hints_ssh(self) -> Dict[str, Optional[float]]:
+        """Get capacity hints via SSH."""
         cmd = """
-        # Check SQM upload rate
-        SQM_UPLOAD=$(uci get sqm.@queue[0].upload 2>/dev/null || echo "0")
-        if [ "$SQM_UPLOAD" != "0" ]; then
-            # Convert kbits to Mbps
-            echo "scale=2; $SQM_UPLOAD / 1000" | bc -l
-        else
-            # Try to get from network configuration or default
-            echo "100"  # Default 100 Mbps
-        fi
+        WAN_IF=$(uci get network.wan.device 2>/dev/null || echo "eth0")
+        echo "SQM $(uci -q get sqm.@queue[0].enabled) $(uci -q get sqm.@queue[0].upload)"
+        echo "PHY $(cat /sys/class/net/$WAN_IF/speed 2>/dev/null)"
         """
-        
-        stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
-        result = stdout.read().decode().strip()
-        
-        try:
-            mbps = float(result)
-            self.logger.debug(f"Total upload capacity: {mbps:.2f} Mbps")
-            return mbps
-        except ValueError:
-            self.logger.error(f"Invalid total bandwidth reading: {result}")
-            return 100.0
+        hints: Dict[str, Optional[float]] = {'sqm': None, 'phy': None}
+        for line in self._run_ssh(cmd).splitlines():
+            parts = line.split()
+            if len(parts) == 3 and parts[0] == 'SQM':
+                hints['sqm'] = self._sqm_mbps(parts[1], parts[2])
+            elif len(parts) == 2 and parts[0] == 'PHY':
+                hints['phy'] = self._parse_speed(parts[1])
+        return hints
     
-    def _get_total_bandwidth_luci(self) -> float:
-        """Get total bandwidth capacity via LuCI API."""
-        if not self._authenticate_luci():
-            return 100.0
-
-        try:
-            iface = self._get_wan_interface()
-            result = self._ubus_call("network.device", "status", {"name": iface})
-            speed = result.get("speed") if isinstance(result, dict) else None
-            if speed:
-                return float(speed)
-        except Exception as e:
-            self.logger.error(f"LuCI total bandwidth query error: {e}")
-
-        return 100.0
+    def _get_capacity_hints_luci(self) -> Dict[str, Optional[float]]:
+        """Get capacity hints via one ubus batch."""
+        device, sqm = self.ubus.batch([
+            ("network.device", "status", {"name": self._get_wan_interface()}),
+            ("uci", "get", {"config": "sqm", "type": "queue"}),
+        ])
+        hints: Dict[str, Optional[float]] = {'sqm': None, 'phy': None}
+        if isinstance(device, dict):
+            hints['phy'] = self._parse_speed(device.get("speed"))
+        if isinstance(sqm, dict) and sqm.get("values"):
+            queues = sorted(sqm["values"].values(), key=lambda q: q.get(".index", 0))
+            hints['sqm'] = self._sqm_mbps(queues[0].get("enabled"), queues[0].get("upload"))
+        return hints
     
     def get_sqm_settings(self) -> Dict[str, Any]:
         """Get current SQM (Smart Queue Management) settings."""
@@ -304,12 +719,8 @@ class OpenWRTClient:
             return {}
         
         try:
-            if self.ssh_client is None:
-                self._connect_ssh()
-            
             cmd = "uci show sqm"
-            stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
-            result = stdout.read().decode()
+            result = self._run_ssh(cmd)
             
             # Parse UCI output into dictionary
             settings = {}
@@ -328,6 +739,9 @@ class OpenWRTClient:
         """
         Set SQM upload rate limit.
         
+        The shaper rate is changed in place; frequent calls are coalesced
+        and the UCI config is updated later without restarting SQM.
+        
         Args:
             rate_kbps: Upload rate in kbps
             
@@ -339,31 +753,44 @@ class OpenWRTClient:
             return False
         
         try:
-            if self.ssh_client is None:
-                self._connect_ssh()
-            
-            # Update SQM configuration
-            cmd = f"""
-            uci set sqm.@queue[0].upload={rate_kbps}
-            uci commit sqm
-            /etc/init.d/sqm restart
-            """
-            
-            stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
-            error_output = stderr.read().decode()
-            
-            if error_output:
-                self.logger.error(f"SQM configuration error: {error_output}")
-                return False
-            
-            self.logger.info(f"SQM upload rate set to {rate_kbps} kbps")
-            return True
+            return self.sqm.set_rate(rate_kbps)
             
         except Exception as e:
             self.logger.error(f"Failed to set SQM upload rate: {e}")
             return False
     
-    def __del__(self):
-        """Clean up connections."""
-        if self.ssh_client:
-            self.ssh_client.close()
+    def apply_client_limits(self, limits_mbps: Dict[str, float], source_ip: str) -> bool:
+        """
+        Shape upload towards individual client IPs on the router.
+        
+        Args:
+            limits_mbps: Upload ceiling in Mbps keyed by client IP
+            source_ip: LAN IP of the Jellyfin server
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        if not self.config.use_ssh:
+            self.logger.warning("Client shaping requires SSH access")
+            return False
+        return self.shaper.apply(limits_mbps, source_ip)
+    
+    def clear_client_limits(self) -> bool:
+        """Remove all per-client shaping from the router."""
+        if not self.config.use_ssh:
+            return True
+        return self.shaper.clear()
+    
+    def close(self):
+        """
+        Save any pending SQM rate to UCI and close the router connections.
+
+        Call once on shutdown; the client is not usable afterwards.
+        """
+        if self.config.use_ssh:
+            try:
+                self.sqm.flush()
+            except Exception as e:
+                self.logger.error(f"Failed to save SQM rate on shutdown: {e}")
+        self.stop_telemetry()
+        self.ssh.close()
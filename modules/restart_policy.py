@@ -0,0 +1,60 @@
+"""
+Decide whether a limit change needs a stream restart at all.
+"""
+
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+from .stream_session import StreamSession
+
+# Bitrates offered by the Jellyfin clients' quality menu, in Mbps
+DEFAULT_QUALITY_LADDER = (
+    120, 110, 100, 90, 80, 70, 60, 50, 40, 30, 20, 15, 10, 8, 6, 4, 3, 1.5, 0.72, 0.42
+)
+
+
+def quality_rung(limit_bps: float, ladder_mbps: Sequence[float]) -> float:
+    """Highest ladder bitrate (bps) a client picks under ``limit_bps``."""
+    fitting = [rung * 1_000_000 for rung in ladder_mbps if rung * 1_000_000 <= limit_bps]
+    return max(fitting) if fitting else 0
+
+
+def restart_needed(session: Union[StreamSession, Dict[str, Any]], old_bps: int, new_bps: int,
+                   ladder_mbps: Optional[Sequence[float]] = None) -> Tuple[bool, str]:
+    """
+    Decide whether a playing session must restart to honour ``new_bps``.
+
+    A lowered limit needs a restart only if the running stream is above
+    it. A raised limit needs one only if the client would pick a higher
+    quality rung than under the old limit, which never happens for a
+    stream that already plays the source quality. Sessions whose bitrate
+    is unknown are always restarted.
+
+    Args:
+        session: Session record or raw session data
+        old_bps: Previous limit in bps (0 = unlimited)
+        new_bps: New limit in bps
+        ladder_mbps: Quality ladder; defaults to the Jellyfin client ladder
+
+    Returns:
+        Tuple of (restart needed, reason)
+    """
+    session = StreamSession.coerce(session)
+    current = session.bitrate
+    if not current:
+        return True, "stream bitrate unknown"
+
+    if new_bps < current:
+        return True, f"stream at {current / 1_000_000:.2f} Mbps exceeds the new limit"
+
+    if old_bps and new_bps > old_bps and session.transcodes:
+        source = session.source_bitrate or float('inf')
+        ladder = ladder_mbps or DEFAULT_QUALITY_LADDER
+        old_rung = quality_rung(min(old_bps, source), ladder)
+        new_rung = quality_rung(min(new_bps, source), ladder)
+        if new_bps >= source and old_bps < source:
+            return True, "raised limit allows the source quality"
+        if new_rung > old_rung:
+            return True, f"raised limit allows {new_rung / 1_000_000:g} Mbps quality"
+        return False, "raised limit keeps the same quality"
+
+    return False, f"stream at {current / 1_000_000:.2f} Mbps already fits"
@@ -0,0 +1,289 @@
+"""
+Concurrent, non-blocking stream restarts.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from .stream_session import StreamSession
+
+if TYPE_CHECKING:
+    from .jellyfin_client import JellyfinClient
+
+
+@dataclass
+class RestartResult:
+    """Outcome of one stream restart."""
+    session_id: str
+    user_id: Optional[str]
+    success: bool
+    latency: float  # seconds from submission to completion
+    error: Optional[str] = None
+
+
+class RestartOrchestrator:
+    """
+    Run stream restarts (Stop, delay, PlayNow) in the background.
+
+    HTTP requests run on a bounded worker pool; the delay between Stop and
+    PlayNow is a timer, so it occupies no worker and never blocks the
+    caller. Every restart has a deadline: once it has passed, a pending
+    PlayNow is abandoned and the restart is reported as failed. A session
+    that already has a restart in flight is not restarted twice.
+    """
+
+    def __init__(self, client: 'JellyfinClient', max_concurrent: int = 4,
+                 delay: float = 0.8, deadline: float = 10.0, history: int = 100):
+        """
+        Initialize the orchestrator.
+
+        Args:
+            client: Jellyfin client used to send Stop and PlayNow
+            max_concurrent: Maximum number of concurrent HTTP requests
+            delay: Seconds between Stop and PlayNow for each session
+            deadline: Seconds after submission by which a restart must finish
+            history: Number of recent results kept in ``results``
+        """
+        self.client = client
+        self.delay = delay
+        self.deadline = deadline
+        self.logger = logging.getLogger('jellydemon.restarts')
+        self.results: Deque[RestartResult] = deque(maxlen=history)
+        self.succeeded = 0
+        self.failed = 0
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrent, thread_name_prefix='jellydemon-restart'
+        )
+        self._pending: Dict[str, Future] = {}
+        self._timers: Dict[str, threading.Timer] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, session: Union[StreamSession, Dict[str, Any]]) -> 'Future[RestartResult]':
+        """
+        Schedule a restart of ``session`` and return immediately.
+
+        Returns:
+            Future resolving to the RestartResult
+        """
+        future: Future = Future()
+        plan = self.client.restart_plan(session)
+        if plan is None:
+            record = StreamSession.coerce(session)
+            future.set_result(RestartResult(
+                record.id, record.user_id, False, 0.0, "missing session data"
+            ))
+            return future
+
+        session_id = plan['session_id']
+        with self._lock:
+            if session_id in self._pending:
+                return self._pending[session_id]
+            if self._closed:
+                future.set_result(RestartResult(
+                    session_id, plan['user_id'], False, 0.0, "orchestrator closed"
+                ))
+                return future
+            self._pending[session_id] = future
+
+        started = time.monotonic()
+        self._pool.submit(self._stop, plan, future, started)
+        return future
+
+    def _remaining(self, started: float) -> float:
+        return started + self.deadline - time.monotonic()
+
+    def _stop(self, plan: Dict[str, Any], future: Future, started: float):
+        try:
+            self.client.stop_playback(plan['session_id'], timeout=max(self._remaining(started), 0.1))
+        except Exception as e:
+            self._finish(plan, future, started, False, f"stop failed: {e}")
+            return
+
+        timer = threading.Timer(self.delay, self._schedule_play, args=(plan, future, started))
+        timer.daemon = True
+        with self._lock:
+            self._timers[plan['session_id']] = timer
+        timer.start()
+
+    def _schedule_play(self, plan: Dict[str, Any], future: Future, started: float):
+        with self._lock:
+            self._timers.pop(plan['session_id'], None)
+        try:
+            self._pool.submit(self._play, plan, future, started)
+        except RuntimeError:
+            self._finish(plan, future, started, False, "orchestrator closed")
+
+    def _play(self, plan: Dict[str, Any], future: Future, started: float):
+        remaining = self._remaining(started)
+        if remaining <= 0:
+            self._finish(plan, future, started, False, "deadline exceeded")
+            return
+        try:
+            ok = self.client.resume_playback(plan['session_id'], plan['params'], timeout=remaining)
+        except Exception as e:
+            self._finish(plan, future, started, False, f"resume failed: {e}")
+            return
+        self._finish(plan, future, started, ok, None if ok else "resume rejected")
+
+    def _finish(self, plan: Dict[str, Any], future: Future, started: float,
+                success: bool, error: Optional[str]):
+        result = RestartResult(
+            plan['session_id'], plan['user_id'], success, time.monotonic() - started, error
+        )
+        with self._lock:
+            self._pending.pop(plan['session_id'], None)
+            self.results.append(result)
+            if success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+        if success:
+            self.logger.info(
+                f"Restarted stream for user {result.user_id} (session {result.session_id}) "
+                f"in {result.latency:.2f}s"
+            )
+        else:
+            self.logger.error(
+                f"Restart of session {result.session_id} failed after "
+                f"{result.latency:.2f}s: {error}"
+            )
+        future.set_result(result)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of restarts that have not finished yet."""
+        with self._lock:
+            return len(self._pending)
+
+    def wait(self, timeout: Optional[float] = None) -> List[RestartResult]:
+        """Wait for the restarts currently in flight and return their results."""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures, timeout)
+        return [f.result() for f in futures if f.done()]
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Let in-flight restarts finish (up to ``timeout``) and stop the pool."""
+        with self._lock:
+            self._closed = True
+        self.wait(self.deadline if timeout is None else timeout)
+        with self._lock:
+            timers = list(self._timers.values())
+            self._timers.clear()
+        for timer in timers:
+            timer.cancel()
+        self._pool.shutdown(wait=False)
+
+
+class RestartScheduler:
+    """
+    Stagger stream restarts so bulk limit changes do not stampede ffmpeg.
+
+    Limit changes queue a restart instead of running it. ``dispatch()``
+    (once per cycle) restarts the queued sessions that free the most
+    bandwidth first, at most ``max_per_cycle`` of them, and skips restarts
+    that would push the number of running transcodes past
+    ``max_transcodes``. The rest wait for later cycles. Queued sessions
+    that stopped playing or moved to another item are dropped; the others
+    restart from their current position.
+    """
+
+    def __init__(self, restart: Callable[[StreamSession], Any],
+                 max_per_cycle: int = 0, max_transcodes: int = 0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            restart: Restarts one session (inline or in the background)
+            max_per_cycle: Maximum restarts per dispatch (0 = no limit)
+            max_transcodes: Maximum concurrent transcodes, counting
+                restarts still in flight (0 = no limit)
+        """
+        self.restart = restart
+        self.max_per_cycle = max_per_cycle
+        self.max_transcodes = max_transcodes
+        self.logger = logging.getLogger('jellydemon.restarts')
+        self.dispatched = 0
+        self.dropped = 0
+        # session_id -> (session, bandwidth freed in bps)
+        self._queue: Dict[str, Tuple[StreamSession, float]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, session: Union[StreamSession, Dict[str, Any]], freed_bps: float):
+        """Queue a restart; a newer request for the same session replaces it."""
+        session = StreamSession.coerce(session)
+        with self._lock:
+            self._queue[session.id] = (session, freed_bps)
+
+    @property
+    def pending(self) -> int:
+        """Number of queued restarts."""
+        with self._lock:
+            return len(self._queue)
+
+    def dispatch(self, sessions: List[Union[StreamSession, Dict[str, Any]]],
+                 in_flight: int = 0) -> List[str]:
+        """
+        Restart as many queued sessions as the transcoder budget allows.
+
+        Args:
+            sessions: Current sessions, used for transcoder load and positions
+            in_flight: Restarts started earlier that have not finished yet
+
+        Returns:
+            Ids of the sessions that were restarted
+        """
+        with self._lock:
+            if not self._queue:
+                return []
+            sessions = [StreamSession.coerce(s) for s in sessions]
+            current = {s.id: s for s in sessions}
+            ready = []
+            for session_id, (queued, freed) in list(self._queue.items()):
+                live = current.get(session_id)
+                if not live or not live.playing or live.item_id != queued.item_id:
+                    # Stopped or changed item: the new stream already uses the new limit
+                    del self._queue[session_id]
+                    self.dropped += 1
+                    continue
+                ready.append((freed, session_id, live))
+
+            # Transcodes running now; restarts in flight have no
+            # TranscodingInfo while stopped but will transcode again
+            load = sum(1 for s in sessions if s.transcodes) + in_flight
+            ready.sort(key=lambda entry: entry[0], reverse=True)
+            chosen = []
+            for entry in ready:
+                if self.max_per_cycle > 0 and len(chosen) >= self.max_per_cycle:
+                    break
+                # Restarting a transcode replaces it; anything else adds one
+                adds = 0 if entry[2].transcodes else 1
+                if self.max_transcodes > 0 and adds and load >= self.max_transcodes:
+                    continue
+                load += adds
+                chosen.append(entry)
+            for _, session_id, _ in chosen:
+                del self._queue[session_id]
+            remaining = len(self._queue)
+
+        for _, _, session in chosen:
+            self.restart(session)
+        self.dispatched += len(chosen)
+        if chosen or remaining:
+            self.logger.info(
+                f"Dispatched {len(chosen)} stream restart(s), {remaining} deferred"
+            )
+        return [session_id for _, session_id, _ in chosen]
+
+    def clear(self):
+        """Drop every queued restart."""
+        with self._lock:
+            self._queue.clear()
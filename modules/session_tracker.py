@@ -0,0 +1,241 @@
+"""
+Push-based Jellyfin session tracking over the server WebSocket.
+"""
+
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+from .stream_session import SessionDiff, StreamSession, diff_sessions, index_sessions
+
+try:
+    import websocket  # websocket-client
+except ImportError:  # optional dependency
+    websocket = None
+
+# Message types sent by the Jellyfin server that affect the user directory
+USER_CHANGE_MESSAGES = ("UserUpdated", "UserDeleted", "UserPolicyUpdated")
+
+
+class SessionTracker:
+    """
+    In-memory session table fed by the Jellyfin WebSocket.
+
+    After subscribing with ``SessionsStart`` the server pushes a ``Sessions``
+    message whenever sessions change. Each message is merged into the table
+    by session id, so only entries that actually changed are replaced.
+    While the socket is down ``sessions()`` returns None and callers fall
+    back to polling ``GET /Sessions``; the tracker reconnects with
+    exponential backoff in the background.
+    """
+
+    def __init__(self, base_url: str, api_key: str, interval_ms: int = 1500,
+                 on_change: Optional[Callable[[], None]] = None,
+                 on_user_change: Optional[Callable[[], None]] = None,
+                 on_playback_change: Optional[Callable[[], None]] = None,
+                 min_backoff: float = 1.0, max_backoff: float = 60.0,
+                 connect_timeout: float = 10.0):
+        """
+        Initialize the tracker (no connection is made yet).
+
+        Args:
+            base_url: Jellyfin base URL (http or https)
+            api_key: Jellyfin API key
+            interval_ms: Update interval requested with ``SessionsStart``
+            on_change: Called from the reader thread when the table changed
+            on_user_change: Called when the server reports a user change
+            on_playback_change: Called when a stream starts, stops, pauses
+                or resumes (not on mere progress updates)
+            min_backoff: Initial reconnect delay in seconds
+            max_backoff: Maximum reconnect delay in seconds
+            connect_timeout: Socket connect timeout in seconds
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.interval_ms = interval_ms
+        self.on_change = on_change
+        self.on_user_change = on_user_change
+        self.on_playback_change = on_playback_change
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.logger = logging.getLogger('jellydemon.sessions')
+
+        self.connects = 0
+        self.messages = 0
+        self.version = 0  # bumped on every change to the table
+        self.keepalive_interval = 30.0
+
+        self._table: Dict[str, Dict[str, Any]] = {}
+        # Parsed snapshot of the table, diffed to spot playback changes
+        self._records: Dict[str, StreamSession] = {}
+        self._live = False
+        self._ws = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """WebSocket URL derived from the HTTP base URL."""
+        parts = urlsplit(self.base_url)
+        scheme = "wss" if parts.scheme == "https" else "ws"
+        query = urlencode({"api_key": self.api_key, "deviceId": "jellydemon"})
+        return f"{scheme}://{parts.netloc}/socket?{query}"
+
+    @property
+    def live(self) -> bool:
+        """Whether the table is currently fed by a connected socket."""
+        return self._live
+
+    def start(self) -> bool:
+        """Start the reader thread; returns False if WebSockets are unavailable."""
+        if websocket is None:
+            self.logger.warning(
+                "websocket-client is not installed, falling back to session polling"
+            )
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='jellydemon-sessions', daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the reader thread and close the socket."""
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            # Wake the reader thread; it closes the socket itself
+            ws.abort()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def sessions(self) -> Optional[List[Dict[str, Any]]]:
+        """Current sessions, or None if the socket is not live."""
+        with self._lock:
+            if not self._live:
+                return None
+            return list(self._table.values())
+
+    def _close(self):
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            try:
+                ws.close(timeout=1)
+            except Exception:
+                pass
+
+    def _set_offline(self):
+        with self._lock:
+            self._live = False
+
+    def _run(self):
+        """Keep a subscribed socket open until stopped."""
+        backoff = self.min_backoff
+        while not self._stop.is_set():
+            try:
+                self._ws = websocket.create_connection(self.url, timeout=self.connect_timeout)
+                self.connects += 1
+                self._send("SessionsStart", f"0,{self.interval_ms}")
+                self.logger.debug("Session WebSocket connected")
+                if self._consume(self._ws):
+                    backoff = self.min_backoff
+                if not self._stop.is_set():
+                    self.logger.warning("Session WebSocket closed, polling until it reconnects")
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.logger.warning(f"Session WebSocket error: {e}")
+            finally:
+                self._set_offline()
+                self._close()
+
+            if self._stop.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _send(self, message_type: str, data: Any = None):
+        message = {"MessageType": message_type}
+        if data is not None:
+            message["Data"] = data
+        self._ws.send(json.dumps(message))
+
+    def _consume(self, ws) -> bool:
+        """Handle messages until the socket closes; True if any session list arrived."""
+        received = False
+        ws.settimeout(self.keepalive_interval)
+        while not self._stop.is_set():
+            try:
+                raw = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                self._send("KeepAlive")
+                continue
+            if not raw:
+                break
+
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            self.messages += 1
+            message_type = message.get("MessageType")
+            if message_type == "Sessions":
+                self._apply(message.get("Data") or [])
+                received = True
+            elif message_type == "ForceKeepAlive":
+                # Data is the server's timeout in seconds; answer well within it
+                self.keepalive_interval = max(float(message.get("Data") or 60) / 2, 1.0)
+                ws.settimeout(self.keepalive_interval)
+                self._send("KeepAlive")
+            elif message_type in USER_CHANGE_MESSAGES and self.on_user_change:
+                self.on_user_change()
+        return received
+
+    def _apply(self, sessions: List[Dict[str, Any]]):
+        """Merge a full session list into the table by session id."""
+        changed = 0
+        with self._lock:
+            seen = set()
+            for session in sessions:
+                session_id = session.get("Id")
+                if session_id is None:
+                    continue
+                seen.add(session_id)
+                if self._table.get(session_id) != session:
+                    self._table[session_id] = session
+                    changed += 1
+            for session_id in set(self._table) - seen:
+                del self._table[session_id]
+                changed += 1
+            self._live = True
+            if changed:
+                self.version += 1
+            playback_changed = False
+            if changed:
+                records = index_sessions(map(StreamSession.from_dict, self._table.values()))
+                playback_changed = self.playback_changed(diff_sessions(self._records, records))
+                self._records = records
+
+        if changed:
+            self.logger.debug(f"Session table updated ({changed} changed, {len(seen)} total)")
+            if self.on_change:
+                self.on_change()
+        if playback_changed and self.on_playback_change:
+            self.on_playback_change()
+
+    @staticmethod
+    def playback_changed(diff: SessionDiff) -> bool:
+        """Whether a stream started, stopped, paused, resumed or switched item."""
+        if any(s.playing for s in diff.started) or any(s.playing for s in diff.stopped):
+            return True
+        return any(
+            old.item_id != new.item_id or (new.playing and old.is_paused != new.is_paused)
+            for old, new in diff.changed
+        )
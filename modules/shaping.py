@@ -0,0 +1,168 @@
+"""
+Per-client upload shaping on the router.
+
+Traffic from the Jellyfin server enters the router on the LAN device. Its
+ingress is redirected to an IFB device whose HTB root holds one class per
+external client IP (keyed on destination address), each with its own
+ceiling and an fq_codel leaf. Traffic to other destinations falls into an
+unlimited default class. Limits can then be moved continuously with
+``tc class change`` without touching Jellyfin sessions.
+"""
+
+import ipaddress
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Class/filter numbering: 1:1 is the unlimited default class, clients start here
+_FIRST_CLIENT_MINOR = 0x10
+_DEFAULT_MINOR = 0x1
+_REDIRECT_PREF = 10
+_UNLIMITED = "10gbit"
+
+
+class ClientShaper:
+    """Maintains one HTB class per shaped client IP on an IFB device."""
+
+    def __init__(self, execute: Callable[[str], Tuple[str, str]],
+                 lan_device: str = "br-lan", ifb_device: str = "ifb-jd"):
+        """
+        Initialize the shaper (nothing is changed on the router yet).
+
+        Args:
+            execute: Runs a shell command on the router, returning (stdout, stderr)
+            lan_device: Router device the Jellyfin server is connected to
+            ifb_device: Name of the IFB device created for shaping
+        """
+        self.execute = execute
+        self.lan_device = lan_device
+        self.ifb_device = ifb_device
+        self.logger = logging.getLogger('jellydemon.shaping')
+
+        self.source_ip: Optional[str] = None
+        self._classes: Dict[str, Tuple[int, int]] = {}  # ip -> (minor, kbit)
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """Whether the IFB redirect is set up."""
+        return self.source_ip is not None
+
+    def limits(self) -> Dict[str, int]:
+        """Currently applied ceilings in kbit/s, keyed by client IP."""
+        return {ip: kbit for ip, (_, kbit) in self._classes.items()}
+
+    def _setup_commands(self, source_ip: str) -> List[str]:
+        ifb, lan = self.ifb_device, self.lan_device
+        match = self._match('src', source_ip)
+        return [
+            f"ip link add {ifb} type ifb 2>/dev/null",
+            f"ip link set {ifb} up",
+            f"tc qdisc del dev {ifb} root 2>/dev/null",
+            f"tc qdisc add dev {ifb} root handle 1: htb default {_DEFAULT_MINOR:x}",
+            f"tc class add dev {ifb} parent 1: classid 1:{_DEFAULT_MINOR:x} htb rate {_UNLIMITED}",
+            f"tc qdisc add dev {lan} handle ffff: ingress 2>/dev/null",
+            f"tc filter del dev {lan} parent ffff: pref {_REDIRECT_PREF} 2>/dev/null",
+            f"tc filter add dev {lan} parent ffff: pref {_REDIRECT_PREF} {match} "
+            f"action mirred egress redirect dev {ifb}",
+        ]
+
+    @staticmethod
+    def _match(direction: str, ip: str) -> str:
+        """u32 match selecting packets by source or destination address."""
+        if ipaddress.ip_address(ip).version == 6:
+            return f"protocol ipv6 u32 match ip6 {direction} {ip}/128"
+        return f"protocol ip u32 match ip {direction} {ip}/32"
+
+    def apply(self, limits_mbps: Dict[str, float], source_ip: str) -> bool:
+        """
+        Enforce upload ceilings for the given client IPs.
+
+        Classes are added, changed or removed so that exactly the IPs in
+        ``limits_mbps`` are shaped; all changes go out in one round trip.
+
+        Args:
+            limits_mbps: Ceiling in Mbps keyed by client IP
+            source_ip: LAN IP of the Jellyfin server whose traffic is shaped
+
+        Returns:
+            True if the router accepted all changes
+        """
+        with self._lock:
+            commands = []
+            if self.source_ip != source_ip:
+                commands.extend(self._setup_commands(source_ip))
+                self._classes = {}
+
+            ifb = self.ifb_device
+            classes = dict(self._classes)
+            wanted = {ip: max(int(mbps * 1000), 8) for ip, mbps in limits_mbps.items()}
+
+            for ip in sorted(set(classes) - set(wanted)):
+                minor, _ = classes.pop(ip)
+                commands.append(f"tc filter del dev {ifb} parent 1: pref {minor}")
+                commands.append(f"tc class del dev {ifb} classid 1:{minor:x}")
+
+            for ip, kbit in sorted(wanted.items()):
+                rate = f"rate {kbit}kbit ceil {kbit}kbit"
+                if ip not in classes:
+                    minor = self._next_minor(classes)
+                    commands.append(f"tc class add dev {ifb} parent 1: classid 1:{minor:x} htb {rate}")
+                    commands.append(f"tc qdisc add dev {ifb} parent 1:{minor:x} fq_codel")
+                    commands.append(
+                        f"tc filter add dev {ifb} parent 1: pref {minor} "
+                        f"{self._match('dst', ip)} flowid 1:{minor:x}"
+                    )
+                elif classes[ip][1] != kbit:
+                    minor = classes[ip][0]
+                    commands.append(f"tc class change dev {ifb} parent 1: classid 1:{minor:x} htb {rate}")
+                else:
+                    continue
+                classes[ip] = (minor, kbit)
+
+            if not commands:
+                return True
+
+            try:
+                _, error_output = self.execute("\n".join(commands))
+            except Exception as e:
+                self.logger.error(f"Failed to apply client shaping: {e}")
+                return False
+            if error_output:
+                # State on the router is unknown now - rebuild from scratch next time
+                self.logger.error(f"Client shaping error: {error_output.strip()}")
+                self.source_ip = None
+                self._classes = {}
+                return False
+
+            self.source_ip = source_ip
+            self._classes = classes
+            self.logger.debug(f"Client shaping updated: {self.limits()}")
+            return True
+
+    @staticmethod
+    def _next_minor(classes: Dict[str, Tuple[int, int]]) -> int:
+        used = {minor for minor, _ in classes.values()}
+        minor = _FIRST_CLIENT_MINOR
+        while minor in used:
+            minor += 1
+        return minor
+
+    def clear(self) -> bool:
+        """Remove the redirect, the IFB device and all client classes."""
+        with self._lock:
+            if not self.active:
+                return True
+            try:
+                self.execute(
+                    f"tc filter del dev {self.lan_device} parent ffff: pref {_REDIRECT_PREF} 2>/dev/null\n"
+                    f"tc qdisc del dev {self.ifb_device} root 2>/dev/null\n"
+                    f"ip link del {self.ifb_device} 2>/dev/null"
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to clear client shaping: {e}")
+                return False
+            self.source_ip = None
+            self._classes = {}
+            self.logger.info("Client shaping removed")
+            return True
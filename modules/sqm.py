@@ -0,0 +1,209 @@
+"""
+Live SQM shaper rate control.
+
+The shaper rate is changed in place with ``tc`` so queueing is never torn
+down; the UCI configuration is only written back on a slow, debounced
+schedule so the rate survives a router reboot.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+# Finds the SQM interface and prints its root qdisc in one round trip
+_DISCOVER_SCRIPT = """
+IF=$(uci -q get sqm.@queue[0].interface)
+echo "IF $IF"
+[ -n "$IF" ] && tc qdisc show dev "$IF"
+"""
+
+
+class SQMRateController:
+    """
+    Rate-limited, coalescing controller for the SQM upload rate.
+
+    ``set_rate`` may be called as often as wanted: changes arriving within
+    ``min_interval`` of the last applied change are coalesced and only the
+    newest rate is applied once the interval has passed. Cake and HTB
+    shapers are changed with ``tc ... change``; any other qdisc falls back
+    to a full SQM restart.
+    """
+
+    def __init__(self, execute: Callable[[str], Tuple[str, str]],
+                 min_interval: float = 2.0, persist_delay: float = 300.0):
+        """
+        Initialize the controller.
+
+        Args:
+            execute: Runs a shell command on the router, returning (stdout, stderr)
+            min_interval: Minimum seconds between two applied rate changes
+            persist_delay: Seconds to wait after a change before writing it to UCI
+        """
+        self.execute = execute
+        self.min_interval = min_interval
+        self.persist_delay = persist_delay
+        self.logger = logging.getLogger('jellydemon.sqm')
+
+        self.interface: Optional[str] = None
+        self.qdisc: Optional[str] = None
+        self.applied_kbps: Optional[int] = None
+        self.persisted_kbps: Optional[int] = None
+        self.changes = 0
+        self.coalesced = 0
+        self.restarts = 0
+        self.persists = 0
+
+        self._pending: Optional[int] = None
+        self._last_apply = 0.0
+        self._apply_timer: Optional[threading.Timer] = None
+        self._persist_timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    def discover(self) -> Optional[str]:
+        """Find the SQM interface and the kind of its root qdisc."""
+        stdout, _ = self.execute(_DISCOVER_SCRIPT)
+        interface, qdisc = None, None
+        for line in stdout.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[0] == 'IF':
+                interface = parts[1]
+            elif len(parts) >= 3 and parts[0] == 'qdisc' and 'root' in parts:
+                qdisc = parts[1]
+        self.interface, self.qdisc = interface, qdisc
+        self.logger.debug(f"SQM shaper: {qdisc or 'unknown'} on {interface or 'unknown'}")
+        return qdisc
+
+    def set_rate(self, rate_kbps: int) -> bool:
+        """
+        Request a new upload rate.
+
+        Returns:
+            False if an immediate change failed, True otherwise (including
+            when the change was deferred)
+        """
+        rate_kbps = int(rate_kbps)
+        with self._lock:
+            if self._apply_timer is not None:
+                # A deferred change is already scheduled - just replace its rate
+                self._pending = rate_kbps
+                self.coalesced += 1
+                return True
+            if rate_kbps == self.applied_kbps:
+                return True
+
+            wait = self._last_apply + self.min_interval - time.monotonic()
+            if wait > 0:
+                self._pending = rate_kbps
+                self._apply_timer = threading.Timer(wait, self._apply_pending)
+                self._apply_timer.daemon = True
+                self._apply_timer.start()
+                return True
+            return self._apply(rate_kbps)
+
+    def _apply_pending(self):
+        with self._lock:
+            self._apply_timer = None
+            rate_kbps, self._pending = self._pending, None
+            if rate_kbps is not None and rate_kbps != self.applied_kbps:
+                self._apply(rate_kbps)
+
+    def _change_command(self, rate_kbps: int) -> Optional[str]:
+        """Build the in-place change command for the current shaper."""
+        if self.qdisc == 'cake':
+            return f"tc qdisc change dev {self.interface} root cake bandwidth {rate_kbps}kbit"
+        if self.qdisc == 'htb':
+            # simple.qos puts the whole link rate on class 1:1
+            return (f"tc class change dev {self.interface} parent 1: classid 1:1 "
+                    f"htb rate {rate_kbps}kbit ceil {rate_kbps}kbit")
+        return None
+
+    def _apply(self, rate_kbps: int) -> bool:
+        """Apply ``rate_kbps`` now. Must be called with the lock held."""
+        try:
+            if self.qdisc is None:
+                self.discover()
+
+            cmd = self._change_command(rate_kbps)
+            if cmd is None:
+                return self._restart(rate_kbps)
+
+            _, error_output = self.execute(cmd)
+            if error_output:
+                # The shaper may have been rebuilt behind our back
+                self.logger.error(f"SQM rate change error: {error_output.strip()}")
+                self.qdisc = None
+                return False
+        except Exception as e:
+            self.logger.error(f"Failed to change SQM rate: {e}")
+            return False
+
+        self._applied(rate_kbps)
+        self._schedule_persist()
+        self.logger.info(f"SQM upload rate changed to {rate_kbps} kbps ({self.qdisc})")
+        return True
+
+    def _restart(self, rate_kbps: int) -> bool:
+        """Fallback for shapers without an in-place change: write UCI and restart."""
+        cmd = f"""
+        uci set sqm.@queue[0].upload={rate_kbps}
+        uci commit sqm
+        /etc/init.d/sqm restart
+        """
+        _, error_output = self.execute(cmd)
+        if error_output:
+            self.logger.error(f"SQM configuration error: {error_output}")
+            return False
+
+        self.restarts += 1
+        self.persisted_kbps = rate_kbps
+        self.qdisc = None  # re-discover the rebuilt shaper next time
+        self._applied(rate_kbps)
+        self.logger.info(f"SQM upload rate set to {rate_kbps} kbps (restart)")
+        return True
+
+    def _applied(self, rate_kbps: int):
+        self.applied_kbps = rate_kbps
+        self._last_apply = time.monotonic()
+        self.changes += 1
+
+    def _schedule_persist(self):
+        if self._persist_timer is not None:
+            return
+        self._persist_timer = threading.Timer(self.persist_delay, self.persist)
+        self._persist_timer.daemon = True
+        self._persist_timer.start()
+
+    def persist(self) -> bool:
+        """Write the applied rate to UCI without restarting SQM."""
+        with self._lock:
+            self._persist_timer = None
+            rate_kbps = self.applied_kbps
+            if rate_kbps is None or rate_kbps == self.persisted_kbps:
+                return True
+            try:
+                _, error_output = self.execute(
+                    f"uci set sqm.@queue[0].upload={rate_kbps} && uci commit sqm"
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to persist SQM rate: {e}")
+                return False
+            if error_output:
+                self.logger.error(f"SQM persist error: {error_output}")
+                return False
+
+            self.persisted_kbps = rate_kbps
+            self.persists += 1
+            self.logger.debug(f"SQM upload rate {rate_kbps} kbps saved to UCI")
+            return True
+
+    def flush(self):
+        """Apply any deferred change and persist immediately."""
+        with self._lock:
+            for timer in (self._apply_timer, self._persist_timer):
+                if timer is not None:
+                    timer.cancel()
+            if self._apply_timer is not None:
+                self._apply_pending()
+            self._persist_timer = None
+            self.persist()
@@ -0,0 +1,252 @@
+"""
+Managed SSH transport with keepalives and automatic reconnects.
+"""
+
+import logging
+import random
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import paramiko
+
+# Errors that mean the connection itself is gone, not that a command failed
+_CONNECTION_ERRORS = (paramiko.SSHException, socket.error, EOFError)
+
+
+class SSHTransport:
+    """
+    One authenticated SSH connection shared by every command.
+
+    Before each use the transport is checked for liveness; a dead connection
+    is re-established with exponential backoff and jitter. While backing off,
+    callers fail fast instead of waiting on connect timeouts, which keeps
+    cycle latency stable while the router is rebooting. Commands open their
+    own channel on the shared transport, so several can run concurrently.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 connect_timeout: float = 10, keepalive: int = 15,
+                 min_backoff: float = 1.0, max_backoff: float = 60.0,
+                 command_timeout: Optional[float] = 30.0,
+                 client_factory: Callable[[], paramiko.SSHClient] = paramiko.SSHClient):
+        """
+        Initialize the transport (no connection is made yet).
+
+        Args:
+            host: Router hostname or IP
+            port: SSH port
+            username: SSH user
+            password: SSH password
+            connect_timeout: TCP/auth timeout in seconds
+            keepalive: Seconds between transport keepalive packets
+            min_backoff: Delay after the first failed connect, in seconds
+            max_backoff: Upper bound for the reconnect delay, in seconds
+            command_timeout: Default seconds a command may wait on its
+                channel (None to wait forever)
+            client_factory: Callable creating the underlying SSH client
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.command_timeout = command_timeout
+        self.client_factory = client_factory
+        self.logger = logging.getLogger('jellydemon.ssh')
+
+        self.connects = 0
+        self.failures = 0
+        self.last_connect_latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+        self._client: Optional[paramiko.SSHClient] = None
+        self._consecutive_failures = 0
+        self._next_attempt = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def reconnects(self) -> int:
+        """Number of successful connects after the first one."""
+        return max(self.connects - 1, 0)
+
+    def is_alive(self) -> bool:
+        """Check whether the current transport is usable."""
+        client = self._client
+        if client is None:
+            return False
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            # Cheap probe that fails immediately on a dead socket
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def connect(self) -> paramiko.SSHClient:
+        """Return a live client, reconnecting if necessary."""
+        with self._lock:
+            if self.is_alive():
+                return self._client
+
+            self._drop_locked()
+            now = time.monotonic()
+            if now < self._next_attempt:
+                raise ConnectionError(
+                    f"SSH reconnect to {self.host} backing off for "
+                    f"{self._next_attempt - now:.1f}s"
+                )
+
+            start = time.monotonic()
+            client = self.client_factory()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                client.connect(
+                    hostname=self.host,
+                    port=self.port,
+                    username=self.username,
+                    password=self.password,
+                    timeout=self.connect_timeout,
+                    banner_timeout=self.connect_timeout,
+                    auth_timeout=self.connect_timeout
+                )
+            except Exception as e:
+                client.close()
+                self._record_failure(e)
+                raise
+
+            transport = client.get_transport()
+            if transport is not None and self.keepalive:
+                transport.set_keepalive(self.keepalive)
+
+            self._client = client
+            self.connects += 1
+            self._consecutive_failures = 0
+            self._next_attempt = 0.0
+            self.last_connect_latency = time.monotonic() - start
+            if self.connects > 1:
+                self.logger.info(
+                    f"SSH connection to {self.host} re-established "
+                    f"in {self.last_connect_latency:.2f}s (reconnect #{self.reconnects})"
+                )
+            else:
+                self.logger.debug("SSH connection established")
+            return client
+
+    def _record_failure(self, error: Exception):
+        """Schedule the next connect attempt with exponential backoff and jitter."""
+        self.failures += 1
+        self._consecutive_failures += 1
+        self.last_error = str(error)
+        delay = min(self.min_backoff * 2 ** (self._consecutive_failures - 1), self.max_backoff)
+        delay *= random.uniform(0.5, 1.0)
+        self._next_attempt = time.monotonic() + delay
+        self.logger.warning(f"SSH connect to {self.host} failed ({error}), retrying in {delay:.1f}s")
+
+    def _drop_locked(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    def mark_dead(self):
+        """Discard the current connection so the next use reconnects."""
+        with self._lock:
+            self._drop_locked()
+
+    def exec(self, cmd: str, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """
+        Run a command in a new channel on the shared transport.
+
+        A command that fails because the connection dropped is retried once
+        on a fresh connection. A command that times out is not retried, but
+        the connection is dropped so a wedged transport is replaced.
+
+        Args:
+            cmd: Shell command
+            timeout: Seconds to wait on the channel (defaults to
+                ``command_timeout``)
+
+        Returns:
+            Tuple of (stdout, stderr)
+
+        Raises:
+            socket.timeout: If the command timed out
+        """
+        if timeout is None:
+            timeout = self.command_timeout
+        client = self.connect()
+        try:
+            return self._exec_on(client, cmd, timeout)
+        except socket.timeout:
+            self.logger.warning(
+                f"SSH command timed out after {timeout}s, reconnecting to {self.host}"
+            )
+            self.mark_dead()
+            raise
+        except _CONNECTION_ERRORS as e:
+            self.logger.debug(f"SSH command failed on dead connection, retrying: {e}")
+            self.mark_dead()
+        return self._exec_on(self.connect(), cmd, timeout)
+
+    def _exec_on(self, client: paramiko.SSHClient, cmd: str,
+                 timeout: Optional[float]) -> Tuple[str, str]:
+        stdin, stdout, stderr = client.exec_command(cmd, timeout=timeout)
+        return stdout.read().decode(), stderr.read().decode()
+
+    def open_stream(self, cmd: str) -> 'SSHCommandStream':
+        """Start a long-running command and return a stream of its output lines."""
+        client = self.connect()
+        try:
+            stdin, stdout, stderr = client.exec_command(cmd)
+        except _CONNECTION_ERRORS:
+            self.mark_dead()
+            raise
+        return SSHCommandStream(stdout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection statistics."""
+        return {
+            'connected': self.is_alive(),
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+            'last_connect_latency': self.last_connect_latency,
+            'last_error': self.last_error,
+        }
+
+    def close(self):
+        """Close the connection."""
+        self.mark_dead()
+
+
+class SSHCommandStream:
+    """
+    Output lines of a long-running remote command.
+
+    Closing the stream closes its SSH channel, not just the file wrapping
+    it, so the channel is released and the remote command dies of SIGPIPE
+    on its next write.
+    """
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.channel = stdout.channel
+
+    def __iter__(self):
+        return iter(self.stdout)
+
+    def close(self):
+        """Close the channel and with it the remote command."""
+        try:
+            self.channel.close()
+        finally:
+            self.stdout.close()
@@ -0,0 +1,191 @@
+"""
+Compact session records and snapshot diffing.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+
+def endpoint_ip(endpoint: str) -> str:
+    """Client IP of a ``RemoteEndPoint`` (``ip:port``, ``[v6]:port`` or bare)."""
+    if endpoint.startswith('['):
+        return endpoint[1:endpoint.find(']')]
+    if endpoint.count(':') == 1:
+        return endpoint.split(':')[0]
+    return endpoint
+
+
+class StreamSession:
+    """
+    The fields of a Jellyfin session the daemon uses, parsed in one pass.
+
+    Slotted, so a record costs a fraction of the raw session JSON (which
+    embeds the whole item, its media sources and streams). Records compare
+    equal when nothing but the playback position differs.
+    """
+
+    __slots__ = (
+        'id', 'user_id', 'endpoint', 'ip', 'client', 'app_version', 'remote_control',
+        'supported_commands', 'item_id', 'media_source_id', 'position_ticks',
+        'is_paused', 'source_bitrate', 'transcoding', 'transcode_bitrate',
+        'video_direct', 'audio_direct', 'video_height',
+    )
+
+    def __init__(self, id: Optional[str] = None, user_id: Optional[str] = None,
+                 endpoint: str = '', client: str = '', app_version: str = '',
+                 remote_control: bool = True,
+                 supported_commands: Optional[Tuple[str, ...]] = None,
+                 item_id: Optional[str] = None, media_source_id: Optional[str] = None,
+                 position_ticks: int = 0, is_paused: bool = False,
+                 source_bitrate: Optional[int] = None, transcoding: bool = False,
+                 transcode_bitrate: Optional[int] = None, video_direct: bool = False,
+                 audio_direct: bool = False, video_height: Optional[int] = None):
+        self.id = id
+        self.user_id = user_id
+        self.endpoint = endpoint
+        self.ip = endpoint_ip(endpoint)
+        self.client = client
+        self.app_version = app_version
+        self.remote_control = remote_control
+        self.supported_commands = supported_commands
+        self.item_id = item_id
+        self.media_source_id = media_source_id
+        self.position_ticks = position_ticks
+        self.is_paused = is_paused
+        self.source_bitrate = source_bitrate
+        self.transcoding = transcoding
+        self.transcode_bitrate = transcode_bitrate
+        self.video_direct = video_direct
+        self.audio_direct = audio_direct
+        self.video_height = video_height
+
+    @classmethod
+    def from_dict(cls, session: Dict[str, Any]) -> 'StreamSession':
+        """Parse a raw session DTO from ``/Sessions`` or the WebSocket."""
+        now_playing = session.get('NowPlayingItem') or {}
+        play_state = session.get('PlayState') or {}
+        transcoding = session.get('TranscodingInfo') or {}
+        capabilities = session.get('Capabilities')
+
+        sources = now_playing.get('MediaSources') or []
+        source_id = play_state.get('MediaSourceId')
+        source = next((s for s in sources if s.get('Id') == source_id), None)
+        if source is None and sources:
+            source = sources[0]
+        source = source or {}
+
+        height = None
+        for stream in now_playing.get('MediaStreams') or source.get('MediaStreams') or []:
+            if stream.get('Type') == 'Video':
+                height = stream.get('Height')
+                break
+
+        commands = None
+        if isinstance(capabilities, dict) and 'SupportedCommands' in capabilities:
+            commands = tuple(capabilities.get('SupportedCommands') or ())
+
+        return cls(
+            id=session.get('Id'),
+            user_id=session.get('UserId'),
+            endpoint=session.get('RemoteEndPoint') or '',
+            client=session.get('Client') or '',
+            app_version=session.get('ApplicationVersion') or '',
+            remote_control=session.get('SupportsRemoteControl', True) is not False,
+            supported_commands=commands,
+            item_id=now_playing.get('Id'),
+            media_source_id=source_id or source.get('Id'),
+            position_ticks=play_state.get('PositionTicks') or 0,
+            is_paused=bool(play_state.get('IsPaused')),
+            source_bitrate=source.get('Bitrate') or now_playing.get('Bitrate') or None,
+            transcoding=bool(transcoding),
+            transcode_bitrate=transcoding.get('Bitrate') or None,
+            video_direct=bool(transcoding.get('IsVideoDirect')),
+            audio_direct=bool(transcoding.get('IsAudioDirect')),
+            video_height=height,
+        )
+
+    @classmethod
+    def coerce(cls, session: Union['StreamSession', Dict[str, Any]]) -> 'StreamSession':
+        """Return ``session`` as a record, parsing it if it is a raw dict."""
+        if isinstance(session, cls):
+            return session
+        return cls.from_dict(session or {})
+
+    @property
+    def playing(self) -> bool:
+        """Whether an item is loaded in the session."""
+        return self.item_id is not None
+
+    @property
+    def transcodes(self) -> bool:
+        """Whether an ffmpeg transcode serves the session (remuxes do not count)."""
+        return self.transcoding and not (self.video_direct and self.audio_direct)
+
+    @property
+    def bitrate(self) -> Optional[int]:
+        """Bitrate the session streams at right now, in bps, if known."""
+        if self.transcoding:
+            return self.transcode_bitrate
+        return self.source_bitrate
+
+    @property
+    def client_key(self) -> str:
+        """Client app and version, e.g. ``Jellyfin Web/10.9.0``."""
+        return f"{self.client}/{self.app_version}"
+
+    def _state(self) -> tuple:
+        return tuple(
+            getattr(self, name) for name in self.__slots__ if name != 'position_ticks'
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, StreamSession):
+            return NotImplemented
+        return self._state() == other._state()
+
+    def __hash__(self) -> int:
+        return hash(self._state())
+
+    def __repr__(self) -> str:
+        return (
+            f"StreamSession(id={self.id!r}, user_id={self.user_id!r}, ip={self.ip!r}, "
+            f"item_id={self.item_id!r}, bitrate={self.bitrate!r})"
+        )
+
+
+@dataclass
+class SessionDiff:
+    """Sessions that started, stopped or changed between two snapshots."""
+    started: List[StreamSession] = field(default_factory=list)
+    stopped: List[StreamSession] = field(default_factory=list)
+    changed: List[Tuple[StreamSession, StreamSession]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.started or self.stopped or self.changed)
+
+
+def index_sessions(sessions: Iterable[StreamSession]) -> Dict[str, StreamSession]:
+    """Snapshot of records keyed by session id."""
+    return {s.id: s for s in sessions if s.id is not None}
+
+
+def diff_sessions(old: Dict[str, StreamSession], new: Dict[str, StreamSession]) -> SessionDiff:
+    """
+    Compare two snapshots from ``index_sessions``.
+
+    A session that keeps its id but plays another item, pauses, moves to
+    another address or changes bitrate is reported as changed; progress
+    alone is not a change.
+
+    Returns:
+        SessionDiff with ``changed`` as (old, new) pairs
+    """
+    diff = SessionDiff()
+    for session_id, session in new.items():
+        previous = old.get(session_id)
+        if previous is None:
+            diff.started.append(session)
+        elif previous != session:
+            diff.changed.append((previous, session))
+    diff.stopped = [session for session_id, session in old.items() if session_id not in new]
+    return diff
@@ -0,0 +1,282 @@
+"""
+Streaming router telemetry over a long-lived channel.
+
+A small loop runs on the router and prints a counter snapshot every few
+hundred milliseconds. A background thread parses the snapshots, turns them
+into rates and stores them in an array-backed ring buffer that the control
+loop can read without any round trip.
+"""
+
+import argparse
+import logging
+import math
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .counters import CounterTracker
+
+
+class RateRingBuffer:
+    """Fixed-size ring buffer of upload rates backed by ``array('d')`` columns."""
+
+    def __init__(self, capacity: int = 256):
+        """Initialize an empty buffer holding up to ``capacity`` samples."""
+        self.capacity = capacity
+        self._times = array('d', [0.0] * capacity)
+        self._totals = array('d', [0.0] * capacity)
+        self._per_ip: Dict[str, array] = {}
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp: float, total: float, per_ip: Dict[str, float]):
+        """Store one sample; IPs missing from ``per_ip`` are recorded as NaN."""
+        with self._lock:
+            slot = self._next
+            self._times[slot] = timestamp
+            self._totals[slot] = total
+            for ip in per_ip:
+                if ip not in self._per_ip:
+                    self._per_ip[ip] = array('d', [math.nan] * self.capacity)
+            for ip, column in self._per_ip.items():
+                column[slot] = per_ip.get(ip, math.nan)
+            self._next = (slot + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def _recent_slots(self, since: float) -> List[int]:
+        """Slots holding samples newer than ``since``, oldest first."""
+        slots = []
+        for offset in range(self._count, 0, -1):
+            slot = (self._next - offset) % self.capacity
+            if self._times[slot] >= since:
+                slots.append(slot)
+        return slots
+
+    def latest_time(self) -> Optional[float]:
+        """Timestamp of the newest sample, or None if the buffer is empty."""
+        with self._lock:
+            if not self._count:
+                return None
+            return self._times[(self._next - 1) % self.capacity]
+
+    def average(self, window: float, now: Optional[float] = None) -> Optional[Tuple[float, Dict[str, float]]]:
+        """
+        Average the samples of the last ``window`` seconds.
+
+        Returns:
+            Tuple of (total Mbps, per-IP Mbps), or None if there are no samples
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slots = self._recent_slots(now - window)
+            if not slots:
+                return None
+            total = sum(self._totals[slot] for slot in slots) / len(slots)
+            per_ip = {}
+            for ip, column in self._per_ip.items():
+                values = [column[slot] for slot in slots if not math.isnan(column[slot])]
+                if values:
+                    per_ip[ip] = sum(values) / len(values)
+            return total, per_ip
+
+
+class TelemetrySampler:
+    """Background reader for a streaming counter snapshot channel."""
+
+    def __init__(self, open_stream: Callable[[], Iterable[str]], ips: List[str],
+                 buffer: Optional[RateRingBuffer] = None,
+                 min_backoff: float = 1.0, max_backoff: float = 30.0):
+        """
+        Initialize the sampler.
+
+        Args:
+            open_stream: Callable returning an iterable of snapshot lines; the
+                object may provide ``close()``
+            ips: IPs whose per-IP counters the stream reports
+            buffer: Ring buffer to fill (a new one is created if omitted)
+            min_backoff: Initial reconnect delay in seconds
+            max_backoff: Maximum reconnect delay in seconds
+        """
+        self.open_stream = open_stream
+        self.ips = list(ips)
+        self.buffer = buffer or RateRingBuffer()
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.logger = logging.getLogger('jellydemon.telemetry')
+        self.reconnects = 0
+        self._counters = CounterTracker()
+        self._stream = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the reader thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the reader thread."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='jellydemon-telemetry', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the reader thread and close the stream."""
+        self._stop.set()
+        self._close_stream()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def _run(self):
+        """Read snapshots until stopped, reconnecting with backoff."""
+        backoff = self.min_backoff
+        while not self._stop.is_set():
+            try:
+                self._stream = self.open_stream()
+                self._counters.reset()
+                self.logger.debug("Telemetry stream opened")
+                received = self._consume(self._stream)
+                if received:
+                    backoff = self.min_backoff
+                if not self._stop.is_set():
+                    self.logger.warning("Telemetry stream ended, reconnecting")
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.logger.warning(f"Telemetry stream error: {e}")
+            finally:
+                self._close_stream()
+
+            # Jittered so several daemons do not reconnect in lockstep
+            if self._stop.wait(backoff * random.uniform(0.5, 1.0)):
+                break
+            self.reconnects += 1
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _consume(self, stream: Iterable[str]) -> bool:
+        """Parse snapshot lines from ``stream``; returns True if any arrived."""
+        received = False
+        snapshot = {'time': 0.0, 'wan': 0, 'ips': {}}
+        for line in stream:
+            if self._stop.is_set():
+                break
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == '.':
+                self._record(snapshot)
+                received = True
+                snapshot = {'time': 0.0, 'wan': 0, 'ips': {}}
+            elif parts[0] == 'T' and len(parts) == 2:
+                snapshot['time'] = float(parts[1])
+            elif parts[0] == 'W' and len(parts) == 2:
+                snapshot['wan'] = int(parts[1])
+            elif parts[0] == 'I' and len(parts) == 3:
+                snapshot['ips'][parts[1]] = int(parts[2])
+        return received
+
+    def _record(self, snapshot: Dict):
+        """Turn one snapshot into rates and store them in the buffer."""
+        timestamp = snapshot['time']
+        total = self._counters.update('wan', snapshot['wan'], timestamp)
+        per_ip = {}
+        for ip in self.ips:
+            rate = self._counters.update(f"ip:{ip}", snapshot['ips'].get(ip, 0), timestamp)
+            if rate is not None:
+                per_ip[ip] = rate
+        if total is not None:
+            self.buffer.append(time.monotonic(), total, per_ip)
+
+
+class LocalCommandStream:
+    """Run a local command and iterate over its stdout lines."""
+
+    def __init__(self, command: str):
+        self.process = subprocess.Popen(
+            shlex.split(command), stdout=subprocess.PIPE, text=True
+        )
+
+    def __iter__(self):
+        return iter(self.process.stdout)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process.stdout.close()
+
+
+def emulate_router(rate_mbps: float, ip_rates: Dict[str, float], interval: float,
+                   count: int = 0, out=sys.stdout):
+    """
+    Print router telemetry snapshots with constant upload rates.
+
+    Used as a local stand-in for the router-side loop during development
+    and tests.
+    """
+    uptime = 1000.0
+    wan = 0.0
+    ip_bytes = {ip: 0.0 for ip in ip_rates}
+    emitted = 0
+    while not count or emitted < count:
+        out.write(f"T {uptime:.2f}\nW {int(wan)}\n")
+        for ip, value in ip_bytes.items():
+            out.write(f"I {ip} {int(value)}\n")
+        out.write(".\n")
+        out.flush()
+        emitted += 1
+        time.sleep(interval)
+        uptime += interval
+        wan += rate_mbps * 1_000_000 / 8 * interval
+        for ip, rate in ip_rates.items():
+            ip_bytes[ip] += rate * 1_000_000 / 8 * interval
+
+
+def main():
+    """Command-line entry point for the router emulator."""
+    parser = argparse.ArgumentParser(description="Emulate the router telemetry loop")
+    parser.add_argument("--rate", type=float, default=10.0, help="WAN upload rate in Mbps")
+    parser.add_argument("--ip", action="append", default=[],
+                        help="Per-IP rate as IP=MBPS (repeatable)")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between snapshots")
+    parser.add_argument("--count", type=int, default=0, help="Snapshots to emit (0 = forever)")
+    args = parser.parse_args()
+
+    ip_rates = {}
+    for item in args.ip:
+        ip, rate = item.split('=', 1)
+        ip_rates[ip] = float(rate)
+    try:
+        emulate_router(args.rate, ip_rates, args.interval, args.count)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Event-driven triggers for early bandwidth re-allocation.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# ActivityLog entry types that mean a stream started or stopped
+PLAYBACK_ACTIVITY_TYPES = (
+    "VideoPlayback", "VideoPlaybackStopped",
+    "AudioPlayback", "AudioPlaybackStopped",
+)
+
+
+def parse_date(value: str) -> Optional[datetime]:
+    """
+    Parse a Jellyfin timestamp such as ``2026-01-01T10:00:01.1234567Z``.
+
+    Jellyfin writes up to 7 fractional digits, one more than
+    ``datetime`` accepts, so the fraction is cut to microseconds.
+
+    Returns:
+        Timezone-aware datetime, or None if the value is not a timestamp
+    """
+    if not value:
+        return None
+    value = value.replace('Z', '+00:00')
+    if '.' in value:
+        head, _, rest = value.partition('.')
+        digits = len(rest) - len(rest.lstrip('0123456789'))
+        value = f"{head}.{rest[:min(digits, 6)].ljust(6, '0')}{rest[digits:]}"
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+class ReallocationTrigger:
+    """
+    Debounced wake-up for the main loop.
+
+    Event sources call ``notify()``; the main loop blocks in ``wait()``
+    until either the periodic interval elapses or events arrived. A burst
+    of events is coalesced: ``wait()`` returns once no new event has arrived
+    for ``debounce`` seconds, or at the latest ``max_delay`` seconds after
+    the first event of the burst.
+    """
+
+    def __init__(self, debounce: float = 2.0, max_delay: float = 10.0):
+        """
+        Initialize the trigger.
+
+        Args:
+            debounce: Quiet period that ends a burst of events, in seconds
+            max_delay: Longest time an event may be held back, in seconds
+        """
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.logger = logging.getLogger('jellydemon.triggers')
+        self.fired = 0
+        self._reasons: List[str] = []
+        self._first = 0.0
+        self._last = 0.0
+        self._interrupted = False
+        self._cond = threading.Condition()
+
+    def notify(self, reason: str):
+        """Request an early allocation pass."""
+        with self._cond:
+            now = time.monotonic()
+            if not self._reasons:
+                self._first = now
+            self._reasons.append(reason)
+            self._last = now
+            self._cond.notify_all()
+        self.logger.debug(f"Re-allocation requested: {reason}")
+
+    def interrupt(self):
+        """Wake a waiting loop immediately (e.g. on shutdown)."""
+        with self._cond:
+            self._interrupted = True
+            self._cond.notify_all()
+
+    def wait(self, timeout: float) -> List[str]:
+        """
+        Block until the periodic tick or a debounced burst of events.
+
+        Returns:
+            Reasons of the events that ended the wait; empty for a plain tick
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._interrupted:
+                    self._interrupted = False
+                    return self._take()
+                if self._reasons:
+                    fire_at = min(self._last + self.debounce, self._first + self.max_delay)
+                    if now >= fire_at:
+                        self.fired += 1
+                        return self._take()
+                    self._cond.wait(fire_at - now)
+                elif now >= deadline:
+                    return []
+                else:
+                    self._cond.wait(deadline - now)
+
+    def _take(self) -> List[str]:
+        reasons, self._reasons = self._reasons, []
+        return reasons
+
+
+class ActivityLogWatcher:
+    """
+    Poll ``/System/ActivityLog/Entries`` incrementally for playback events.
+
+    Only entries newer than the last seen one are requested (``minDate``),
+    so each poll is a small response. Polling is skipped while ``paused()``
+    returns True, e.g. while the WebSocket tracker is live.
+    """
+
+    def __init__(self, fetch_entries: Callable[[str], List[Dict]], on_event: Callable[[str], None],
+                 interval: float = 5.0, paused: Optional[Callable[[], bool]] = None):
+        """
+        Initialize the watcher.
+
+        Args:
+            fetch_entries: Returns activity entries newer than an ISO timestamp
+            on_event: Called with a reason for each batch of playback events
+            interval: Seconds between polls
+            paused: Returns True while polling is not needed
+        """
+        self.fetch_entries = fetch_entries
+        self.on_event = on_event
+        self.interval = interval
+        self.paused = paused
+        self.logger = logging.getLogger('jellydemon.triggers')
+        # Jellyfin's own format (7 fractional digits); compared as datetimes
+        self.min_date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f0Z')
+        self._seen_at_min_date = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the polling thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='jellydemon-activity', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the polling thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.paused is not None and self.paused():
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                self.logger.warning(f"Activity log poll failed: {e}")
+
+    def poll(self) -> int:
+        """
+        Fetch new entries once and report playback events.
+
+        Returns:
+            Number of new playback entries
+        """
+        min_time = parse_date(self.min_date)
+        entries = self.fetch_entries(self.min_date)
+        playback = []
+        newest, newest_time = self.min_date, min_time
+        for entry in entries:
+            entry_id, date = entry.get('Id'), entry.get('Date') or ''
+            entry_time = parse_date(date)
+            # minDate is inclusive, so entries at the boundary come back again
+            if entry_time == min_time and entry_id in self._seen_at_min_date:
+                continue
+            if entry.get('Type') in PLAYBACK_ACTIVITY_TYPES:
+                playback.append(entry)
+            if entry_time is not None and (newest_time is None or entry_time > newest_time):
+                newest, newest_time = date, entry_time
+
+        if newest_time != min_time:
+            self.min_date = newest
+            self._seen_at_min_date = set()
+        self._seen_at_min_date.update(
+            entry.get('Id') for entry in entries
+            if parse_date(entry.get('Date') or '') == newest_time
+        )
+
+        if playback:
+            self.on_event(f"activity:{playback[-1].get('Type')}")
+        return len(playback)
@@ -0,0 +1,166 @@
+"""
+JSON-RPC client for the OpenWRT ubus HTTP endpoint (rpcd).
+"""
+
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import requests
+
+# rpcd status codes
+UBUS_STATUS_OK = 0
+UBUS_STATUS_PERMISSION_DENIED = 6
+
+NULL_SESSION = "0" * 32
+
+UbusCall = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+class UbusError(RuntimeError):
+    """Raised when a ubus call returns a non-zero status."""
+
+    def __init__(self, message: str, code: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+
+    @property
+    def access_denied(self) -> bool:
+        return self.code in (UBUS_STATUS_PERMISSION_DENIED, -32002)
+
+
+class UbusClient:
+    """
+    ubus session client.
+
+    Logs in once, keeps the rpcd session token until shortly before it
+    expires and re-authenticates only when the token expired or a call is
+    rejected with access denied. Several calls can be sent as one JSON-RPC
+    batch request.
+    """
+
+    def __init__(self, session: requests.Session, url: str, username: str,
+                 password: str, timeout: Union[float, Tuple[float, float]] = (3.05, 10.0),
+                 renew_margin: float = 10):
+        """
+        Initialize the client.
+
+        Args:
+            session: HTTP session to send requests with
+            url: Full URL of the ubus endpoint (e.g. http://192.168.1.1/ubus)
+            username: rpcd login user
+            password: rpcd login password
+            timeout: HTTP timeout in seconds, or (connect, read) timeouts
+            renew_margin: Seconds before expiry at which the token is renewed
+        """
+        self.session = session
+        self.url = url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.renew_margin = renew_margin
+        self.logger = logging.getLogger('jellydemon.ubus')
+        self.logins = 0
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._ids = itertools.count(1)
+
+    def _payload(self, token: str, call: UbusCall) -> Dict[str, Any]:
+        obj, method, params = call
+        return {
+            "jsonrpc": "2.0",
+            "id": next(self._ids),
+            "method": "call",
+            "params": [token, obj, method, params or {}]
+        }
+
+    @staticmethod
+    def _unwrap(reply: Dict[str, Any]) -> Any:
+        """Extract the result of one JSON-RPC reply or raise UbusError."""
+        if 'error' in reply:
+            error = reply['error'] or {}
+            raise UbusError(error.get('message', 'ubus error'), error.get('code'))
+
+        result = reply.get('result')
+        if isinstance(result, list) and result:
+            if result[0] != UBUS_STATUS_OK:
+                raise UbusError(f"ubus status {result[0]}", result[0])
+            return result[1] if len(result) > 1 else {}
+        return result
+
+    def _post(self, payload: Any) -> Any:
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        if response.status_code != 200:
+            raise UbusError(f"ubus request failed: {response.status_code}")
+        return response.json()
+
+    def login(self) -> str:
+        """Authenticate and cache a new session token."""
+        reply = self._post(self._payload(NULL_SESSION, (
+            "session", "login", {"username": self.username, "password": self.password}
+        )))
+        result = self._unwrap(reply)
+        token = result.get('ubus_rpc_session') if isinstance(result, dict) else None
+        if not token:
+            raise UbusError("ubus login returned no session token")
+
+        self._token = token
+        self._expires_at = time.monotonic() + float(result.get('expires', result.get('timeout', 300)))
+        self.logins += 1
+        self.logger.debug("ubus session established")
+        return token
+
+    def _session_token(self) -> str:
+        if self._token is None or time.monotonic() >= self._expires_at - self.renew_margin:
+            return self.login()
+        return self._token
+
+    def invalidate(self):
+        """Drop the cached session token."""
+        self._token = None
+
+    def call(self, obj: str, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """Invoke a single ubus method."""
+        result = self.batch([(obj, method, params)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def batch(self, calls: List[UbusCall]) -> List[Any]:
+        """
+        Invoke several ubus methods in one HTTP request.
+
+        Returns:
+            One entry per call, in order: the call's result, or the UbusError
+            it failed with
+        """
+        if not calls:
+            return []
+
+        results = self._send_batch(self._session_token(), calls)
+        if any(isinstance(r, UbusError) and r.access_denied for r in results):
+            # Session expired or was revoked on the router - log in again once
+            self.logger.debug("ubus access denied, re-authenticating")
+            self.invalidate()
+            results = self._send_batch(self._session_token(), calls)
+        return results
+
+    def _send_batch(self, token: str, calls: List[UbusCall]) -> List[Any]:
+        payload = [self._payload(token, call) for call in calls]
+        replies = self._post(payload if len(payload) > 1 else payload[0])
+        if isinstance(replies, dict):
+            replies = [replies]
+
+        by_id = {reply.get('id'): reply for reply in replies if isinstance(reply, dict)}
+        results = []
+        for request in payload:
+            reply = by_id.get(request['id'])
+            if reply is None:
+                results.append(UbusError("missing reply in ubus batch"))
+                continue
+            try:
+                results.append(self._unwrap(reply))
+            except UbusError as e:
+                results.append(e)
+        return results
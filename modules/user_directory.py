@@ -0,0 +1,91 @@
+"""
+In-memory directory of Jellyfin users and their policies.
+"""
+
+import copy
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class UserDirectory:
+    """
+    Snapshot of every user, fetched with a single ``GET /Users`` request.
+
+    The user DTOs returned by Jellyfin embed each user's ``Policy``, so one
+    request serves both user info and bandwidth limits for all users. The
+    snapshot is refreshed when it is older than ``ttl`` or after
+    ``invalidate()`` (e.g. on a user change event); a failed refresh keeps
+    serving the previous snapshot.
+    """
+
+    def __init__(self, fetch_users: Callable[[], List[Dict[str, Any]]], ttl: float = 300):
+        """
+        Initialize the directory (nothing is fetched yet).
+
+        Args:
+            fetch_users: Returns the list of user DTOs
+            ttl: Seconds a snapshot is served before it is refreshed
+        """
+        self.fetch_users = fetch_users
+        self.ttl = ttl
+        self.logger = logging.getLogger('jellydemon.users')
+        self.refreshes = 0
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._fetched_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    def refresh(self) -> bool:
+        """Fetch all users now; returns False if the snapshot was kept."""
+        with self._lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> bool:
+        users = self.fetch_users()
+        # Retry on the next lookup after a failure, but never more than
+        # once per ttl
+        self._fetched_at = time.monotonic()
+        if not isinstance(users, list) or not users:
+            self.logger.warning("User directory refresh failed, keeping previous snapshot")
+            return False
+
+        self._users = {user['Id']: user for user in users if isinstance(user, dict) and 'Id' in user}
+        self.refreshes += 1
+        self.logger.debug(f"User directory refreshed with {len(self._users)} users")
+        return True
+
+    def invalidate(self):
+        """Refresh the snapshot on the next lookup."""
+        with self._lock:
+            self._fetched_at = None
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the user DTO for ``user_id``, or None if it is unknown."""
+        with self._lock:
+            if self._stale():
+                self._refresh_locked()
+            return self._users.get(user_id)
+
+    def policy(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the user's policy (safe to modify and POST)."""
+        user = self.get(user_id)
+        if user is None or not isinstance(user.get('Policy'), dict):
+            return None
+        return copy.deepcopy(user['Policy'])
+
+    def put(self, user: Dict[str, Any]):
+        """Add or replace a single user (e.g. fetched individually)."""
+        with self._lock:
+            if 'Id' in user:
+                self._users[user['Id']] = user
+
+    def update_policy(self, user_id: str, policy: Dict[str, Any]):
+        """Record a policy that was just written to the server."""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                user['Policy'] = copy.deepcopy(policy)
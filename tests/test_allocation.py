@@ -0,0 +1,160 @@
+import random
+import time
+import unittest
+from unittest.mock import patch
+
+from modules import allocation
+from modules.allocation import (
+    Columns, demand_split, equal_split, to_list, water_fill, water_fill_segments, weighted_split
+)
+from modules.bandwidth_manager import (
+    DemandBasedAlgorithm, EqualSplitAlgorithm, HouseholdAlgorithm, PriorityBasedAlgorithm,
+    WaterFillingAlgorithm
+)
+from modules.config import BandwidthConfig
+
+
+def reference_water_fill(budget, floors, caps):
+    """Bisection on the water level, for checking the exact solver."""
+    if sum(caps) <= budget:
+        return list(caps)
+    lo, hi = min(floors), max(caps)
+    for _ in range(200):
+        level = (lo + hi) / 2
+        if sum(min(c, max(level, f)) for f, c in zip(floors, caps)) > budget:
+            hi = level
+        else:
+            lo = level
+    return [min(c, max(lo, f)) for f, c in zip(floors, caps)]
+
+
+class TestSolvers(unittest.TestCase):
+    def check_against_reference(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            n = rng.randint(1, 40)
+            floors = [rng.choice([1, 2, 2.5]) for _ in range(n)]
+            caps = [f + rng.choice([0, 1, 5, 30]) for f in floors]
+            budget = sum(floors) + rng.uniform(0, sum(caps) - sum(floors) + 10)
+            result = to_list(water_fill(budget, floors, caps))
+            expected = reference_water_fill(budget, floors, caps)
+            for got, want in zip(result, expected):
+                self.assertAlmostEqual(got, want, places=6)
+            self.assertLessEqual(sum(result), budget + 1e-6)
+
+    @unittest.skipIf(allocation.np is None, "numpy not installed")
+    def test_numpy_water_fill_matches_reference(self):
+        self.check_against_reference()
+
+    def test_python_water_fill_matches_reference(self):
+        with patch.object(allocation, 'np', None):
+            self.check_against_reference()
+
+    def check_segments_against_water_fill(self):
+        rng = random.Random(11)
+        counts = [rng.choice([1, 1, 2, 3, 8]) for _ in range(60)]
+        floors = [rng.choice([1, 2, 2.5]) for _ in range(sum(counts))]
+        caps = [f + rng.choice([0, 1, 5, 30]) for f in floors]
+        budgets, start = [], 0
+        for count in counts:
+            end = start + count
+            budgets.append(sum(floors[start:end]) + rng.uniform(0, sum(caps[start:end]) + 5))
+            start = end
+
+        result = to_list(water_fill_segments(budgets, counts, floors, caps))
+        start = 0
+        for budget, count in zip(budgets, counts):
+            end = start + count
+            expected = to_list(water_fill(budget, floors[start:end], caps[start:end]))
+            for got, want in zip(result[start:end], expected):
+                self.assertAlmostEqual(got, want, places=6)
+            start = end
+
+    @unittest.skipIf(allocation.np is None, "numpy not installed")
+    def test_numpy_segments_match_water_fill(self):
+        self.check_segments_against_water_fill()
+
+    def test_python_segments_match_water_fill(self):
+        with patch.object(allocation, 'np', None):
+            self.check_segments_against_water_fill()
+
+    def test_per_user_bounds(self):
+        columns = Columns('abc', demand=[1, 10, 60], floor=[2, 2, 5], cap=[50, 8, 50])
+        self.assertEqual(to_list(columns.clamp(columns.demand)), [2, 8, 50])
+        self.assertEqual(to_list(equal_split(3, 30, columns.floor, columns.cap)), [10, 8, 10])
+        self.assertEqual(columns.limits([2, 8, 50]), {'a': 2, 'b': 8, 'c': 50})
+        self.assertEqual(to_list(columns.limit), [2, 8, 50])
+        with patch.object(allocation, 'np', None):
+            columns = Columns('abc', demand=[1, 10, 60], floor=[2, 2, 5], cap=[50, 8, 50])
+            self.assertEqual(columns.clamp(columns.demand), [2, 8, 50])
+
+    def test_scalar_bounds(self):
+        self.assertEqual(to_list(water_fill(9, 2, [3, 20, 20])), [3, 3, 3])
+        self.assertEqual(to_list(water_fill(9, [1, 1], 4)), [4, 4])
+        self.assertEqual(to_list(water_fill(9, 1, 2, n=0)), [])
+
+    def test_split_solvers(self):
+        self.assertEqual(to_list(equal_split(4, 10, 2, 50)), [2.5] * 4)
+        self.assertEqual(to_list(weighted_split(Columns('ab', weight=[3, 1]).weight, 8, 1, 50)), [6, 2])
+        self.assertEqual(to_list(demand_split(Columns('ab', demand=[10, 30]).demand, 20, 1, 50)), [5, 15])
+        self.assertEqual(to_list(demand_split(Columns('ab', demand=[0.5, 3]).demand, 20, 1, 50)), [1, 3])
+
+    def test_pure_python_fallback_matches(self):
+        floors, caps = [2] * 50, [2 + (i % 7) * 3 for i in range(50)]
+        with patch.object(allocation, 'np', None):
+            fallback = water_fill(300, floors, caps)
+            self.assertIsInstance(fallback, list)
+        self.assertEqual(to_list(water_fill(300, floors, caps)), fallback)
+
+
+class TestAlgorithmsOnColumns(unittest.TestCase):
+    def setUp(self):
+        self.config = BandwidthConfig(min_per_user=2.0, max_per_user=50.0)
+        self.streamers = {
+            'admin': {'user_data': {'Policy': {'IsAdministrator': True}},
+                      'session_data': {'TranscodingInfo': {'Bitrate': 20_000_000}}},
+            'regular': {'user_data': {'Policy': {}}, 'measured_mbps': 4.0},
+        }
+
+    def test_results_unchanged(self):
+        self.assertEqual(
+            EqualSplitAlgorithm().calculate_limits(self.streamers, 30, self.config),
+            {'admin': 15.0, 'regular': 15.0}
+        )
+        self.assertEqual(
+            PriorityBasedAlgorithm().calculate_limits(self.streamers, 40, self.config),
+            {'admin': 30.0, 'regular': 10.0}
+        )
+        self.assertEqual(
+            DemandBasedAlgorithm().calculate_limits(self.streamers, 12, self.config),
+            {'admin': 10.0, 'regular': 2.0}
+        )
+
+    def check_thousands_of_users(self):
+        streamers = {
+            f's{i}': {'user_id': f'u{i // 2}', 'ip': f'10.0.{i // 256}.{i % 256}',
+                      'measured_mbps': 1 + i % 20} for i in range(5000)
+        }
+        # Typically 5-20 ms for water filling and 50-60 ms for households;
+        # the bounds leave room for slow CI machines
+        for algorithm, bound in ((WaterFillingAlgorithm(), 0.25), (HouseholdAlgorithm(), 0.5)):
+            elapsed = float('inf')
+            for _ in range(3):
+                start = time.perf_counter()
+                limits = algorithm.calculate_limits(streamers, 30000.0, self.config)
+                elapsed = min(elapsed, time.perf_counter() - start)
+            self.assertEqual(len(limits), 5000)
+            self.assertLessEqual(sum(limits.values()), 30000.0 + 1e-6)
+            self.assertLess(elapsed, bound)
+
+    @unittest.skipIf(allocation.np is None, "numpy not installed")
+    def test_thousands_of_users_numpy(self):
+        self.check_thousands_of_users()
+
+    def test_thousands_of_users_python(self):
+        with patch.object(allocation, 'np', None):
+            self.check_thousands_of_users()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from modules.capacity import CapacityEstimator
+from modules.config import RouterConfig
+from modules.openwrt_client import OpenWRTClient
+
+
+class TestCapacityEstimator(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.tmp.name, 'capacity.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sqm_rate_wins(self):
+        estimator = CapacityEstimator(lambda: {'sqm': 40.0, 'phy': 1000.0})
+        estimator.observe(55.0)
+        self.assertEqual(estimator.capacity(), 40.0)
+        self.assertEqual(estimator.estimate.source, 'sqm')
+
+    def test_observed_peak_capped_by_phy(self):
+        estimator = CapacityEstimator(lambda: {'sqm': None, 'phy': 1000.0},
+                                      peak_samples_for_confidence=4)
+        self.assertEqual(estimator.capacity(), 1000.0)
+        self.assertEqual(estimator.estimate.source, 'phy')
+
+        for rate in (12.0, 25.0, 30.0, 38.0):
+            estimator.observe(rate, saturated=True)
+
+        self.assertAlmostEqual(estimator.capacity(), 38.0)
+        self.assertEqual(estimator.estimate.source, 'peak')
+        self.assertAlmostEqual(estimator.estimate.confidence, 0.7)
+
+    def test_hints_cached_for_ttl(self):
+        fetch = MagicMock(return_value={'sqm': 40.0, 'phy': None})
+        estimator = CapacityEstimator(fetch, ttl=60)
+        for _ in range(5):
+            estimator.capacity()
+        self.assertEqual(fetch.call_count, 1)
+
+        estimator.estimate.updated = time.time() - 61
+        estimator.capacity()
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_state_survives_restart(self):
+        fetch = MagicMock(return_value={'sqm': None, 'phy': None})
+        estimator = CapacityEstimator(fetch, state_file=self.state_file,
+                                      peak_samples_for_confidence=1)
+        estimator.observe(42.0, saturated=True)
+        estimator.capacity()
+
+        with open(self.state_file) as f:
+            self.assertEqual(json.load(f)['peak_mbps'], 42.0)
+
+        restarted = CapacityEstimator(fetch, state_file=self.state_file,
+                                      peak_samples_for_confidence=1)
+        self.assertAlmostEqual(restarted.capacity(), 42.0)
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_unconfirmed_peak_keeps_fallback(self):
+        estimator = CapacityEstimator(lambda: {'sqm': None, 'phy': None},
+                                      peak_samples_for_confidence=10)
+        estimator.observe(3.0, saturated=True)
+        self.assertEqual(estimator.capacity(), 100.0)
+        self.assertEqual(estimator.estimate.source, 'default')
+
+        for _ in range(9):
+            estimator.observe(80.0, saturated=True)
+        self.assertAlmostEqual(estimator.capacity(), 80.0)
+        self.assertEqual(estimator.estimate.source, 'peak')
+
+    def test_unsaturated_rates_do_not_lower_estimate(self):
+        estimator = CapacityEstimator(lambda: {'sqm': None, 'phy': 1000.0},
+                                      peak_samples_for_confidence=1)
+        # Rates held down by the daemon's own limits say nothing about the link
+        for _ in range(10):
+            estimator.observe(8.0)
+        self.assertEqual(estimator.capacity(), 1000.0)
+        self.assertEqual(estimator.estimate.source, 'phy')
+        self.assertEqual(estimator.samples, 0)
+
+    def test_unsaturated_peak_is_lower_bound(self):
+        estimator = CapacityEstimator(lambda: {'sqm': None, 'phy': None},
+                                      peak_samples_for_confidence=1)
+        self.assertEqual(estimator.capacity(), 100.0)
+        estimator.observe(150.0)
+        self.assertAlmostEqual(estimator.capacity(), 150.0)
+        self.assertEqual(estimator.estimate.source, 'default')
+
+        # A saturated peak below a rate already seen cannot be the capacity
+        estimator.observe(90.0, saturated=True)
+        self.assertAlmostEqual(estimator.capacity(), 150.0)
+        self.assertEqual(estimator.estimate.source, 'peak')
+
+    def test_peak_decays(self):
+        estimator = CapacityEstimator(lambda: {}, peak_half_life=3600)
+        estimator.observe(80.0, now=0, saturated=True)
+        self.assertAlmostEqual(estimator.current_peak(now=3600), 40.0)
+        # A lower rate becomes the new peak once the old one has decayed below it
+        estimator.observe(50.0, now=3600, saturated=True)
+        self.assertEqual(estimator.peak_mbps, 50.0)
+
+    def test_corrupt_state_is_ignored(self):
+        with open(self.state_file, 'w') as f:
+            f.write('{not json')
+        estimator = CapacityEstimator(lambda: {}, state_file=self.state_file)
+        self.assertEqual(estimator.capacity(), 100.0)
+
+
+class TestCapacityHints(unittest.TestCase):
+    def test_ssh_hints_parsed(self):
+        client = OpenWRTClient(RouterConfig(host='r', username='u', password='p', use_ssh=True))
+        client._run_ssh = MagicMock(return_value="SQM 1 40000\nPHY 1000\n")
+        self.assertEqual(client.get_capacity_hints(), {'sqm': 40.0, 'phy': 1000.0})
+
+        client._run_ssh = MagicMock(return_value="SQM 0 40000\nPHY -1\n")
+        self.assertEqual(client.get_capacity_hints(), {'sqm': None, 'phy': None})
+
+    def test_luci_speed_string(self):
+        client = OpenWRTClient(RouterConfig(host='r', username='u', password='p'))
+        client._get_wan_interface = MagicMock(return_value='eth1')
+        client.ubus.batch = MagicMock(return_value=[
+            {'name': 'eth1', 'speed': '1000F'},
+            {'values': {'eth1': {'.index': 0, 'enabled': '1', 'upload': '20000'}}},
+        ])
+        self.assertEqual(client.get_capacity_hints(), {'sqm': 20.0, 'phy': 1000.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
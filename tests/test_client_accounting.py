@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import MagicMock
+
+from jellydemon import JellyDemon
+from modules.accounting import parse_conntrack, parse_iptables_save, rate_flows
+from modules.config import RouterConfig
+from modules.openwrt_client import OpenWRTClient
+
+
+def conntrack_line(client, sport, reply_bytes):
+    return (
+        f"ipv4     2 tcp      6 431999 ESTABLISHED src={client} dst=198.51.100.1 "
+        f"sport={sport} dport=8096 packets=10 bytes=1000 src=192.168.1.243 "
+        f"dst={client} sport=8096 dport={sport} packets=20 bytes={reply_bytes} "
+        f"[ASSURED] mark=0 zone=0 use=2"
+    )
+
+
+class TestAccountingParsers(unittest.TestCase):
+    def test_parse_conntrack_counts_reply_direction(self):
+        lines = [
+            conntrack_line('203.0.113.5', 50000, 900000),
+            conntrack_line('203.0.113.5', 50001, 100000),
+            conntrack_line('198.51.100.77', 40000, 5000),
+        ]
+        flows = parse_conntrack(lines, ['203.0.113.5'])
+        self.assertEqual(len(flows), 2)
+        self.assertEqual(sorted(v for _, v in flows.values()), [100000, 900000])
+        self.assertTrue(all(ip == '203.0.113.5' for ip, _ in flows.values()))
+
+    def test_parse_iptables_save(self):
+        lines = [
+            "[0:0] -A FORWARD -j JD_ACCT",
+            "[12:345000] -A JD_ACCT -d 203.0.113.5/32 -j RETURN",
+            "[1:1000] -A JD_ACCT -d 203.0.113.9/32 -j RETURN",
+        ]
+        counters = parse_iptables_save(lines, ['203.0.113.5'])
+        self.assertEqual(counters, {'203.0.113.5': ('203.0.113.5', 345000)})
+
+    def test_rate_flows_counts_new_flows_fully(self):
+        before = {'a': ('1.1.1.1', 1_000_000)}
+        after = {'a': ('1.1.1.1', 2_000_000), 'b': ('1.1.1.1', 250_000), 'c': ('2.2.2.2', 125_000)}
+        rates = rate_flows(before, after, 1.0, ['1.1.1.1', '2.2.2.2', '3.3.3.3'])
+        self.assertAlmostEqual(rates['1.1.1.1'], 10.0)
+        self.assertAlmostEqual(rates['2.2.2.2'], 1.0)
+        self.assertEqual(rates['3.3.3.3'], 0.0)
+
+
+class TestClientUploadRates(unittest.TestCase):
+    def test_single_round_trip_for_many_clients(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw', use_ssh=True,
+                           jellyfin_ip='192.168.1.243', client_accounting='conntrack')
+        client = OpenWRTClient(cfg)
+        clients = [f"203.0.113.{i}" for i in range(1, 201)]
+        first = [conntrack_line(ip, 50000, 0) for ip in clients]
+        second = [conntrack_line(ip, 50000, 250000) for ip in clients]
+        output = "T 10.00\n" + "\n".join(first) + "\n.\nT 11.00\n" + "\n".join(second) + "\n.\n"
+        client._run_ssh = MagicMock(return_value=output)
+
+        rates = client.get_client_upload_rates(clients)
+
+        client._run_ssh.assert_called_once()
+        self.assertIn('grep -F "src=192.168.1.243 "', client._run_ssh.call_args.args[0])
+        self.assertEqual(len(rates), 200)
+        self.assertAlmostEqual(rates['203.0.113.7'], 2.0)
+
+    def test_disabled_by_default(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw', use_ssh=True)
+        client = OpenWRTClient(cfg)
+        client._run_ssh = MagicMock()
+        self.assertEqual(client.get_client_upload_rates(['203.0.113.5']), {})
+        client._run_ssh.assert_not_called()
+
+
+class TestDaemonMeasuredDemand(unittest.TestCase):
+    def test_measured_rate_attached_to_streamers(self):
+        daemon = JellyDemon('config.example.yml')
+        daemon.config.router.client_accounting = 'conntrack'
+        daemon.jellyfin.get_active_sessions = MagicMock(return_value=[
+            {'UserId': 'u1', 'RemoteEndPoint': '8.8.8.8:1234'},
+            {'UserId': 'u2', 'RemoteEndPoint': '8.8.8.8:2345'},
+            {'UserId': 'u3', 'RemoteEndPoint': '9.9.9.9:1234'},
+        ])
+        daemon.jellyfin.get_user_info = MagicMock(return_value={})
+        daemon.openwrt.get_client_upload_rates = MagicMock(
+            return_value={'8.8.8.8': 6.0, '9.9.9.9': 4.0}
+        )
+
+        streamers = daemon.get_external_streamers()
+
+        daemon.openwrt.get_client_upload_rates.assert_called_once_with(['8.8.8.8', '9.9.9.9'])
+        self.assertAlmostEqual(streamers['u1']['measured_mbps'], 3.0)
+        self.assertAlmostEqual(streamers['u2']['measured_mbps'], 3.0)
+        self.assertAlmostEqual(streamers['u3']['measured_mbps'], 4.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from jellydemon import JellyDemon
+
+
+class TestConcurrentCycle(unittest.TestCase):
+    def setUp(self):
+        self.daemon = JellyDemon('config.example.yml')
+        self.daemon.calculate_and_apply_limits = MagicMock()
+
+        def slow_usage():
+            time.sleep(0.2)
+            return 12.0
+
+        def slow_streamers():
+            time.sleep(0.2)
+            return {'u1': {'ip': '2.2.2.2'}}
+
+        self.daemon.get_current_bandwidth_usage = slow_usage
+        self.daemon.get_external_streamers = slow_streamers
+
+    def tearDown(self):
+        self.daemon._shutdown_collectors()
+
+    def test_concurrent_collection_overlaps(self):
+        self.daemon.config.daemon.concurrent_collection = True
+        self.daemon.run_single_cycle()
+
+        timings = self.daemon.last_cycle_timings
+        self.assertLess(timings['collect'], 0.35)
+        self.assertGreater(timings['saved'], 0.1)
+        self.daemon.calculate_and_apply_limits.assert_called_with(
+            {'u1': {'ip': '2.2.2.2'}}, 12.0
+        )
+
+    def test_sequential_collection_reports_timings(self):
+        self.daemon.config.daemon.concurrent_collection = False
+        self.daemon.run_single_cycle()
+
+        timings = self.daemon.last_cycle_timings
+        self.assertGreaterEqual(timings['collect'], 0.4)
+        for key in ('router', 'jellyfin', 'collect', 'allocate', 'total', 'saved'):
+            self.assertIn(key, timings)
+
+
+    def test_ssh_stats_in_cycle_log(self):
+        self.daemon.config.daemon.concurrent_collection = False
+        self.daemon.config.router.use_ssh = True
+        self.daemon.openwrt.ssh.stats = MagicMock(return_value={
+            'connected': True, 'connects': 2, 'reconnects': 1, 'failures': 3,
+            'last_connect_latency': 0.25, 'last_error': 'timed out',
+        })
+        with self.assertLogs('jellydemon', level='DEBUG') as cm:
+            self.daemon.run_single_cycle()
+
+        self.assertIn(
+            'Router SSH: connected, 2 connects, 1 reconnects, 3 failures, '
+            'last connect 0.250s, last error: timed out',
+            '\n'.join(cm.output)
+        )
+
+
+class TestConcurrentUserLookups(unittest.TestCase):
+    def test_user_info_fetched_for_each_external_session(self):
+        daemon = JellyDemon('config.example.yml')
+        daemon.config.daemon.concurrent_collection = True
+        daemon.get_current_bandwidth_usage = MagicMock(return_value=0.0)
+        daemon.calculate_and_apply_limits = MagicMock()
+        daemon.jellyfin.get_active_sessions = MagicMock(return_value=[
+            {'UserId': 'u1', 'RemoteEndPoint': '8.8.8.8:1234'},
+            {'UserId': 'u2', 'RemoteEndPoint': '9.9.9.9:1234'},
+        ])
+        daemon.jellyfin.get_user_info = MagicMock(side_effect=lambda uid: {'Name': uid})
+
+        try:
+            daemon.run_single_cycle()
+        finally:
+            daemon._shutdown_collectors()
+
+        external = daemon.calculate_and_apply_limits.call_args.args[0]
+        self.assertEqual(external['u1']['user_data'], {'Name': 'u1'})
+        self.assertEqual(external['u2']['user_data'], {'Name': 'u2'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import MagicMock
+
+from modules.config import RouterConfig
+from modules.counters import CounterTracker
+from modules.openwrt_client import OpenWRTClient
+
+
+class TestCounterTracker(unittest.TestCase):
+    def test_rate_from_delta(self):
+        tracker = CounterTracker()
+        self.assertIsNone(tracker.update('wan', 1_000_000, 100.0))
+        # 3.75 MB over 30 s = 1 Mbps
+        self.assertAlmostEqual(tracker.update('wan', 4_750_000, 130.0), 1.0)
+
+    def test_32bit_wraparound(self):
+        tracker = CounterTracker(max_rate_mbps=1000)
+        tracker.update('wan', 2**32 - 1_000_000, 0.0)
+        rate = tracker.update('wan', 2_750_000, 30.0)
+        self.assertAlmostEqual(rate, 1.0)
+
+    def test_64bit_wraparound(self):
+        tracker = CounterTracker(max_rate_mbps=1000)
+        tracker.update('wan', 2**64 - 1_000_000, 0.0)
+        self.assertAlmostEqual(tracker.update('wan', 2_750_000, 30.0), 1.0)
+
+    def test_reset_after_reboot(self):
+        tracker = CounterTracker(max_rate_mbps=1000)
+        tracker.update('wan', 10_000_000_000, 5000.0)
+        # Counter restarted from zero; a wrap would imply an impossible rate
+        self.assertIsNone(tracker.update('wan', 5_000, 5030.0))
+        self.assertAlmostEqual(tracker.update('wan', 3_755_000, 5060.0), 1.0)
+
+    def test_clock_going_backwards_rebaselines(self):
+        tracker = CounterTracker()
+        tracker.update('wan', 5_000_000, 5000.0)
+        self.assertIsNone(tracker.update('wan', 6_000_000, 12.0))
+
+
+class TestDeltaMeasurement(unittest.TestCase):
+    def setUp(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw',
+                           use_ssh=True, measurement_mode='delta')
+        self.client = OpenWRTClient(cfg)
+
+    def test_first_cycle_samples_then_no_sleep(self):
+        primed = "T 100.00\nW 0\nI 192.168.1.243 0\n.\nT 101.00\nW 125000\nI 192.168.1.243 0\n.\n"
+        later = "T 131.00\nW 3875000\nI 192.168.1.243 1875000\n.\n"
+        self.client._run_ssh = MagicMock(side_effect=[primed, primed, later])
+
+        first = self.client.sample_upload_rates(['192.168.1.243'])
+        second = self.client.sample_upload_rates(['192.168.1.243'])
+
+        self.assertAlmostEqual(first.total_mbps, 1.0)
+        scripts = [c.args[0] for c in self.client._run_ssh.call_args_list]
+        self.assertNotIn('sleep', scripts[0])
+        self.assertIn('sleep', scripts[1])
+        self.assertNotIn('sleep', scripts[2])
+        self.assertAlmostEqual(second.total_mbps, 1.0)
+        self.assertAlmostEqual(second.per_ip['192.168.1.243'], 0.5)
+        self.assertAlmostEqual(second.interval, 30.0)
+
+    def test_new_ip_is_baselined_without_resampling(self):
+        primed = "T 100.00\nW 0\nI 192.168.1.243 0\n.\nT 101.00\nW 125000\nI 192.168.1.243 0\n.\n"
+        later = ("T 131.00\nW 3875000\nI 192.168.1.243 1875000\n"
+                 "I 203.0.113.5 50000000\n.\n")
+        self.client._run_ssh = MagicMock(side_effect=[primed, primed, later])
+
+        self.client.sample_upload_rates(['192.168.1.243'])
+        sample = self.client.sample_upload_rates(['192.168.1.243', '203.0.113.5'])
+
+        scripts = [c.args[0] for c in self.client._run_ssh.call_args_list]
+        self.assertNotIn('sleep', scripts[-1])
+        self.assertAlmostEqual(sample.total_mbps, 1.0)
+        self.assertEqual(sample.per_ip, {'192.168.1.243': 0.5})
+
+    def test_new_client_ip_waits_for_a_baseline(self):
+        self.client.config.client_accounting = 'conntrack'
+        self.client._read_client_dumps = MagicMock(side_effect=[
+            [(100.0, {'a': ('203.0.113.5', 0)}), (101.0, {'a': ('203.0.113.5', 125000)})],
+            [(131.0, {'a': ('203.0.113.5', 3875000), 'b': ('198.51.100.1', 90_000_000)})],
+            [(161.0, {'a': ('203.0.113.5', 7625000), 'b': ('198.51.100.1', 93_750_000)})],
+        ])
+        self.client.get_client_upload_rates(['203.0.113.5'])
+        # The newcomer's lifetime byte count is not one interval's traffic
+        rates = self.client.get_client_upload_rates(['203.0.113.5', '198.51.100.1'])
+        self.assertEqual(rates, {'203.0.113.5': 1.0})
+        rates = self.client.get_client_upload_rates(['203.0.113.5', '198.51.100.1'])
+        self.assertAlmostEqual(rates['203.0.113.5'], 1.0)
+        self.assertAlmostEqual(rates['198.51.100.1'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import yaml
+
+from modules.allocation import to_list, water_fill
+from modules.bandwidth_manager import BandwidthManager, HierarchicalAlgorithm
+from modules.config import BandwidthConfig, Config
+from modules.groups import DEFAULT_GROUP, GroupConfig, GroupIndex
+
+
+def streamer(demand_mbps=None, name='', admin=False, ip=None):
+    session = {'TranscodingInfo': {'Bitrate': int(demand_mbps * 1_000_000)}} if demand_mbps else {}
+    return {
+        'session_data': session,
+        'user_data': {'Name': name, 'Policy': {'IsAdministrator': admin}},
+        'ip': ip,
+    }
+
+
+class TestGroupIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GroupIndex.from_config([
+            {'name': 'family', 'weight': 3, 'users': ['u1'], 'user_names': ['Alice']},
+            {'name': 'admins', 'weight': 2, 'policy_flags': ['IsAdministrator']},
+            {'name': 'friends', 'ip_ranges': ['203.0.113.0/24', '2001:db8:42::/48']},
+        ])
+
+    def test_matches_each_rule_type(self):
+        self.assertEqual(self.index.group_of('u1').name, 'family')
+        self.assertEqual(self.index.group_of('u9', {'Name': 'alice'}).name, 'family')
+        self.assertEqual(
+            self.index.group_of('u9', {'Policy': {'IsAdministrator': True}}).name, 'admins'
+        )
+        self.assertEqual(self.index.group_of('u9', ip='203.0.113.7').name, 'friends')
+        self.assertEqual(self.index.group_of('u9', ip='2001:db8:42:1::5').name, 'friends')
+        self.assertIs(self.index.group_of('u9', ip='198.51.100.1'), DEFAULT_GROUP)
+        self.assertIs(self.index.group_of('u9', ip='not an ip'), DEFAULT_GROUP)
+
+    def test_first_listed_group_wins(self):
+        group = self.index.group_of('u2', {'Name': 'Alice', 'Policy': {'IsAdministrator': True}},
+                                    '203.0.113.7')
+        self.assertEqual(group.name, 'family')
+        group = self.index.group_of('u2', {'Policy': {'IsAdministrator': True}}, '203.0.113.7')
+        self.assertEqual(group.name, 'admins')
+
+    def test_rejects_invalid_groups(self):
+        for groups in (
+            [GroupConfig('a'), GroupConfig('a')],
+            [GroupConfig('default')],
+            [GroupConfig('a', weight=0)],
+            [GroupConfig('a', min_mbps=10, max_mbps=5)],
+            [GroupConfig('a', ip_ranges=['10.0.0.0/33'])],
+        ):
+            with self.assertRaises(ValueError):
+                GroupIndex(groups)
+
+
+class TestWeightedWaterFill(unittest.TestCase):
+    def test_shares_follow_weights_between_bounds(self):
+        self.assertEqual(to_list(water_fill(12, 0, 100, 2, weights=[3, 1])), [9, 3])
+        # The capped user's leftover goes to the others by weight
+        self.assertEqual(to_list(water_fill(12, 0, [2, 100, 100], weights=[4, 2, 1])), [2, 20 / 3, 10 / 3])
+        self.assertEqual(to_list(water_fill(12, [6, 0], 100, weights=[1, 3])), [6, 6])
+
+
+class TestHierarchicalAlgorithm(unittest.TestCase):
+    def setUp(self):
+        self.config = BandwidthConfig(min_per_user=2.0, max_per_user=50.0, groups=[
+            {'name': 'family', 'weight': 3, 'user_names': ['alice', 'bob']},
+            {'name': 'friends', 'weight': 1, 'max_mbps': 10},
+            {'name': 'guests', 'weight': 1, 'min_mbps': 8, 'ip_ranges': ['198.51.100.0/24']},
+        ])
+        self.algorithm = HierarchicalAlgorithm()
+
+    def test_groups_split_by_weight_then_users_split_within(self):
+        self.config.groups = self.config.groups[:1]
+        streamers = {
+            'a': streamer(30, 'alice'), 'b': streamer(30, 'bob'), 'c': streamer(30), 'd': streamer(30),
+        }
+        limits = self.algorithm.calculate_limits(streamers, 40.0, self.config)
+        # family (weight 3) gets 30, the two default users share 10
+        self.assertAlmostEqual(limits['a'], 15.0)
+        self.assertAlmostEqual(limits['b'], 15.0)
+        self.assertAlmostEqual(limits['c'], 5.0)
+        self.assertAlmostEqual(limits['d'], 5.0)
+
+    def test_account_streams_share_one_user_share(self):
+        self.config.groups = self.config.groups[:1]
+        streamers = {key: streamer(30, 'alice') for key in ('a1', 'a2', 'a3')}
+        for key in streamers:
+            streamers[key]['user_id'] = 'alice'
+        streamers['b'] = streamer(30, 'bob')
+        limits = self.algorithm.calculate_limits(streamers, 40.0, self.config)
+        # alice's three devices split one user share, not three
+        for key in ('a1', 'a2', 'a3'):
+            self.assertAlmostEqual(limits[key], 20.0 / 3)
+        self.assertAlmostEqual(limits['b'], 20.0)
+
+    def test_guarantees_and_ceilings(self):
+        self.config.groups[1]['users'] = ['f']
+        streamers = {
+            'a': streamer(40, 'alice'), 'f': streamer(40), 'g': streamer(40, ip='198.51.100.9'),
+        }
+        limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        self.assertAlmostEqual(sum(limits.values()), 30.0)
+        self.assertGreaterEqual(limits['g'], 8.0)
+        self.assertLessEqual(limits['f'], 10.0)
+        self.assertAlmostEqual(limits['a'] / limits['f'], 3.0)
+
+        # With plenty of bandwidth the friends group stays at its ceiling
+        limits = self.algorithm.calculate_limits(streamers, 500.0, self.config)
+        self.assertEqual(limits['f'], 10.0)
+        self.assertEqual(limits['a'], 50.0)
+
+    def test_guarantees_scale_down_to_the_budget(self):
+        self.config.groups[0]['min_mbps'] = 24
+        streamers = {'a': streamer(40, 'alice'), 'g': streamer(40, ip='198.51.100.9')}
+        limits = self.algorithm.calculate_limits(streamers, 16.0, self.config)
+        self.assertAlmostEqual(limits['a'], 12.0)
+        self.assertAlmostEqual(limits['g'], 4.0)
+
+    def test_registered_and_without_groups_matches_water_filling_shares(self):
+        manager = BandwidthManager(BandwidthConfig(algorithm='hierarchical'))
+        self.assertIsInstance(manager.algorithm, HierarchicalAlgorithm)
+        streamers = {'a': streamer(3), 'b': streamer(30), 'c': streamer(8)}
+        limits = self.algorithm.calculate_limits(streamers, 20.0, BandwidthConfig())
+        self.assertAlmostEqual(limits['a'], 3.0)
+        self.assertAlmostEqual(limits['c'], 8.0)
+        self.assertAlmostEqual(limits['b'], 9.0)
+
+
+class TestGroupConfig(unittest.TestCase):
+    def load(self, groups):
+        data = yaml.safe_load(Path('config.example.yml').read_text())
+        data['bandwidth']['groups'] = groups
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'config.yml'
+            path.write_text(yaml.safe_dump(data))
+            return Config(str(path))
+
+    def test_index_built_at_load(self):
+        config = self.load([{'name': 'family', 'weight': 3, 'user_names': ['alice']}])
+        self.assertEqual(config.bandwidth.group_index.group_of('x', {'Name': 'Alice'}).name, 'family')
+        self.assertFalse(self.load(None).bandwidth.group_index)
+
+    def test_invalid_groups_rejected(self):
+        with self.assertRaises(ValueError):
+            self.load([{'name': 'family', 'weight': -1}])
+        with self.assertRaises(ValueError):
+            self.load([{'name': 'family', 'unknown': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import yaml
+
+from modules.bandwidth_manager import BandwidthManager, HouseholdAlgorithm
+from modules.config import BandwidthConfig, Config
+from modules.households import SiteCeilings, site_key
+
+
+def streamer(ip, demand_mbps=20, paused=False):
+    return {
+        'ip': ip,
+        'session_data': {
+            'NowPlayingItem': {'Id': 'item'},
+            'PlayState': {'IsPaused': paused},
+            'TranscodingInfo': {'Bitrate': int(demand_mbps * 1_000_000)},
+        },
+        'user_data': {},
+    }
+
+
+class TestSiteKey(unittest.TestCase):
+    def test_sites(self):
+        self.assertEqual(site_key('203.0.113.7'), '203.0.113.7')
+        self.assertEqual(site_key('2001:db8:1:2:aaaa::1'), '2001:db8:1:2::/64')
+        self.assertEqual(site_key('2001:db8:1:2:aaaa::1', 48), '2001:db8:1::/48')
+        self.assertEqual(site_key('::ffff:203.0.113.7'), '203.0.113.7')
+        self.assertEqual(site_key('unknown'), 'unknown')
+
+
+class TestSiteCeilings(unittest.TestCase):
+    def test_configured_then_learned_then_default(self):
+        ceilings = SiteCeilings(
+            {'203.0.113.0/24': 20, '203.0.113.7': 8, '2001:db8::/32': 30}, default=50
+        )
+        self.assertEqual(ceilings.ceiling('203.0.113.7'), 8)
+        self.assertEqual(ceilings.ceiling('203.0.113.9'), 20)
+        self.assertEqual(ceilings.ceiling('2001:db8:1:2::/64'), 30)
+        self.assertEqual(ceilings.ceiling('198.51.100.1'), 50)
+        self.assertIsNone(SiteCeilings().ceiling('198.51.100.1'))
+        with self.assertRaises(ValueError):
+            SiteCeilings({'not-an-ip': 5})
+
+    def test_learns_saturated_site_and_probes_up(self):
+        ceilings = SiteCeilings(confirm_cycles=2)
+        # Allowed 20 and wanting 20 but only receiving 10: downlink-limited,
+        # once it lasts
+        ceilings.observe('s', allocated=20, measured=10, demand=20, now=0)
+        self.assertIsNone(ceilings.ceiling('s'))
+        ceilings.observe('s', allocated=20, measured=10, demand=20, now=1)
+        self.assertAlmostEqual(ceilings.ceiling('s'), 12.0)
+        # Reaching the learned ceiling raises it
+        ceilings.observe('s', allocated=12, measured=11.5, demand=20, now=2)
+        self.assertAlmostEqual(ceilings.ceiling('s'), 18.0)
+        # Until it covers the demand and is dropped
+        ceilings.observe('s', allocated=18, measured=17, demand=20, now=3)
+        self.assertIsNone(ceilings.ceiling('s'))
+
+    def test_short_dips_and_skipped_cycles_do_not_learn(self):
+        ceilings = SiteCeilings(confirm_cycles=3)
+        for now in range(2):
+            ceilings.observe('s', allocated=20, measured=1, demand=20, now=now)
+        ceilings.skip('s')
+        ceilings.observe('s', allocated=20, measured=1, demand=20, now=3)
+        ceilings.observe('s', allocated=20, measured=19, demand=20, now=4)
+        ceilings.observe('s', allocated=20, measured=1, demand=20, now=5)
+        self.assertIsNone(ceilings.ceiling('s'))
+
+    def test_never_learns_below_minimum(self):
+        ceilings = SiteCeilings(confirm_cycles=1)
+        ceilings.observe('s', allocated=20, measured=0.05, demand=8, minimum=4, now=0)
+        self.assertEqual(ceilings.ceiling('s'), 4)
+
+    def test_ignores_idle_sites_and_expires(self):
+        ceilings = SiteCeilings(ttl=60, confirm_cycles=1)
+        ceilings.observe('s', allocated=20, measured=0, demand=20, now=0)
+        self.assertIsNone(ceilings.ceiling('s'))
+        ceilings.observe('s', allocated=20, measured=5, demand=20, now=0)
+        ceilings.touch(['s'], now=50)
+        ceilings.touch([], now=100)
+        self.assertIsNotNone(ceilings.ceiling('s'))
+        ceilings.touch([], now=111)
+        self.assertIsNone(ceilings.ceiling('s'))
+
+    def test_learning_can_be_disabled(self):
+        ceilings = SiteCeilings(learn=False)
+        ceilings.observe('s', allocated=20, measured=5, demand=20, now=0)
+        self.assertIsNone(ceilings.ceiling('s'))
+
+
+class TestHouseholdAlgorithm(unittest.TestCase):
+    def setUp(self):
+        self.config = BandwidthConfig(min_per_user=2.0, max_per_user=50.0)
+        self.algorithm = HouseholdAlgorithm()
+
+    def test_sites_share_equally_and_split_within(self):
+        streamers = {
+            'a1': streamer('203.0.113.7'), 'a2': streamer('203.0.113.7'),
+            'b1': streamer('2001:db8:0:1::5'), 'b2': streamer('2001:db8:0:1::6'),
+            'c1': streamer('198.51.100.1'),
+        }
+        limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        self.assertAlmostEqual(sum(limits.values()), 30.0)
+        for key in ('a1', 'a2', 'b1', 'b2'):
+            self.assertAlmostEqual(limits[key], 5.0)
+        self.assertAlmostEqual(limits['c1'], 10.0)
+
+    def test_capped_site_hands_excess_to_others(self):
+        self.config.site_ceilings = {'203.0.113.7': 4}
+        streamers = {
+            'a1': streamer('203.0.113.7'), 'a2': streamer('203.0.113.7'),
+            'b1': streamer('198.51.100.1'),
+        }
+        limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        self.assertAlmostEqual(limits['a1'] + limits['a2'], 4.0)
+        self.assertAlmostEqual(limits['b1'], 26.0)
+
+    def test_learns_ceiling_from_measured_rate(self):
+        streamers = {'a1': streamer('203.0.113.7', 20), 'b1': streamer('198.51.100.1', 20)}
+        limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        self.assertEqual(limits, {'a1': 15.0, 'b1': 15.0})
+
+        # Site a only takes 5 of its 15 Mbps for several cycles; site b
+        # uses its share
+        streamers['a1']['measured_mbps'] = 5.0
+        streamers['b1']['measured_mbps'] = 15.0
+        for _ in range(SiteCeilings().confirm_cycles):
+            limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        self.assertAlmostEqual(limits['a1'], 6.0)
+        self.assertAlmostEqual(limits['b1'], 24.0)
+
+    def test_direct_play_limit_detected_from_bitrate(self):
+        # Direct play: demand would default to the measured rate itself
+        direct = {'NowPlayingItem': {'Id': 'item', 'Bitrate': 20_000_000}}
+        streamers = {
+            'a1': {'ip': '203.0.113.7', 'session_data': direct, 'user_data': {}},
+            'b1': streamer('198.51.100.1', 20),
+        }
+        self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        streamers['a1']['measured_mbps'] = 5.0
+        streamers['b1']['measured_mbps'] = 15.0
+        for _ in range(SiteCeilings().confirm_cycles):
+            limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        self.assertAlmostEqual(limits['a1'], 6.0)
+
+    def test_paused_session_does_not_lower_ceiling(self):
+        streamers = {'a1': streamer('203.0.113.7', 8), 'b1': streamer('198.51.100.1', 20)}
+        self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        streamers['b1']['measured_mbps'] = 15.0
+        streamers['a1']['session_data']['PlayState']['IsPaused'] = True
+        streamers['a1']['measured_mbps'] = 0.05
+        for _ in range(5):
+            limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        self.assertIsNone(self.algorithm.ceilings.ceiling('203.0.113.7'))
+        self.assertGreaterEqual(limits['a1'], self.config.min_per_user)
+
+    def test_recovers_when_the_link_improves(self):
+        streamers = {'a1': streamer('203.0.113.7', 20), 'b1': streamer('198.51.100.1', 20)}
+        self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        streamers['a1']['measured_mbps'] = 0.5
+        streamers['b1']['measured_mbps'] = 15.0
+        for _ in range(SiteCeilings().confirm_cycles):
+            limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+        # Learned ceiling is held at min_per_user, not at the measured 0.6
+        self.assertAlmostEqual(limits['a1'], self.config.min_per_user)
+
+        # The link recovers: the site fills its ceiling and the ceiling grows
+        # until it covers the stream again
+        cycles = 0
+        while self.algorithm.ceilings.ceiling('203.0.113.7') is not None:
+            streamers['a1']['measured_mbps'] = limits['a1']
+            limits = self.algorithm.calculate_limits(streamers, 30.0, self.config)
+            cycles += 1
+        self.assertLessEqual(cycles, 6)
+        self.assertAlmostEqual(limits['a1'], 15.0)
+
+    def test_registered(self):
+        manager = BandwidthManager(BandwidthConfig(algorithm='household'))
+        self.assertIsInstance(manager.algorithm, HouseholdAlgorithm)
+
+
+class TestSiteConfig(unittest.TestCase):
+    def load(self, **bandwidth):
+        data = yaml.safe_load(Path('config.example.yml').read_text())
+        data['bandwidth'].update(bandwidth)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'config.yml'
+            path.write_text(yaml.safe_dump(data))
+            return Config(str(path))
+
+    def test_site_options_validated(self):
+        config = self.load(algorithm='household', site_ceilings={'203.0.113.0/24': 20})
+        self.assertEqual(config.bandwidth.site_ceilings, {'203.0.113.0/24': 20})
+        for options in ({'site_ceilings': {'bad': 5}}, {'site_ceilings': {'203.0.113.7': 0}},
+                        {'ipv6_site_prefix': 129}, {'site_ceiling_mbps': -1}):
+            with self.assertRaises(ValueError):
+                self.load(**options)
+
+
+if __name__ == '__main__':
+    unittest.main()
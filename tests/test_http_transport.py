@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from modules.http_transport import HTTPTransport, endpoint_name
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails the first request per path with 503; /slow never answers in time."""
+    seen = {}
+
+    def _reply(self):
+        FlakyHandler.seen[self.path] = FlakyHandler.seen.get(self.path, 0) + 1
+        if self.path == '/slow':
+            time.sleep(1)
+        status = 503 if FlakyHandler.seen[self.path] == 1 else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FlakyHandler.seen = {}
+        self.transport = HTTPTransport(connect_timeout=1, read_timeout=0.2, retries=2, backoff=0)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_get_is_retried(self):
+        response = self.transport.get(f"{self.base}/Sessions")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FlakyHandler.seen['/Sessions'], 2)
+
+    def test_post_is_not_retried(self):
+        response = self.transport.post(f"{self.base}/Users/1/Policy", json={})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(FlakyHandler.seen['/Users/1/Policy'], 1)
+
+    def test_default_timeout_bounds_slow_requests(self):
+        transport = HTTPTransport(read_timeout=0.2, retries=0)
+        start = time.monotonic()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            transport.get(f"{self.base}/slow")
+        self.assertLess(time.monotonic() - start, 0.9)
+        transport.close()
+
+    def test_latency_counted_per_endpoint(self):
+        self.transport.post(f"{self.base}/Users/1/Policy", json={})
+        self.transport.post(f"{self.base}/Users/2/Policy", json={})
+        stats = self.transport.latency_stats()['POST /Users/{id}/Policy']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['errors'], 2)
+        self.assertGreaterEqual(stats['max'], stats['avg'])
+
+    def test_endpoint_name(self):
+        self.assertEqual(
+            endpoint_name('get', 'http://h/Users/5d1f0a2b3c4d4e5f8a9b0c1d2e3f4a5b/Policy'),
+            'GET /Users/{id}/Policy'
+        )
+        self.assertEqual(endpoint_name('POST', 'http://h/Sessions'), 'POST /Sessions')
+
+
+if __name__ == '__main__':
+    unittest.main()
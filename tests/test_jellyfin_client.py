@@ -1,3 +1,4 @@
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 from modules.jellyfin_client import JellyfinClient
@@ -72,5 +73,72 @@ class TestJellyfinClient(unittest.TestCase):
         self.assertIn('from 10.00 Mbps to 5.00 Mbps (playing)', logs)
         self.assertIn('restarted stream (session s1)', logs)
 
+class TestAppliedLimitCache(unittest.TestCase):
+    def setUp(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key',
+                             limit_tolerance=0.05, limit_verify_interval=300)
+        self.client = JellyfinClient(cfg)
+        self.client.get_user_info = MagicMock(return_value={'Name': 'user1'})
+        self.client.get_user_policy = MagicMock(
+            side_effect=lambda user_id, **kwargs: {'RemoteClientBitrateLimit': 10000000}
+        )
+        self.client.restart_stream = MagicMock(return_value=True)
+        self.session = {'Id': 's1', 'UserId': 'user1', 'NowPlayingItem': {'Id': 'i1'}}
+
+    def test_steady_limit_makes_no_requests(self):
+        with patch.object(self.client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            self.client.set_user_bandwidth_limit('user1', 5.0, self.session)
+            for limit in (5.0, 5.1, 4.9):
+                self.assertTrue(self.client.set_user_bandwidth_limit('user1', limit, self.session))
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(self.client.get_user_policy.call_count, 1)
+        self.assertEqual(self.client.restart_stream.call_count, 1)
+
+    def test_change_beyond_tolerance_is_applied(self):
+        with patch.object(self.client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            self.client.set_user_bandwidth_limit('user1', 5.0, self.session)
+            self.client.set_user_bandwidth_limit('user1', 6.0, self.session)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(mock_post.call_args.kwargs['json']['RemoteClientBitrateLimit'], 6_000_000)
+
+    def test_server_already_matching_skips_write_and_restart(self):
+        with patch.object(self.client.session, 'post') as mock_post:
+            self.assertTrue(self.client.set_user_bandwidth_limit('user1', 10.0, self.session))
+        mock_post.assert_not_called()
+        self.client.restart_stream.assert_not_called()
+
+    def test_cached_limit_reverified_after_interval(self):
+        with patch.object(self.client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            self.client.set_user_bandwidth_limit('user1', 5.0, self.session)
+            bps, _ = self.client._applied_limits['user1']
+            self.client._applied_limits['user1'] = (bps, time.monotonic() - 301)
+
+            # Someone changed the policy on the server in the meantime
+            self.client.set_user_bandwidth_limit('user1', 5.0, self.session)
+
+        self.assertEqual(self.client.get_user_policy.call_count, 2)
+        self.assertEqual(self.client.get_user_policy.call_args.kwargs, {'fresh': True})
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_reverification_bypasses_user_directory(self):
+        client = JellyfinClient(self.client.config)
+        client.restart_stream = MagicMock(return_value=True)
+        # Directory snapshot still shows the limit the daemon applied
+        client.users.put({'Id': 'user1', 'Name': 'user1',
+                          'Policy': {'RemoteClientBitrateLimit': 5_000_000}})
+        client._applied_limits['user1'] = (5_000_000, time.monotonic() - 301)
+        server = MagicMock(status_code=200)
+        server.json.return_value = {'RemoteClientBitrateLimit': 0}
+
+        with patch.object(client.session, 'get', return_value=server) as mock_get, \
+                patch.object(client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            self.assertTrue(client.set_user_bandwidth_limit('user1', 5.0, self.session))
+
+        urls = [call.args[0] for call in mock_get.call_args_list]
+        self.assertTrue(any(url.endswith('/Users/user1/Policy') for url in urls))
+        self.assertEqual(mock_post.call_args.kwargs['json']['RemoteClientBitrateLimit'], 5_000_000)
+
+
 if __name__ == '__main__':
     unittest.main()
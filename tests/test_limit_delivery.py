@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from modules.config import JellyfinConfig
+from modules.jellyfin_client import JellyfinClient
+
+
+def session(session_id, client='Jellyfin Web', commands=None):
+    data = {'Id': session_id, 'UserId': 'user1', 'Client': client,
+            'ApplicationVersion': '10.9.0', 'NowPlayingItem': {'Id': 'i1'},
+            'SupportsRemoteControl': True}
+    if commands is not None:
+        data['Capabilities'] = {'SupportedCommands': commands}
+    return data
+
+
+class TestLimitDelivery(unittest.TestCase):
+    def setUp(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key', limit_delivery='command')
+        self.client = JellyfinClient(cfg)
+        self.client.get_user_info = MagicMock(return_value={'Name': 'user1'})
+        self.client.get_user_policy = MagicMock(
+            side_effect=lambda user_id: {'RemoteClientBitrateLimit': 10000000}
+        )
+        self.client.restart_stream = MagicMock(return_value=True)
+
+    def test_capable_client_gets_command_instead_of_restart(self):
+        with patch.object(self.client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            self.client.set_user_bandwidth_limit(
+                'user1', 5.0, session('s1', commands=['SetMaxStreamingBitrate'])
+            )
+
+        self.client.restart_stream.assert_not_called()
+        url, kwargs = mock_post.call_args.args[0], mock_post.call_args.kwargs
+        self.assertTrue(url.endswith('/Sessions/s1/Command'))
+        self.assertEqual(kwargs['json'], {
+            'Name': 'SetMaxStreamingBitrate', 'Arguments': {'MaxBitrate': '5000000'}
+        })
+
+    def test_client_without_command_is_restarted(self):
+        with patch.object(self.client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            self.client.set_user_bandwidth_limit('user1', 5.0, session('s1', commands=['Play']))
+
+        self.client.restart_stream.assert_called_once()
+        # Only the policy write, no command attempt
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_unknown_support_restarts_without_a_command(self):
+        with patch.object(self.client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            # No Capabilities: a 204 would not prove the client applies it
+            self.client.set_user_bandwidth_limit('user1', 5.0, session('s1', client='TV'))
+
+        self.client.restart_stream.assert_called_once()
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertIsNone(self.client.supports_bitrate_command(session('s2', client='TV')))
+
+    def test_failed_command_falls_back_without_caching(self):
+        responses = {'/Command': MagicMock(status_code=400)}
+
+        def post(url, **kwargs):
+            return responses.get(url[url.rfind('/'):], MagicMock(status_code=204))
+
+        capable = ['SetMaxStreamingBitrate']
+        with patch.object(self.client.session, 'post', side_effect=post) as mock_post:
+            self.client.set_user_bandwidth_limit('user1', 5.0, session('s1', commands=capable))
+            self.client.forget_applied_limit()
+            self.client.set_user_bandwidth_limit('user1', 6.0, session('s2', commands=capable))
+
+        commands = [c for c in mock_post.call_args_list if c.args[0].endswith('/Command')]
+        self.assertEqual(len(commands), 2)
+        self.assertEqual(self.client.restart_stream.call_count, 2)
+        self.assertTrue(self.client.supports_bitrate_command(session('s3', commands=capable)))
+
+    def test_cached_support_expires(self):
+        self.assertFalse(self.client.supports_bitrate_command(session('s1', commands=['Play'])))
+        updated = session('s2', commands=['SetMaxStreamingBitrate'])
+        self.assertFalse(self.client.supports_bitrate_command(updated))
+        key = 'Jellyfin Web/10.9.0'
+        supported, learned = self.client._command_support[key]
+        self.client._command_support[key] = (supported, learned - 3601)
+        self.assertTrue(self.client.supports_bitrate_command(updated))
+
+    def test_restart_is_the_default(self):
+        client = JellyfinClient(JellyfinConfig(host='localhost', port=8096, api_key='key'))
+        client.get_user_info = self.client.get_user_info
+        client.get_user_policy = self.client.get_user_policy
+        client.restart_stream = MagicMock(return_value=True)
+        with patch.object(client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            client.set_user_bandwidth_limit('user1', 5.0, session('s1', commands=['SetMaxStreamingBitrate']))
+        client.restart_stream.assert_called_once()
+        self.assertEqual(mock_post.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import MagicMock
+
+from jellydemon import JellyDemon
+from modules.config import RouterConfig
+from modules.openwrt_client import OpenWRTClient, BandwidthSample
+
+
+SNAPSHOT_OUTPUT = """T 100.00
+W 1000000
+I 192.168.1.243 400000
+I 203.0.113.5 100000
+.
+T 101.00
+W 2250000
+I 192.168.1.243 900000
+I 203.0.113.5 225000
+.
+"""
+
+
+class TestUploadSampler(unittest.TestCase):
+    def setUp(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw', use_ssh=True)
+        self.client = OpenWRTClient(cfg)
+
+    def test_single_round_trip_for_total_and_ips(self):
+        self.client._run_ssh = MagicMock(return_value=SNAPSHOT_OUTPUT)
+
+        sample = self.client.sample_upload_rates(['192.168.1.243', '203.0.113.5'])
+
+        self.client._run_ssh.assert_called_once()
+        script = self.client._run_ssh.call_args.args[0]
+        self.assertEqual(script.count('sleep'), 1)
+        self.assertIn('192.168.1.243 203.0.113.5', script)
+        self.assertAlmostEqual(sample.total_mbps, 10.0)
+        self.assertAlmostEqual(sample.per_ip['192.168.1.243'], 4.0)
+        self.assertAlmostEqual(sample.per_ip['203.0.113.5'], 1.0)
+        self.assertAlmostEqual(sample.interval, 1.0)
+
+    def test_rejects_non_ip_input(self):
+        self.client._run_ssh = MagicMock(return_value=SNAPSHOT_OUTPUT)
+
+        sample = self.client.sample_upload_rates(['1.2.3.4; reboot'])
+
+        self.client._run_ssh.assert_not_called()
+        self.assertEqual(sample.total_mbps, 0.0)
+
+    def test_invalid_output(self):
+        self.client._run_ssh = MagicMock(return_value='garbage')
+        sample = self.client.sample_upload_rates(['192.168.1.243'])
+        self.assertEqual(sample.per_ip, {'192.168.1.243': 0.0})
+
+
+class TestDaemonUsesSampler(unittest.TestCase):
+    def test_jellyfin_traffic_subtracted_from_same_sample(self):
+        daemon = JellyDemon('config.example.yml')
+        daemon.openwrt.sample_upload_rates = MagicMock(
+            return_value=BandwidthSample(total_mbps=30.0, per_ip={'192.168.1.243': 12.0})
+        )
+        daemon.openwrt.get_bandwidth_usage = MagicMock()
+
+        usage = daemon.get_current_bandwidth_usage()
+
+        self.assertAlmostEqual(usage, 18.0)
+        daemon.openwrt.sample_upload_rates.assert_called_once_with(['192.168.1.243'])
+        daemon.openwrt.get_bandwidth_usage.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
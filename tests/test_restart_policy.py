@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from modules.config import JellyfinConfig
+from modules.jellyfin_client import JellyfinClient
+from modules.restart_policy import quality_rung, restart_needed
+
+MBPS = 1_000_000
+
+
+def direct_play(source_mbps):
+    return {'Id': 's1', 'UserId': 'user1',
+            'NowPlayingItem': {'Id': 'i1', 'MediaSources': [{'Id': 'ms1', 'Bitrate': source_mbps * MBPS}]},
+            'PlayState': {'MediaSourceId': 'ms1'}}
+
+
+def transcode(source_mbps, stream_mbps):
+    session = direct_play(source_mbps)
+    session['TranscodingInfo'] = {'Bitrate': stream_mbps * MBPS, 'IsVideoDirect': False}
+    return session
+
+
+class TestRestartNeeded(unittest.TestCase):
+    def test_lower_limit_restarts_only_streams_above_it(self):
+        self.assertTrue(restart_needed(direct_play(12), 20 * MBPS, 10 * MBPS)[0])
+        self.assertFalse(restart_needed(direct_play(8), 20 * MBPS, 10 * MBPS)[0])
+        self.assertFalse(restart_needed(transcode(40, 6), 8 * MBPS, 7 * MBPS)[0])
+
+    def test_raised_limit_restarts_only_for_a_better_rung(self):
+        # 6 -> 7 Mbps: the client still picks the 6 Mbps rung
+        self.assertFalse(restart_needed(transcode(40, 6), 6 * MBPS, 7 * MBPS)[0])
+        self.assertTrue(restart_needed(transcode(40, 6), 6 * MBPS, 8 * MBPS)[0])
+        # Direct play is already at source quality
+        self.assertFalse(restart_needed(direct_play(8), 10 * MBPS, 20 * MBPS)[0])
+        # A raise past the source bitrate allows direct play
+        self.assertTrue(restart_needed(transcode(9, 8), 8.5 * MBPS, 10 * MBPS)[0])
+
+    def test_unknown_bitrate_restarts(self):
+        session = {'Id': 's1', 'NowPlayingItem': {'Id': 'i1'}}
+        self.assertEqual(restart_needed(session, 0, 5 * MBPS), (True, "stream bitrate unknown"))
+
+    def test_quality_rung(self):
+        self.assertEqual(quality_rung(7 * MBPS, [10, 8, 6, 4]), 6 * MBPS)
+        self.assertEqual(quality_rung(1 * MBPS, [10, 8]), 0)
+
+
+class TestClientSkipsRestarts(unittest.TestCase):
+    def make_client(self, **kwargs):
+        client = JellyfinClient(JellyfinConfig(host='localhost', port=8096, api_key='key', **kwargs))
+        client.get_user_info = MagicMock(return_value={'Name': 'user1'})
+        client.get_user_policy = MagicMock(
+            side_effect=lambda user_id: {'RemoteClientBitrateLimit': 20 * MBPS}
+        )
+        client.restart_stream = MagicMock(return_value=True)
+        return client
+
+    def test_fitting_stream_is_not_restarted(self):
+        client = self.make_client()
+        with patch.object(client.session, 'post', return_value=MagicMock(status_code=204)):
+            with self.assertLogs('jellydemon.jellyfin', level='INFO') as cm:
+                self.assertTrue(client.set_user_bandwidth_limit('user1', 10.0, direct_play(8)))
+        client.restart_stream.assert_not_called()
+        self.assertIn('no restart needed', cm.output[-1])
+
+    def test_decision_can_be_disabled(self):
+        client = self.make_client(skip_unneeded_restarts=False)
+        with patch.object(client.session, 'post', return_value=MagicMock(status_code=204)):
+            client.set_user_bandwidth_limit('user1', 10.0, direct_play(8))
+        client.restart_stream.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
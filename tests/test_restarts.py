@@ -0,0 +1,192 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from modules.config import JellyfinConfig
+from modules.jellyfin_client import JellyfinClient
+from modules.restarts import RestartOrchestrator, RestartScheduler
+
+
+def playing(session_id):
+    return {'Id': session_id, 'UserId': f'user-{session_id}',
+            'NowPlayingItem': {'Id': 'i1', 'MediaSources': [{'Id': 'ms1'}]},
+            'PlayState': {'PositionTicks': 10}}
+
+
+class SlowJellyfin:
+    """Records Stop/PlayNow timing with a fixed per-request latency."""
+
+    def __init__(self, latency=0.05, reject=()):
+        self.client = JellyfinClient(JellyfinConfig(host='localhost', port=8096, api_key='key'))
+        self.latency = latency
+        self.reject = set(reject)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.client.session.post = self.post
+
+    def post(self, url, params=None, json=None, timeout=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.calls.append((time.monotonic(), url, timeout))
+        time.sleep(self.latency)
+        with self._lock:
+            self.active -= 1
+        session_id = url.split('/Sessions/')[1].split('/')[0]
+        status = 500 if session_id in self.reject and url.endswith('/Playing') else 204
+        return MagicMock(status_code=status)
+
+
+class TestRestartOrchestrator(unittest.TestCase):
+    def test_restarts_run_concurrently_and_do_not_block(self):
+        fake = SlowJellyfin(latency=0.05)
+        orchestrator = RestartOrchestrator(fake.client, max_concurrent=4, delay=0.2, deadline=5)
+
+        start = time.monotonic()
+        futures = [orchestrator.submit(playing(f's{i}')) for i in range(10)]
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        results = [f.result(timeout=5) for f in futures]
+        elapsed = time.monotonic() - start
+        orchestrator.shutdown()
+
+        self.assertTrue(all(r.success for r in results))
+        # Serially this would take 10 * (0.05 + 0.2 + 0.05) = 3 s
+        self.assertLess(elapsed, 1.5)
+        self.assertLessEqual(fake.max_active, 4)
+        self.assertEqual(orchestrator.succeeded, 10)
+
+    def test_keeps_stop_to_play_delay_per_session(self):
+        fake = SlowJellyfin(latency=0.01)
+        orchestrator = RestartOrchestrator(fake.client, max_concurrent=2, delay=0.15)
+        orchestrator.submit(playing('s1')).result(timeout=5)
+        orchestrator.shutdown()
+
+        (stop_time, stop_url, _), (play_time, play_url, _) = fake.calls
+        self.assertTrue(stop_url.endswith('/Sessions/s1/Playing/Stop'))
+        self.assertTrue(play_url.endswith('/Sessions/s1/Playing'))
+        self.assertGreaterEqual(play_time - stop_time, 0.15)
+
+    def test_reports_failures_and_deadlines(self):
+        fake = SlowJellyfin(latency=0.01, reject={'bad'})
+        orchestrator = RestartOrchestrator(fake.client, max_concurrent=2, delay=0.05, deadline=5)
+        result = orchestrator.submit(playing('bad')).result(timeout=5)
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, 'resume rejected')
+
+        orchestrator.deadline = 0.02
+        result = orchestrator.submit(playing('late')).result(timeout=5)
+        orchestrator.shutdown()
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, 'deadline exceeded')
+        self.assertEqual(orchestrator.failed, 2)
+        self.assertGreater(result.latency, 0)
+
+    def test_duplicate_session_is_not_restarted_twice(self):
+        fake = SlowJellyfin(latency=0.01)
+        orchestrator = RestartOrchestrator(fake.client, delay=0.1)
+        first = orchestrator.submit(playing('s1'))
+        second = orchestrator.submit(playing('s1'))
+        self.assertIs(first, second)
+        orchestrator.wait(5)
+        orchestrator.shutdown()
+        self.assertEqual(len(fake.calls), 2)
+
+
+class TestBackgroundRestartFromLimit(unittest.TestCase):
+    def test_limit_change_schedules_restart(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key', restart_concurrency=2)
+        client = JellyfinClient(cfg)
+        client.get_user_info = MagicMock(return_value={'Name': 'user1'})
+        client.get_user_policy = MagicMock(return_value={'RemoteClientBitrateLimit': 10000000})
+        client.restarts.submit = MagicMock()
+        client.restart_stream = MagicMock()
+        with patch.object(client.session, 'post', return_value=MagicMock(status_code=204)):
+            with self.assertLogs('jellydemon.jellyfin', level='INFO') as cm:
+                client.set_user_bandwidth_limit('user1', 5.0, playing('s1'))
+        client.restarts.submit.assert_called_once()
+        client.restart_stream.assert_not_called()
+        self.assertIn('restart scheduled (session s1)', '\n'.join(cm.output))
+        client.shutdown_restarts()
+
+
+def transcoding(session_id, bitrate=8_000_000, item='i1'):
+    session = playing(session_id)
+    session['NowPlayingItem']['Id'] = item
+    session['TranscodingInfo'] = {'Bitrate': bitrate, 'IsVideoDirect': False}
+    return session
+
+
+def direct(session_id):
+    return playing(session_id)
+
+
+class TestRestartScheduler(unittest.TestCase):
+    def setUp(self):
+        self.restarted = []
+        self.scheduler = RestartScheduler(lambda s: self.restarted.append(s.id))
+
+    def test_largest_savings_first_and_rest_deferred(self):
+        self.scheduler.max_per_cycle = 2
+        sessions = [transcoding(f's{i}') for i in range(5)]
+        for i, session in enumerate(sessions):
+            self.scheduler.request(session, freed_bps=i * 1_000_000)
+
+        self.assertEqual(self.scheduler.dispatch(sessions), ['s4', 's3'])
+        self.assertEqual(self.scheduler.pending, 3)
+        self.assertEqual(self.scheduler.dispatch(sessions), ['s2', 's1'])
+        self.assertEqual(self.scheduler.dispatch(sessions), ['s0'])
+        self.assertEqual(self.scheduler.dispatch(sessions), [])
+
+    def test_new_transcodes_respect_transcoder_budget(self):
+        self.scheduler.max_transcodes = 3
+        sessions = [transcoding('t1'), transcoding('t2'), direct('d1'), direct('d2')]
+        for session in sessions:
+            self.scheduler.request(session, freed_bps=1)
+
+        # t1/t2 replace their own transcodes; only one direct stream fits
+        restarted = self.scheduler.dispatch(sessions)
+        self.assertEqual(len(restarted), 3)
+        self.assertEqual(self.scheduler.pending, 1)
+
+        # Restarts still in flight count against the budget
+        self.assertEqual(self.scheduler.dispatch(sessions, in_flight=1), [])
+        self.assertEqual(self.scheduler.pending, 1)
+
+    def test_stopped_or_changed_sessions_are_dropped(self):
+        self.scheduler.request(transcoding('gone'), 1)
+        self.scheduler.request(transcoding('moved', item='i1'), 1)
+        self.scheduler.request(transcoding('same', item='i1'), 1)
+        live_same = transcoding('same', item='i1')
+        live_same['PlayState']['PositionTicks'] = 999
+
+        self.scheduler.dispatch([transcoding('moved', item='i2'), live_same])
+        self.assertEqual(self.restarted, ['same'])
+        self.assertEqual(self.scheduler.dropped, 2)
+
+    def test_client_queues_and_dispatches_restarts(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key', restart_batch_size=1)
+        client = JellyfinClient(cfg)
+        client.get_user_info = MagicMock(return_value={'Name': 'user1'})
+        client.get_user_policy = MagicMock(side_effect=lambda _: {'RemoteClientBitrateLimit': 0})
+        client.restart_stream = MagicMock(return_value=True)
+        client.scheduler.restart = client.restart_stream
+        sessions = [transcoding('s1', bitrate=20_000_000), transcoding('s2', bitrate=6_000_000)]
+
+        with patch.object(client.session, 'post', return_value=MagicMock(status_code=204)):
+            client.set_user_bandwidth_limit('u1', 5.0, sessions[1])
+            client.set_user_bandwidth_limit('u2', 5.0, sessions[0])
+        client.restart_stream.assert_not_called()
+
+        client.get_active_sessions = MagicMock(return_value=sessions)
+        self.assertEqual(client.dispatch_restarts(), ['s1'])
+        self.assertEqual(client.dispatch_restarts(), ['s2'])
+        self.assertEqual(client.dispatch_restarts(), [])
+        self.assertEqual(client.get_active_sessions.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import MagicMock
+
+from jellydemon import JellyDemon
+from modules.shaping import ClientShaper
+
+
+class RecordingShell:
+    def __init__(self):
+        self.scripts = []
+
+    def __call__(self, cmd):
+        self.scripts.append(cmd)
+        return "", ""
+
+
+class TestClientShaper(unittest.TestCase):
+    def setUp(self):
+        self.shell = RecordingShell()
+        self.shaper = ClientShaper(self.shell, lan_device='br-lan', ifb_device='ifb-jd')
+
+    def test_first_apply_sets_up_redirect_and_classes(self):
+        self.assertTrue(self.shaper.apply({'8.8.8.8': 5.0, '2001:db8::1': 2.5}, '192.168.1.243'))
+
+        script = self.shell.scripts[0]
+        self.assertIn('ip link add ifb-jd type ifb', script)
+        self.assertIn('match ip src 192.168.1.243/32 action mirred egress redirect dev ifb-jd', script)
+        self.assertIn('htb rate 5000kbit ceil 5000kbit', script)
+        self.assertIn('match ip dst 8.8.8.8/32 flowid', script)
+        self.assertIn('protocol ipv6 u32 match ip6 dst 2001:db8::1/128', script)
+        self.assertEqual(self.shaper.limits(), {'8.8.8.8': 5000, '2001:db8::1': 2500})
+
+    def test_updates_are_incremental(self):
+        self.shaper.apply({'8.8.8.8': 5.0, '9.9.9.9': 5.0}, '192.168.1.243')
+        self.shaper.apply({'8.8.8.8': 5.0, '9.9.9.9': 3.0}, '192.168.1.243')
+
+        script = self.shell.scripts[1]
+        self.assertEqual(script.count('\n'), 0)
+        self.assertIn('tc class change dev ifb-jd parent 1: classid 1:11 htb rate 3000kbit', script)
+
+        # Unchanged limits need no round trip at all
+        self.shaper.apply({'8.8.8.8': 5.0, '9.9.9.9': 3.0}, '192.168.1.243')
+        self.assertEqual(len(self.shell.scripts), 2)
+
+    def test_removed_clients_free_their_class(self):
+        self.shaper.apply({'8.8.8.8': 5.0, '9.9.9.9': 5.0}, '192.168.1.243')
+        self.shaper.apply({'9.9.9.9': 5.0}, '192.168.1.243')
+        self.assertIn('tc class del dev ifb-jd classid 1:10', self.shell.scripts[1])
+
+        self.shaper.apply({'9.9.9.9': 5.0, '7.7.7.7': 1.0}, '192.168.1.243')
+        self.assertIn('classid 1:10 htb rate 1000kbit', self.shell.scripts[2])
+
+    def test_error_forces_rebuild(self):
+        self.shaper.execute = MagicMock(return_value=("", "RTNETLINK answers: No such file"))
+        self.assertFalse(self.shaper.apply({'8.8.8.8': 5.0}, '192.168.1.243'))
+        self.assertFalse(self.shaper.active)
+
+        self.shaper.execute = self.shell
+        self.shaper.apply({'8.8.8.8': 5.0}, '192.168.1.243')
+        self.assertIn('ip link add ifb-jd', self.shell.scripts[0])
+
+
+class TestEnforcementModes(unittest.TestCase):
+    def setUp(self):
+        self.daemon = JellyDemon('config.example.yml')
+        self.daemon.config.daemon.dry_run = False
+        self.daemon.config.bandwidth.low_usage_threshold = 0
+        self.daemon.config.router.jellyfin_ip = '192.168.1.243'
+        self.daemon.bandwidth_manager.calculate_limits = MagicMock(
+            return_value={'u1': 4.0, 'u2': 6.0}
+        )
+        self.daemon.openwrt.apply_client_limits = MagicMock(return_value=True)
+        self.daemon.jellyfin.set_user_bandwidth_limit = MagicMock(return_value=True)
+        self.session = {'Id': 's1', 'NowPlayingItem': {}}
+        self.streamers = {
+            'u1': {'ip': '8.8.8.8', 'session_data': self.session},
+            'u2': {'ip': '8.8.8.8', 'session_data': self.session},
+        }
+
+    def test_jellyfin_mode_only_touches_policy(self):
+        self.daemon.config.bandwidth.enforcement = 'jellyfin'
+        self.daemon.calculate_and_apply_limits(self.streamers, 5.0)
+        self.daemon.openwrt.apply_client_limits.assert_not_called()
+        self.daemon.jellyfin.set_user_bandwidth_limit.assert_any_call('u1', 4.0, self.session)
+
+    def test_router_mode_shapes_per_ip(self):
+        self.daemon.config.bandwidth.enforcement = 'router'
+        self.daemon.calculate_and_apply_limits(self.streamers, 5.0)
+        self.daemon.openwrt.apply_client_limits.assert_called_once_with(
+            {'8.8.8.8': 10.0}, '192.168.1.243'
+        )
+        self.daemon.jellyfin.set_user_bandwidth_limit.assert_not_called()
+
+    def test_hybrid_mode_updates_policy_without_restart(self):
+        self.daemon.config.bandwidth.enforcement = 'hybrid'
+        self.daemon.calculate_and_apply_limits(self.streamers, 5.0)
+        self.daemon.openwrt.apply_client_limits.assert_called_once()
+        self.daemon.jellyfin.set_user_bandwidth_limit.assert_any_call('u1', 4.0, None)
+        self.daemon.jellyfin.set_user_bandwidth_limit.assert_any_call('u2', 6.0, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
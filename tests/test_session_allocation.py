@@ -0,0 +1,132 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from jellydemon import JellyDemon
+from modules.config import JellyfinConfig
+from modules.jellyfin_client import JellyfinClient
+
+
+def raw_session(session_id, user_id, ip, commands=None, client='Jellyfin Web'):
+    data = {'Id': session_id, 'UserId': user_id, 'RemoteEndPoint': f'{ip}:1234',
+            'Client': client, 'ApplicationVersion': '10.9.0',
+            'NowPlayingItem': {'Id': f'item-{session_id}'}}
+    if commands is not None:
+        data['Capabilities'] = {'SupportedCommands': commands}
+    return data
+
+
+class TestSessionUnits(unittest.TestCase):
+    def setUp(self):
+        self.daemon = JellyDemon('config.example.yml')
+        self.daemon.config.daemon.dry_run = False
+        self.daemon.config.bandwidth.low_usage_threshold = 0
+        self.daemon.jellyfin.get_user_info = MagicMock(side_effect=lambda user_id: {'Name': user_id})
+        self.daemon.jellyfin.set_user_bandwidth_limit = MagicMock(return_value=True)
+        self.daemon.jellyfin.get_active_sessions = MagicMock(return_value=[
+            raw_session('s1', 'u1', '8.8.8.8'),
+            raw_session('s2', 'u1', '9.9.9.9'),
+            raw_session('s3', 'u2', '9.9.9.9'),
+        ])
+
+    def test_each_session_is_an_allocation_unit(self):
+        self.daemon.config.router.client_accounting = 'conntrack'
+        self.daemon.openwrt.get_client_upload_rates = MagicMock(
+            return_value={'8.8.8.8': 6.0, '9.9.9.9': 4.0}
+        )
+        streamers = self.daemon.get_external_streamers()
+        self.assertEqual(sorted(streamers), ['s1', 's2', 's3'])
+        self.assertEqual(streamers['s2']['user_id'], 'u1')
+        self.assertEqual(streamers['s2']['user_data'], {'Name': 'u1'})
+        self.assertAlmostEqual(streamers['s1']['measured_mbps'], 6.0)
+        self.assertAlmostEqual(streamers['s2']['measured_mbps'], 2.0)
+
+    def test_user_policy_derived_from_session_shares(self):
+        streamers = self.daemon.get_external_streamers()
+        self.daemon.bandwidth_manager.calculate_limits = MagicMock(
+            return_value={'s1': 4.0, 's2': 8.0, 's3': 5.0}
+        )
+        self.daemon.calculate_and_apply_limits(streamers, 5.0)
+
+        calls = {c.args[0]: c for c in self.daemon.jellyfin.set_user_bandwidth_limit.call_args_list}
+        # Two streams each capped at 6 Mbps keep u1 within 4 + 8
+        u1 = calls['u1']
+        self.assertEqual(u1.args[1], 6.0)
+        self.assertEqual([s.id for s in u1.args[2]], ['s1', 's2'])
+        self.assertEqual(u1.kwargs['session_limits'], {'s1': 4.0, 's2': 8.0})
+        self.assertEqual(calls['u2'].args[1:], (5.0, streamers['s3']['session_data']))
+
+    def test_router_shapes_each_device(self):
+        self.daemon.config.bandwidth.enforcement = 'router'
+        self.daemon.config.router.jellyfin_ip = '192.168.1.243'
+        self.daemon.openwrt.apply_client_limits = MagicMock(return_value=True)
+        streamers = self.daemon.get_external_streamers()
+        self.daemon.bandwidth_manager.calculate_limits = MagicMock(
+            return_value={'s1': 4.0, 's2': 8.0, 's3': 5.0}
+        )
+        self.daemon.calculate_and_apply_limits(streamers, 5.0)
+        self.daemon.openwrt.apply_client_limits.assert_called_once_with(
+            {'8.8.8.8': 4.0, '9.9.9.9': 13.0}, '192.168.1.243'
+        )
+
+    def test_second_device_is_not_a_new_user(self):
+        self.daemon.calculate_and_apply_limits = MagicMock()
+        self.daemon.get_current_bandwidth_usage = MagicMock(return_value=0.0)
+        with self.assertLogs('jellydemon', level='INFO') as cm:
+            self.daemon.run_single_cycle()
+        started = [line for line in cm.output if 'started streaming' in line]
+        self.assertEqual(len(started), 2)
+        self.assertEqual(self.daemon.current_external_users, {'u1', 'u2'})
+
+
+class TestPerDeviceDelivery(unittest.TestCase):
+    def test_command_delivery_pushes_each_session_share(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key', limit_delivery='command')
+        client = JellyfinClient(cfg)
+        client.get_user_info = MagicMock(return_value={'Name': 'u1'})
+        client.get_user_policy = MagicMock(
+            side_effect=lambda user_id: {'RemoteClientBitrateLimit': 20000000}
+        )
+        client.restart_stream = MagicMock(return_value=True)
+        sessions = [
+            raw_session('s1', 'u1', '8.8.8.8', commands=['SetMaxStreamingBitrate']),
+            raw_session('s2', 'u1', '9.9.9.9', commands=['Play'], client='TV'),
+        ]
+        with patch.object(client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            client.set_user_bandwidth_limit('u1', 6.0, sessions, session_limits={'s1': 4.0, 's2': 8.0})
+
+        policy = mock_post.call_args_list[0].kwargs['json']
+        self.assertEqual(policy['RemoteClientBitrateLimit'], 6000000)
+        commands = [c for c in mock_post.call_args_list if c.args[0].endswith('/Command')]
+        self.assertEqual(len(commands), 1)
+        self.assertTrue(commands[0].args[0].endswith('/Sessions/s1/Command'))
+        self.assertEqual(commands[0].kwargs['json']['Arguments'], {'MaxBitrate': '4000000'})
+        # The client without the command restarts under the policy limit
+        client.restart_stream.assert_called_once_with(sessions[1])
+
+    def test_changed_session_shares_pushed_with_unchanged_policy(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key', limit_delivery='command')
+        client = JellyfinClient(cfg)
+        client.get_user_info = MagicMock(return_value={'Name': 'u1'})
+        client.get_user_policy = MagicMock(
+            side_effect=lambda user_id: {'RemoteClientBitrateLimit': 20000000}
+        )
+        sessions = [
+            raw_session('s1', 'u1', '8.8.8.8', commands=['SetMaxStreamingBitrate']),
+            raw_session('s2', 'u1', '9.9.9.9', commands=['SetMaxStreamingBitrate']),
+        ]
+        with patch.object(client.session, 'post', return_value=MagicMock(status_code=204)) as mock_post:
+            client.set_user_bandwidth_limit('u1', 10.0, sessions, session_limits={'s1': 4.0, 's2': 16.0})
+            mock_post.reset_mock()
+            # Same mean, swapped shares: both devices get their new limit
+            client.set_user_bandwidth_limit('u1', 10.0, sessions, session_limits={'s1': 16.0, 's2': 4.0})
+            pushed = {c.args[0].split('/')[-2]: c.kwargs['json']['Arguments']['MaxBitrate']
+                      for c in mock_post.call_args_list}
+            self.assertEqual(pushed, {'s1': '16000000', 's2': '4000000'})
+            mock_post.reset_mock()
+            # Nothing changed: nothing is sent
+            client.set_user_bandwidth_limit('u1', 10.0, sessions, session_limits={'s1': 16.0, 's2': 4.0})
+            mock_post.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
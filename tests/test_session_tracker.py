@@ -0,0 +1,208 @@
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from modules import session_tracker
+from modules.config import JellyfinConfig
+from modules.jellyfin_client import JellyfinClient
+from modules.session_tracker import SessionTracker
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class FakeJellyfinSocket:
+    """Minimal WebSocket server speaking just enough RFC 6455 for the tracker."""
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.received = []
+        self.paths = []
+        self.connections = []
+        self.connected = threading.Event()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self._handshake(conn)
+            self.connections.append(conn)
+            self.connected.set()
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _handshake(self, conn):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            request += conn.recv(1024)
+        lines = request.decode().split('\r\n')
+        self.paths.append(lines[0].split()[1])
+        headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+        accept = base64.b64encode(
+            hashlib.sha1((headers['Sec-WebSocket-Key'] + _WS_GUID).encode()).digest()
+        ).decode()
+        conn.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+            f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+
+    def _read(self, conn):
+        try:
+            while True:
+                header = conn.recv(2)
+                if len(header) < 2:
+                    return
+                opcode, length = header[0] & 0x0F, header[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack('>H', conn.recv(2))[0]
+                mask = conn.recv(4)
+                payload = bytearray(conn.recv(length))
+                for i in range(len(payload)):
+                    payload[i] ^= mask[i % 4]
+                if opcode == 0x8:
+                    return
+                self.received.append(json.loads(payload.decode()))
+        except OSError:
+            return
+
+    def push(self, message_type, data=None):
+        payload = json.dumps({'MessageType': message_type, 'Data': data}).encode()
+        if len(payload) < 126:
+            header = bytes([0x81, len(payload)])
+        else:
+            header = bytes([0x81, 126]) + struct.pack('>H', len(payload))
+        self.connections[-1].sendall(header + payload)
+
+    def drop(self):
+        self.connected.clear()
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        self.connections = []
+
+    def close(self):
+        self.drop()
+        self.server.close()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def playing(session_id, user_id='u1', paused=False):
+    return {'Id': session_id, 'UserId': user_id, 'NowPlayingItem': {'Id': 'i1'},
+            'PlayState': {'IsPaused': paused}}
+
+
+@unittest.skipIf(session_tracker.websocket is None, "websocket-client not installed")
+class TestSessionTracker(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeJellyfinSocket()
+        self.changes = []
+        self.tracker = SessionTracker(
+            f"http://127.0.0.1:{self.server.port}", 'key', interval_ms=500,
+            on_change=lambda: self.changes.append(self.tracker.version),
+            min_backoff=0.05, max_backoff=0.1
+        )
+
+    def tearDown(self):
+        self.tracker.stop()
+        self.server.close()
+
+    def test_subscribes_and_tracks_sessions(self):
+        self.tracker.start()
+        self.assertTrue(self.server.connected.wait(2))
+        self.assertTrue(wait_for(lambda: self.server.received))
+        self.assertEqual(self.server.received[0], {'MessageType': 'SessionsStart', 'Data': '0,500'})
+        self.assertIn('api_key=key', self.server.paths[0])
+        self.assertIsNone(self.tracker.sessions())
+
+        self.server.push('Sessions', [playing('s1'), playing('s2', 'u2')])
+        self.assertTrue(wait_for(lambda: self.tracker.sessions() is not None))
+        self.assertEqual({s['Id'] for s in self.tracker.sessions()}, {'s1', 's2'})
+
+        self.server.push('Sessions', [playing('s1'), playing('s2', 'u2', paused=True)])
+        self.assertTrue(wait_for(lambda: self.tracker.version == 2))
+        # The same list again changes nothing
+        self.server.push('Sessions', [playing('s1'), playing('s2', 'u2', paused=True)])
+        self.server.push('Sessions', [playing('s1')])
+        self.assertTrue(wait_for(lambda: len(self.tracker.sessions()) == 1))
+        self.assertEqual(self.changes, [1, 2, 3])
+
+    def test_answers_keepalive_and_reports_user_changes(self):
+        self.tracker.on_user_change = MagicMock()
+        self.tracker.start()
+        self.assertTrue(self.server.connected.wait(2))
+        self.server.push('ForceKeepAlive', 60)
+        self.server.push('UserUpdated', {'Id': 'u1'})
+
+        self.assertTrue(wait_for(lambda: {'MessageType': 'KeepAlive'} in self.server.received))
+        self.assertTrue(wait_for(lambda: self.tracker.on_user_change.called))
+        self.assertEqual(self.tracker.keepalive_interval, 30.0)
+
+    def test_falls_back_and_reconnects_after_drop(self):
+        self.tracker.start()
+        self.assertTrue(self.server.connected.wait(2))
+        self.server.push('Sessions', [playing('s1')])
+        self.assertTrue(wait_for(lambda: self.tracker.live))
+
+        self.server.drop()
+        self.assertTrue(wait_for(lambda: not self.tracker.live))
+        self.assertIsNone(self.tracker.sessions())
+
+        self.assertTrue(self.server.connected.wait(2))
+        self.assertTrue(wait_for(lambda: self.tracker.connects == 2))
+        self.server.push('Sessions', [playing('s3')])
+        self.assertTrue(wait_for(lambda: self.tracker.live))
+        self.assertEqual([s['Id'] for s in self.tracker.sessions()], ['s3'])
+
+
+class TestClientSessionSource(unittest.TestCase):
+    def setUp(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key')
+        self.client = JellyfinClient(cfg)
+
+    def test_live_tracker_replaces_polling(self):
+        self.client.tracker = MagicMock()
+        self.client.tracker.sessions.return_value = [playing('s1'), playing('s2', paused=True)]
+        with patch.object(self.client.session, 'get') as mock_get:
+            sessions = self.client.get_active_sessions()
+        mock_get.assert_not_called()
+        self.assertEqual([s['Id'] for s in sessions], ['s1'])
+
+    def test_polls_while_tracker_offline(self):
+        self.client.tracker = MagicMock()
+        self.client.tracker.sessions.return_value = None
+        response = MagicMock(status_code=200)
+        response.json.return_value = [playing('s1')]
+        with patch.object(self.client.session, 'get', return_value=response) as mock_get:
+            sessions = self.client.get_active_sessions()
+        mock_get.assert_called_once()
+        self.assertEqual(len(sessions), 1)
+
+    def test_tracking_disabled_by_default(self):
+        self.assertFalse(self.client.start_session_tracking())
+        self.assertIsNone(self.client.tracker)
+
+
+if __name__ == '__main__':
+    unittest.main()
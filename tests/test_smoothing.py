@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import patch
 
 from jellydemon import JellyDemon
+from modules.openwrt_client import BandwidthSample
 
 class BandwidthSmoothingTest(unittest.TestCase):
     def test_rolling_average(self):
@@ -21,5 +22,40 @@ class BandwidthSmoothingTest(unittest.TestCase):
         self.assertAlmostEqual(results[2], 40.0, places=2)
         self.assertAlmostEqual(results[3], 10.0, places=2)
 
+    def test_unknown_jellyfin_traffic_is_not_other_usage(self):
+        daemon = JellyDemon('config.example.yml')
+        jellyfin_ip = daemon.config.router.jellyfin_ip = '192.168.1.243'
+        samples = [
+            BandwidthSample(total_mbps=20.0, per_ip={jellyfin_ip: 15.0}),
+            # Jellyfin counter reset: only baselined this cycle
+            BandwidthSample(total_mbps=30.0, per_ip={}),
+            BandwidthSample(total_mbps=22.0, per_ip={jellyfin_ip: 15.0}),
+        ]
+
+        with patch.object(daemon.openwrt, 'sample_upload_rates', side_effect=samples):
+            with patch('jellydemon.time.time', side_effect=[0, 10, 20]):
+                results = [daemon.get_current_bandwidth_usage() for _ in samples]
+
+        self.assertEqual(results, [5.0, 5.0, 6.0])
+        self.assertEqual(len(daemon.bandwidth_history), 2)
+
+    def test_capacity_samples_flag_saturation(self):
+        daemon = JellyDemon('config.example.yml')
+        jellyfin_ip = daemon.config.router.jellyfin_ip = '192.168.1.243'
+        # Streams wanted more than the 10 Mbps their limits allowed
+        daemon._demand_exceeds_limits = True
+        daemon._expected_jellyfin_mbps = 10.0
+        samples = [
+            BandwidthSample(total_mbps=20.0, per_ip={jellyfin_ip: 5.0}),
+            BandwidthSample(total_mbps=20.0, per_ip={jellyfin_ip: 9.5}),
+        ]
+
+        with patch.object(daemon.openwrt, 'sample_upload_rates', side_effect=samples), \
+                patch.object(daemon.capacity, 'observe') as observe:
+            for _ in samples:
+                daemon.get_current_bandwidth_usage()
+
+        self.assertEqual([c.kwargs['saturated'] for c in observe.call_args_list], [True, False])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,91 @@
+import time
+import unittest
+
+from modules.sqm import SQMRateController
+
+
+class FakeRouterShell:
+    """Records router commands and answers SQM discovery."""
+
+    def __init__(self, qdisc='cake'):
+        self.qdisc = qdisc
+        self.commands = []
+
+    def __call__(self, cmd):
+        self.commands.append(cmd.strip())
+        if 'tc qdisc show' in cmd:
+            return (f"IF eth1\nqdisc {self.qdisc} 8001: root refcnt 2 bandwidth 20Mbit\n"
+                    f"qdisc ingress ffff: parent ffff:fff1 ----------------\n", "")
+        return "", ""
+
+    def matching(self, text):
+        return [c for c in self.commands if text in c]
+
+
+class TestSQMRateController(unittest.TestCase):
+    def test_cake_rate_changed_in_place(self):
+        shell = FakeRouterShell('cake')
+        sqm = SQMRateController(shell, min_interval=0, persist_delay=60)
+
+        self.assertTrue(sqm.set_rate(15000))
+
+        self.assertEqual(shell.matching('tc qdisc change'),
+                         ['tc qdisc change dev eth1 root cake bandwidth 15000kbit'])
+        self.assertEqual(shell.matching('restart'), [])
+        self.assertEqual(shell.matching('uci commit'), [])
+        sqm.flush()
+
+    def test_htb_class_changed_in_place(self):
+        shell = FakeRouterShell('htb')
+        sqm = SQMRateController(shell, min_interval=0, persist_delay=60)
+        sqm.set_rate(8000)
+        self.assertEqual(len(shell.matching('tc class change dev eth1 parent 1: classid 1:1')), 1)
+        sqm.flush()
+
+    def test_unknown_qdisc_falls_back_to_restart(self):
+        shell = FakeRouterShell('fq_codel')
+        sqm = SQMRateController(shell, min_interval=0, persist_delay=60)
+        sqm.set_rate(8000)
+        self.assertEqual(len(shell.matching('/etc/init.d/sqm restart')), 1)
+        self.assertEqual(sqm.restarts, 1)
+        self.assertEqual(sqm.persisted_kbps, 8000)
+
+    def test_rapid_changes_are_coalesced(self):
+        shell = FakeRouterShell('cake')
+        sqm = SQMRateController(shell, min_interval=0.2, persist_delay=60)
+
+        sqm.set_rate(10000)
+        for rate in (11000, 12000, 13000):
+            sqm.set_rate(rate)
+        self.assertEqual(len(shell.matching('tc qdisc change')), 1)
+
+        time.sleep(0.4)
+        changes = shell.matching('tc qdisc change')
+        self.assertEqual(len(changes), 2)
+        self.assertIn('13000kbit', changes[-1])
+        self.assertEqual(sqm.applied_kbps, 13000)
+        sqm.flush()
+
+    def test_unchanged_rate_is_not_reapplied(self):
+        shell = FakeRouterShell('cake')
+        sqm = SQMRateController(shell, min_interval=0, persist_delay=60)
+        sqm.set_rate(10000)
+        sqm.set_rate(10000)
+        self.assertEqual(len(shell.matching('tc qdisc change')), 1)
+        sqm.flush()
+
+    def test_persist_is_debounced_and_skips_restart(self):
+        shell = FakeRouterShell('cake')
+        sqm = SQMRateController(shell, min_interval=0, persist_delay=0.1)
+        sqm.set_rate(10000)
+        sqm.set_rate(12000)
+        self.assertEqual(shell.matching('uci commit'), [])
+
+        time.sleep(0.3)
+        self.assertEqual(shell.matching('uci commit'),
+                         ['uci set sqm.@queue[0].upload=12000 && uci commit sqm'])
+        self.assertEqual(sqm.persists, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
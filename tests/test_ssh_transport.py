@@ -0,0 +1,170 @@
+import socket
+import unittest
+from unittest.mock import MagicMock, patch
+
+from modules.config import RouterConfig
+from modules.openwrt_client import OpenWRTClient
+from modules.ssh_transport import SSHTransport
+
+
+class FakeSSHClient:
+    """Stand-in for paramiko.SSHClient with a controllable transport."""
+
+    def __init__(self, router):
+        self.router = router
+        self.transport = MagicMock()
+        self.transport.is_active.return_value = True
+        self.commands = []
+        self.closed = False
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, **kwargs):
+        if self.router.down:
+            raise socket.error("connection refused")
+
+    def get_transport(self):
+        return self.transport
+
+    def exec_command(self, cmd, timeout=None):
+        self.commands.append(cmd)
+        self.router.timeouts.append(timeout)
+        if self.router.hang_next:
+            self.router.hang_next = False
+            stdout = MagicMock()
+            stdout.read.side_effect = socket.timeout()
+            return MagicMock(), stdout, MagicMock()
+        if self.router.drop_next:
+            self.router.drop_next = False
+            self.transport.is_active.return_value = False
+            raise EOFError()
+        stdout, stderr = MagicMock(), MagicMock()
+        stdout.read.return_value = f"out:{cmd}".encode()
+        stderr.read.return_value = b""
+        return MagicMock(), stdout, stderr
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRouter:
+    def __init__(self):
+        self.down = False
+        self.drop_next = False
+        self.hang_next = False
+        self.timeouts = []
+        self.clients = []
+
+    def factory(self):
+        client = FakeSSHClient(self)
+        self.clients.append(client)
+        return client
+
+
+class TestSSHTransport(unittest.TestCase):
+    def setUp(self):
+        self.router = FakeRouter()
+        self.ssh = SSHTransport('router', 22, 'root', 'pw', client_factory=self.router.factory)
+
+    def test_reuses_connection(self):
+        self.ssh.exec('a')
+        self.ssh.exec('b')
+        self.assertEqual(len(self.router.clients), 1)
+        self.assertEqual(self.ssh.stats()['connects'], 1)
+        self.router.clients[0].transport.set_keepalive.assert_called_with(15)
+
+    def test_reconnects_after_transport_died(self):
+        self.ssh.exec('a')
+        self.router.clients[0].transport.is_active.return_value = False
+
+        out, _ = self.ssh.exec('b')
+
+        self.assertEqual(out, 'out:b')
+        self.assertTrue(self.router.clients[0].closed)
+        self.assertEqual(self.ssh.stats()['reconnects'], 1)
+
+    def test_command_retried_once_on_dropped_connection(self):
+        self.ssh.exec('a')
+        self.router.drop_next = True
+
+        out, _ = self.ssh.exec('b')
+
+        self.assertEqual(out, 'out:b')
+        self.assertEqual(len(self.router.clients), 2)
+
+    def test_fails_fast_while_backing_off(self):
+        self.router.down = True
+        with self.assertRaises(socket.error):
+            self.ssh.exec('a')
+        with self.assertRaises(ConnectionError):
+            self.ssh.exec('a')
+        # Only the first call actually tried to connect
+        self.assertEqual(len(self.router.clients), 1)
+        self.assertEqual(self.ssh.stats()['failures'], 1)
+
+    def test_backoff_grows_and_resets(self):
+        self.router.down = True
+        delays = []
+        with patch('modules.ssh_transport.random.uniform', return_value=1.0), \
+                patch('modules.ssh_transport.time.monotonic', return_value=100.0):
+            for _ in range(3):
+                self.ssh._next_attempt = 0.0
+                with self.assertRaises(socket.error):
+                    self.ssh.connect()
+                delays.append(self.ssh._next_attempt - 100.0)
+        self.assertEqual(delays, [1.0, 2.0, 4.0])
+        self.assertEqual(self.ssh._consecutive_failures, 3)
+
+        self.router.down = False
+        self.ssh._next_attempt = 0.0
+        self.ssh.connect()
+        self.assertEqual(self.ssh._consecutive_failures, 0)
+        self.assertTrue(self.ssh.stats()['connected'])
+
+    def test_commands_time_out_and_reconnect(self):
+        self.ssh.exec('a')
+        self.assertEqual(self.router.timeouts, [30.0])
+        self.router.hang_next = True
+        with self.assertRaises(socket.timeout):
+            self.ssh.exec('b', timeout=5)
+        self.assertEqual(self.router.timeouts[-1], 5)
+        self.assertTrue(self.router.clients[0].closed)
+        self.assertEqual(self.ssh.exec('c')[0], 'out:c')
+        self.assertEqual(len(self.router.clients), 2)
+
+    def test_closing_stream_closes_channel(self):
+        stream = self.ssh.open_stream('while true; do snapshot; done')
+        stdout = stream.stdout
+        stream.close()
+        stdout.channel.close.assert_called_once()
+        stdout.close.assert_called_once()
+
+
+class TestOpenWRTClientSSH(unittest.TestCase):
+    def test_client_uses_shared_transport(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw')
+        client = OpenWRTClient(cfg)
+        router = FakeRouter()
+        client.ssh.client_factory = router.factory
+
+        self.assertEqual(client._run_ssh('echo test'), 'out:echo test')
+        router.clients[0].transport.is_active.return_value = False
+        self.assertEqual(client._run_ssh('uptime'), 'out:uptime')
+        self.assertEqual(client.ssh.reconnects, 1)
+
+    def test_close_saves_sqm_rate_and_disconnects(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw', use_ssh=True)
+        client = OpenWRTClient(cfg)
+        router = FakeRouter()
+        client.ssh.client_factory = router.factory
+        client.sqm.applied_kbps = 20000
+
+        client.close()
+
+        self.assertTrue(router.clients[0].commands[0].startswith('uci set sqm.@queue[0].upload=20000'))
+        self.assertTrue(router.clients[0].closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import MagicMock
+
+from jellydemon import JellyDemon
+from modules.stream_session import StreamSession, diff_sessions, endpoint_ip, index_sessions
+
+
+def raw_session(session_id='s1', item='i1', position=0, paused=False, endpoint='8.8.8.8:5000'):
+    return {
+        'Id': session_id, 'UserId': 'u1', 'RemoteEndPoint': endpoint,
+        'Client': 'Jellyfin Web', 'ApplicationVersion': '10.9.0',
+        'Capabilities': {'SupportedCommands': ['SetMaxStreamingBitrate']},
+        'NowPlayingItem': {
+            'Id': item, 'Overview': 'x' * 1000,
+            'MediaSources': [{'Id': 'ms1', 'Bitrate': 12_000_000}],
+            'MediaStreams': [{'Type': 'Audio'}, {'Type': 'Video', 'Height': 1080}],
+        },
+        'PlayState': {'PositionTicks': position, 'IsPaused': paused, 'MediaSourceId': 'ms1'},
+        'TranscodingInfo': {'Bitrate': 4_000_000, 'IsVideoDirect': False},
+    }
+
+
+class TestStreamSession(unittest.TestCase):
+    def test_parses_used_fields(self):
+        session = StreamSession.from_dict(raw_session())
+        self.assertEqual((session.id, session.user_id, session.ip), ('s1', 'u1', '8.8.8.8'))
+        self.assertEqual(session.item_id, 'i1')
+        self.assertEqual(session.media_source_id, 'ms1')
+        self.assertEqual(session.source_bitrate, 12_000_000)
+        self.assertEqual(session.bitrate, 4_000_000)
+        self.assertTrue(session.transcodes)
+        self.assertEqual(session.video_height, 1080)
+        self.assertEqual(session.supported_commands, ('SetMaxStreamingBitrate',))
+        self.assertEqual(session.client_key, 'Jellyfin Web/10.9.0')
+        self.assertFalse(hasattr(session, '__dict__'))
+
+    def test_coerce_accepts_records_and_dicts(self):
+        session = StreamSession.from_dict(raw_session())
+        self.assertIs(StreamSession.coerce(session), session)
+        self.assertFalse(StreamSession.coerce({}).playing)
+
+    def test_endpoint_ip(self):
+        self.assertEqual(endpoint_ip('1.2.3.4:8096'), '1.2.3.4')
+        self.assertEqual(endpoint_ip('[2001:db8::1]:8096'), '2001:db8::1')
+        self.assertEqual(endpoint_ip('2001:db8::1'), '2001:db8::1')
+        self.assertEqual(endpoint_ip('1.2.3.4'), '1.2.3.4')
+
+    def test_diff(self):
+        old = index_sessions(StreamSession.from_dict(s) for s in (
+            raw_session('a'), raw_session('b'), raw_session('c')
+        ))
+        new = index_sessions(StreamSession.from_dict(s) for s in (
+            raw_session('a', position=500),  # progress only
+            raw_session('b', paused=True),
+            raw_session('d'),
+        ))
+        diff = diff_sessions(old, new)
+        self.assertEqual([s.id for s in diff.started], ['d'])
+        self.assertEqual([s.id for s in diff.stopped], ['c'])
+        self.assertEqual([(o.id, n.is_paused) for o, n in diff.changed], [('b', True)])
+        self.assertFalse(diff_sessions(new, new))
+
+
+class TestDaemonChangeFeed(unittest.TestCase):
+    def test_cycle_records_session_diff(self):
+        daemon = JellyDemon('config.example.yml')
+        daemon.calculate_and_apply_limits = MagicMock()
+        daemon.get_current_bandwidth_usage = MagicMock(return_value=0.0)
+        daemon.jellyfin.get_active_sessions = MagicMock(return_value=[raw_session()])
+        daemon.jellyfin.get_user_info = MagicMock(return_value={'Name': 'u1'})
+
+        daemon.run_single_cycle()
+        self.assertEqual([s.id for s in daemon.last_session_diff.started], ['s1'])
+        streamer = daemon.calculate_and_apply_limits.call_args.args[0]['s1']
+        self.assertIsInstance(streamer['session_data'], StreamSession)
+
+        daemon.jellyfin.get_active_sessions.return_value = [raw_session(item='i2')]
+        with self.assertLogs('jellydemon', level='DEBUG') as cm:
+            daemon.run_single_cycle()
+        self.assertEqual(len(daemon.last_session_diff.changed), 1)
+        self.assertIn('Session s1 of user u1 switched to item i2', '\n'.join(cm.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from modules.config import RouterConfig
+from modules.openwrt_client import OpenWRTClient
+from modules.telemetry import LocalCommandStream, RateRingBuffer, TelemetrySampler
+
+EMULATOR = f"{sys.executable} -m modules.telemetry --rate 8 --ip 192.168.1.243=2 --interval 0.1"
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestRateRingBuffer(unittest.TestCase):
+    def test_wraps_and_averages_window(self):
+        buffer = RateRingBuffer(capacity=4)
+        for i in range(6):
+            buffer.append(float(i), float(i), {'1.1.1.1': 1.0})
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.latest_time(), 5.0)
+
+        total, per_ip = buffer.average(window=1.5, now=5.0)
+        self.assertAlmostEqual(total, 4.5)
+        self.assertAlmostEqual(per_ip['1.1.1.1'], 1.0)
+        self.assertIsNone(buffer.average(window=1.0, now=100.0))
+
+
+class TestTelemetrySampler(unittest.TestCase):
+    def test_reads_local_emulator(self):
+        sampler = TelemetrySampler(lambda: LocalCommandStream(EMULATOR), ['192.168.1.243'])
+        sampler.start()
+        try:
+            self.assertTrue(wait_for(lambda: len(sampler.buffer) >= 3))
+            total, per_ip = sampler.buffer.average(window=5.0)
+        finally:
+            sampler.stop()
+        self.assertAlmostEqual(total, 8.0, places=3)
+        self.assertAlmostEqual(per_ip['192.168.1.243'], 2.0, places=3)
+        self.assertFalse(sampler.running)
+
+    def test_reconnects_when_stream_ends(self):
+        command = f"{sys.executable} -m modules.telemetry --rate 8 --interval 0.05 --count 3"
+        sampler = TelemetrySampler(lambda: LocalCommandStream(command), [], min_backoff=0.05)
+        sampler.start()
+        try:
+            self.assertTrue(wait_for(lambda: sampler.reconnects >= 2))
+        finally:
+            sampler.stop()
+        self.assertGreaterEqual(len(sampler.buffer), 4)
+
+
+class TestClientTelemetry(unittest.TestCase):
+    def test_sample_served_from_buffer(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw',
+                           jellyfin_ip='192.168.1.243', telemetry=True,
+                           telemetry_command=EMULATOR)
+        client = OpenWRTClient(cfg)
+        client._sample_upload_rates_luci = MagicMock()
+        self.assertTrue(client.start_telemetry())
+        try:
+            self.assertTrue(wait_for(lambda: len(client.telemetry.buffer) >= 2))
+            sample = client.sample_upload_rates(['192.168.1.243'])
+        finally:
+            client.stop_telemetry()
+
+        client._sample_upload_rates_luci.assert_not_called()
+        self.assertAlmostEqual(sample.total_mbps, 8.0, places=3)
+        self.assertAlmostEqual(sample.per_ip['192.168.1.243'], 2.0, places=3)
+
+    def test_disabled_by_default(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw')
+        client = OpenWRTClient(cfg)
+        self.assertFalse(client.start_telemetry())
+        self.assertIsNone(client.telemetry)
+
+
+if __name__ == '__main__':
+    unittest.main()
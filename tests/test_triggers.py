@@ -0,0 +1,152 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from jellydemon import JellyDemon
+from modules.session_tracker import SessionTracker
+from modules.triggers import ActivityLogWatcher, ReallocationTrigger, parse_date
+
+
+class TestReallocationTrigger(unittest.TestCase):
+    def test_tick_without_events(self):
+        trigger = ReallocationTrigger(debounce=0.05)
+        start = time.monotonic()
+        self.assertEqual(trigger.wait(0.1), [])
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_burst_is_debounced_into_one_wakeup(self):
+        trigger = ReallocationTrigger(debounce=0.1, max_delay=5)
+
+        def burst():
+            for reason in ('session', 'session', 'activity:VideoPlayback'):
+                trigger.notify(reason)
+                time.sleep(0.03)
+
+        threading.Thread(target=burst).start()
+        start = time.monotonic()
+        reasons = trigger.wait(10)
+
+        self.assertEqual(len(reasons), 3)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(trigger.wait(0), [])
+        self.assertEqual(trigger.fired, 1)
+
+    def test_max_delay_bounds_a_continuous_stream(self):
+        trigger = ReallocationTrigger(debounce=0.1, max_delay=0.2)
+        stop = threading.Event()
+
+        def chatter():
+            while not stop.is_set():
+                trigger.notify('session')
+                time.sleep(0.02)
+
+        threading.Thread(target=chatter, daemon=True).start()
+        start = time.monotonic()
+        trigger.wait(10)
+        stop.set()
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_interrupt_wakes_immediately(self):
+        trigger = ReallocationTrigger()
+        threading.Timer(0.05, trigger.interrupt).start()
+        start = time.monotonic()
+        trigger.wait(10)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+
+class TestActivityLogWatcher(unittest.TestCase):
+    def test_reports_new_playback_entries_once(self):
+        events = []
+        entries = [
+            {'Id': 1, 'Date': '2026-01-01T10:00:00.0000000Z', 'Type': 'SessionStarted'},
+            {'Id': 2, 'Date': '2026-01-01T10:00:01.0000000Z', 'Type': 'VideoPlayback'},
+        ]
+        fetch = MagicMock(return_value=entries)
+        watcher = ActivityLogWatcher(fetch, events.append)
+        watcher.min_date = '2026-01-01T09:00:00.0000000Z'
+
+        self.assertEqual(watcher.poll(), 1)
+        self.assertEqual(watcher.min_date, '2026-01-01T10:00:01.0000000Z')
+
+        # minDate is inclusive: the boundary entry comes back and is skipped
+        fetch.return_value = [entries[1]]
+        self.assertEqual(watcher.poll(), 0)
+        fetch.assert_called_with('2026-01-01T10:00:01.0000000Z')
+        self.assertEqual(events, ['activity:VideoPlayback'])
+
+    def test_dates_compared_as_timestamps(self):
+        events = []
+        entries = [
+            # Older than minDate, but sorts after it as a string
+            {'Id': 3, 'Date': '2026-01-01T10:00:01Z', 'Type': 'SessionStarted'},
+            # Same instant as minDate, written with 7 fractional digits
+            {'Id': 4, 'Date': '2026-01-01T10:00:01.5000000Z', 'Type': 'VideoPlayback'},
+        ]
+        fetch = MagicMock(return_value=entries)
+        watcher = ActivityLogWatcher(fetch, events.append)
+        watcher.min_date = '2026-01-01T10:00:01.500000Z'
+
+        self.assertEqual(watcher.poll(), 1)
+        self.assertEqual(watcher.min_date, '2026-01-01T10:00:01.500000Z')
+        fetch.return_value = [entries[1]]
+        self.assertEqual(watcher.poll(), 0)
+
+        fetch.return_value = [{'Id': 5, 'Date': '2026-01-01T10:00:02.0000001Z', 'Type': 'VideoPlaybackStopped'}]
+        self.assertEqual(watcher.poll(), 1)
+        self.assertEqual(watcher.min_date, '2026-01-01T10:00:02.0000001Z')
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date('2026-01-01T10:00:01.1234567Z'),
+                         datetime(2026, 1, 1, 10, 0, 1, 123456, tzinfo=timezone.utc))
+        self.assertEqual(parse_date('2026-01-01T10:00:01Z'),
+                         datetime(2026, 1, 1, 10, 0, 1, tzinfo=timezone.utc))
+        self.assertIsNone(parse_date('yesterday'))
+
+
+class TestTrackerPlaybackChanges(unittest.TestCase):
+    def test_progress_updates_do_not_trigger(self):
+        changes = MagicMock()
+        tracker = SessionTracker('http://localhost:8096', 'key', on_playback_change=changes)
+
+        def session(position, paused=False):
+            return {'Id': 's1', 'NowPlayingItem': {'Id': 'i1'},
+                    'PlayState': {'PositionTicks': position, 'IsPaused': paused}}
+
+        tracker._apply([session(1)])
+        tracker._apply([session(2)])
+        tracker._apply([session(3)])
+        self.assertEqual(changes.call_count, 1)
+
+        tracker._apply([session(3, paused=True)])
+        tracker._apply([])
+        self.assertEqual(changes.call_count, 3)
+
+
+class TestEventDrivenLoop(unittest.TestCase):
+    def test_event_runs_cycle_before_interval(self):
+        daemon = JellyDemon('config.example.yml')
+        daemon.validate_connectivity = MagicMock(return_value=True)
+        daemon.config.daemon.update_interval = 30
+        daemon.config.daemon.reallocation_debounce = 0.05
+        daemon.trigger.debounce = 0.05
+        daemon.config.daemon.pid_file = '/tmp/jd_trigger_test.pid'
+        cycles = []
+
+        def cycle():
+            cycles.append(time.monotonic())
+            if len(cycles) == 1:
+                threading.Timer(0.05, daemon.trigger.notify, args=('session',)).start()
+            else:
+                daemon.running = False
+
+        daemon.run_single_cycle = cycle
+        start = time.monotonic()
+        self.assertEqual(daemon.run(), 0)
+        self.assertEqual(len(cycles), 2)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
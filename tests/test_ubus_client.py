@@ -0,0 +1,163 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from modules.config import RouterConfig
+from modules.openwrt_client import OpenWRTClient
+from modules.ubus_client import UbusClient, UbusError
+
+
+class FakeRpcd:
+    """Minimal stand-in for rpcd's JSON-RPC endpoint."""
+
+    def __init__(self):
+        self.requests = []
+        self.timeouts = []
+        self.valid_tokens = set()
+        self.logins = 0
+        self.tx_bytes = 1000
+        self.flow_bytes = 125000
+
+    def post(self, url, json=None, timeout=None):
+        self.requests.append(json)
+        self.timeouts.append(timeout)
+        batch = json if isinstance(json, list) else [json]
+        replies = [self._reply(call) for call in batch]
+        response = MagicMock(status_code=200)
+        response.json.return_value = replies if isinstance(json, list) else replies[0]
+        return response
+
+    def _reply(self, call):
+        token, obj, method, params = call['params']
+        if (obj, method) == ('session', 'login'):
+            self.logins += 1
+            new_token = f"token{self.logins}"
+            self.valid_tokens = {new_token}
+            return {'id': call['id'], 'result': [0, {'ubus_rpc_session': new_token, 'expires': 300}]}
+        if token not in self.valid_tokens:
+            return {'id': call['id'], 'result': [6]}
+        if (obj, method) == ('network.interface.wan', 'status'):
+            return {'id': call['id'], 'result': [0, {'l3_device': 'pppoe-wan'}]}
+        if (obj, method) == ('network.device', 'status'):
+            return {'id': call['id'], 'result': [0, {'name': params['name'],
+                                                      'statistics': {'tx_bytes': self.tx_bytes}}]}
+        if (obj, method) == ('luci', 'getConntrackList'):
+            return {'id': call['id'], 'result': [0, {'result': [
+                {'layer4': 'tcp', 'src': '203.0.113.5', 'dst': '198.51.100.1',
+                 'sport': 5000, 'dport': 8096, 'bytes': self.flow_bytes},
+            ]}]}
+        return {'id': call['id'], 'result': [5]}
+
+
+class TestUbusClient(unittest.TestCase):
+    def setUp(self):
+        self.rpcd = FakeRpcd()
+        self.client = UbusClient(self.rpcd, 'http://router/ubus', 'root', 'pw')
+
+    def test_logs_in_once_and_reuses_token(self):
+        self.client.call('network.interface.wan', 'status')
+        self.client.call('network.interface.wan', 'status')
+        self.assertEqual(self.rpcd.logins, 1)
+        self.assertEqual(len(self.rpcd.requests), 3)
+
+    def test_reauthenticates_on_access_denied(self):
+        self.client.call('network.interface.wan', 'status')
+        self.rpcd.valid_tokens = set()  # session revoked on the router
+
+        result = self.client.call('network.interface.wan', 'status')
+
+        self.assertEqual(result, {'l3_device': 'pppoe-wan'})
+        self.assertEqual(self.rpcd.logins, 2)
+
+    def test_batch_is_one_request(self):
+        self.client.login()
+        results = self.client.batch([
+            ('network.interface.wan', 'status', {}),
+            ('network.device', 'status', {'name': 'eth0'}),
+            ('nonexistent', 'call', {}),
+        ])
+        self.assertEqual(len(self.rpcd.requests), 2)
+        self.assertIsInstance(self.rpcd.requests[-1], list)
+        self.assertEqual(results[0], {'l3_device': 'pppoe-wan'})
+        self.assertEqual(results[1]['name'], 'eth0')
+        self.assertIsInstance(results[2], UbusError)
+
+
+class TestLuciCounters(unittest.TestCase):
+    def setUp(self):
+        cfg = RouterConfig(host='192.168.1.1', username='root', password='pw',
+                           measurement_mode='delta', client_accounting='conntrack')
+        self.client = OpenWRTClient(cfg)
+        self.rpcd = FakeRpcd()
+        self.client.ubus.session = self.rpcd
+
+    def test_router_timeouts_sent_with_every_call(self):
+        self.client.config.connect_timeout, self.client.config.read_timeout = 2.0, 7.5
+        client = OpenWRTClient(self.client.config)
+        client.ubus.session = self.rpcd
+        client._luci_counters()
+        self.assertTrue(self.rpcd.timeouts)
+        self.assertEqual(set(self.rpcd.timeouts), {(2.0, 7.5)})
+
+    def test_wan_device_cached_between_cycles(self):
+        self.client._luci_counters()
+        before = len(self.rpcd.requests)
+        device, entries = self.client._luci_counters(conntrack=True)
+
+        # login + batch with WAN lookup (+ refetch under the real name), then one batch
+        self.assertEqual(len(self.rpcd.requests) - before, 1)
+        last = self.rpcd.requests[-1]
+        self.assertEqual([call['params'][1] for call in last], ['network.device', 'luci'])
+        self.assertEqual(last[0]['params'][3], {'name': 'pppoe-wan'})
+        self.assertEqual(device['name'], 'pppoe-wan')
+        self.assertEqual(entries[0]['src'], '203.0.113.5')
+
+    def _advance(self, clock):
+        """Fake sleep: time passes while the router counts 2 Mbps out, 1 to the client."""
+        def sleep(seconds):
+            clock[0] += seconds
+            self.rpcd.tx_bytes += 250000
+            self.rpcd.flow_bytes += 125000
+        return sleep
+
+    def test_upload_rates_batched_over_ubus(self):
+        self.client.config.measurement_mode = 'sample'
+        clock = [100.0]
+        with patch('modules.openwrt_client.time.sleep', side_effect=self._advance(clock)), \
+                patch('modules.openwrt_client.time.monotonic', side_effect=lambda: clock[0]):
+            self.client.sample_upload_rates(['203.0.113.5'])
+            before = len(self.rpcd.requests)
+            sample = self.client.sample_upload_rates(['203.0.113.5', '198.51.100.7'])
+
+        # Two readings, one batch each, however many IPs are measured
+        self.assertEqual(len(self.rpcd.requests) - before, 2)
+        for request in self.rpcd.requests[before:]:
+            self.assertEqual([call['params'][1] for call in request], ['network.device', 'luci'])
+        self.assertAlmostEqual(sample.total_mbps, 2.0)
+        self.assertEqual(sample.per_ip, {'203.0.113.5': 1.0, '198.51.100.7': 0.0})
+
+    def test_delta_upload_rates_over_ubus(self):
+        clock = [100.0]
+        advance = self._advance(clock)
+        with patch('modules.openwrt_client.time.sleep', side_effect=advance), \
+                patch('modules.openwrt_client.time.monotonic', side_effect=lambda: clock[0]):
+            self.client.sample_upload_rates(['203.0.113.5'])
+            advance(2.0)
+            before = len(self.rpcd.requests)
+            sample = self.client.sample_upload_rates(['203.0.113.5', '198.51.100.7'])
+
+        # A single reading rated against the previous cycle
+        self.assertEqual(len(self.rpcd.requests) - before, 1)
+        self.assertAlmostEqual(sample.total_mbps, 1.0)
+        # The IP first seen this cycle has no baseline yet
+        self.assertEqual(sample.per_ip, {'203.0.113.5': 0.5})
+
+    def test_client_rates_over_ubus(self):
+        self.client._read_client_dumps_luci = MagicMock(side_effect=[
+            [(10.0, {'f': ('203.0.113.5', 0)}), (11.0, {'f': ('203.0.113.5', 250000)})],
+        ])
+        rates = self.client.get_client_upload_rates(['203.0.113.5'])
+        self.assertAlmostEqual(rates['203.0.113.5'], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from modules.config import JellyfinConfig
+from modules.jellyfin_client import JellyfinClient
+from modules.user_directory import UserDirectory
+
+
+def make_users():
+    return [
+        {'Id': 'u1', 'Name': 'alice', 'Policy': {'RemoteClientBitrateLimit': 5000000}},
+        {'Id': 'u2', 'Name': 'bob', 'Policy': {'RemoteClientBitrateLimit': 0}},
+    ]
+
+
+class TestUserDirectory(unittest.TestCase):
+    def test_ttl_and_invalidate(self):
+        fetch = MagicMock(side_effect=lambda: make_users())
+        directory = UserDirectory(fetch, ttl=60)
+        for _ in range(3):
+            self.assertEqual(directory.get('u1')['Name'], 'alice')
+        self.assertEqual(fetch.call_count, 1)
+
+        directory._fetched_at = time.monotonic() - 61
+        directory.get('u1')
+        self.assertEqual(fetch.call_count, 2)
+
+        directory.invalidate()
+        directory.get('u2')
+        self.assertEqual(fetch.call_count, 3)
+
+    def test_policy_is_a_copy(self):
+        directory = UserDirectory(make_users)
+        policy = directory.policy('u1')
+        policy['RemoteClientBitrateLimit'] = 1
+        self.assertEqual(directory.policy('u1')['RemoteClientBitrateLimit'], 5000000)
+
+    def test_failed_refresh_keeps_snapshot(self):
+        responses = [make_users(), []]
+        directory = UserDirectory(lambda: responses.pop(0), ttl=60)
+        directory.get('u1')
+        directory.invalidate()
+        self.assertEqual(directory.get('u1')['Name'], 'alice')
+
+
+class TestClientUsesDirectory(unittest.TestCase):
+    def setUp(self):
+        cfg = JellyfinConfig(host='localhost', port=8096, api_key='key')
+        self.client = JellyfinClient(cfg)
+        users_response = MagicMock(status_code=200)
+        users_response.json.side_effect = lambda: make_users()
+        self.get = patch.object(self.client.session, 'get', return_value=users_response).start()
+        self.addCleanup(patch.stopall)
+
+    def test_lookups_cost_one_request(self):
+        for user_id in ('u1', 'u2', 'u1', 'u2'):
+            self.client.get_user_info(user_id)
+            self.client.get_user_policy(user_id)
+        self.assertEqual(self.get.call_count, 1)
+        self.assertTrue(self.get.call_args.args[0].endswith('/Users'))
+
+    def test_unknown_user_fetched_individually(self):
+        carol = MagicMock(status_code=200)
+        carol.json.return_value = {'Id': 'u3', 'Name': 'carol'}
+        self.client.get_user_info('u1')
+        self.get.return_value = carol
+
+        self.assertEqual(self.client.get_user_info('u3')['Name'], 'carol')
+        self.assertTrue(self.get.call_args.args[0].endswith('/Users/u3'))
+        self.client.get_user_info('u3')
+        self.assertEqual(self.get.call_count, 2)
+
+    def test_written_policy_updates_directory(self):
+        self.client.restart_stream = MagicMock(return_value=True)
+        with patch.object(self.client.session, 'post', return_value=MagicMock(status_code=204)):
+            self.client.set_user_bandwidth_limit('u1', 8.0)
+
+        self.client.forget_applied_limit()
+        self.assertEqual(self.client.get_user_policy('u1')['RemoteClientBitrateLimit'], 8000000)
+        self.assertEqual(self.get.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import MagicMock
 
 from jellydemon import JellyDemon
+from modules.stream_session import StreamSession
 
 
 class TestExternalUserTracking(unittest.TestCase):
@@ -11,7 +12,10 @@ class TestExternalUserTracking(unittest.TestCase):
         daemon.calculate_and_apply_limits = MagicMock()
 
         daemon.get_current_bandwidth_usage = MagicMock(return_value=5.0)
-        daemon.get_external_streamers = MagicMock(return_value={'u1': {'ip': '2.2.2.2'}})
+        session = StreamSession(id='s1', user_id='u1', endpoint='2.2.2.2:8096', item_id='i1')
+        daemon.get_external_streamers = MagicMock(return_value={
+            's1': {'user_id': 'u1', 'ip': '2.2.2.2', 'session_data': session}
+        })
         with self.assertLogs('jellydemon', level='INFO') as cm:
             daemon.run_single_cycle()
         logs = '\n'.join(cm.output)
@@ -26,6 +30,33 @@ class TestExternalUserTracking(unittest.TestCase):
         self.assertIn('User u1 stopped streaming', logs2)
         self.assertIn('entering high-demand mode', logs2)
 
+    def test_user_stops_with_their_last_session(self):
+        daemon = JellyDemon('config.example.yml')
+        daemon.calculate_and_apply_limits = MagicMock()
+        daemon.get_current_bandwidth_usage = MagicMock(return_value=0.0)
+
+        def streamers(*session_ids):
+            return {
+                session_id: {'user_id': 'u1', 'ip': '2.2.2.2', 'session_data': StreamSession(
+                    id=session_id, user_id='u1', endpoint='2.2.2.2:8096', item_id='i1'
+                )}
+                for session_id in session_ids
+            }
+
+        daemon.get_external_streamers = MagicMock(return_value=streamers('s1', 's2'))
+        daemon.run_single_cycle()
+        daemon.get_external_streamers.return_value = streamers('s2')
+        with self.assertLogs('jellydemon', level='DEBUG') as cm:
+            daemon.run_single_cycle()
+        self.assertNotIn('stopped streaming', '\n'.join(cm.output))
+        self.assertEqual(daemon.current_external_users, {'u1'})
+
+        daemon.get_external_streamers.return_value = {}
+        with self.assertLogs('jellydemon', level='INFO') as cm:
+            daemon.run_single_cycle()
+        self.assertIn('User u1 stopped streaming', '\n'.join(cm.output))
+        self.assertEqual(daemon.current_external_users, set())
+
 
 if __name__ == '__main__':
     unittest.main()
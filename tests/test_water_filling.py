@@ -0,0 +1,67 @@
+import unittest
+
+from modules.allocation import to_list, water_fill
+from modules.bandwidth_manager import BandwidthManager, WaterFillingAlgorithm
+from modules.config import BandwidthConfig
+
+
+def streamer(demand_mbps=None, admin=False):
+    session = {'TranscodingInfo': {'Bitrate': int(demand_mbps * 1_000_000)}} if demand_mbps else {}
+    return {'session_data': session, 'user_data': {'Policy': {'IsAdministrator': admin}}}
+
+
+class TestWaterFill(unittest.TestCase):
+    def test_levels_between_floors_and_caps(self):
+        self.assertEqual(to_list(water_fill(12, [2, 2, 2], [3, 20, 20])), [3, 4.5, 4.5])
+        self.assertEqual(to_list(water_fill(100, [2, 2], [10, 20])), [10, 20])
+        self.assertEqual(to_list(water_fill(10, [6, 2], [8, 8])), [6, 4])
+
+
+class TestWaterFillingAlgorithm(unittest.TestCase):
+    def setUp(self):
+        self.config = BandwidthConfig(min_per_user=2.0, max_per_user=50.0)
+        self.algorithm = WaterFillingAlgorithm()
+
+    def test_never_exceeds_budget_when_floor_does_not_fit(self):
+        streamers = {f'u{i}': streamer() for i in range(10)}
+        limits = self.algorithm.calculate_limits(streamers, 12.0, self.config)
+        self.assertAlmostEqual(sum(limits.values()), 12.0)
+        self.assertEqual(len(limits), 10)
+        self.assertTrue(all(limit > 0 for limit in limits.values()))
+        self.assertEqual(sum(1 for limit in limits.values() if limit >= 2.0), 5)
+
+    def test_admission_is_deterministic_and_sticky(self):
+        streamers = {'a': streamer(), 'b': streamer(), 'c': streamer(admin=True)}
+        limits = self.algorithm.calculate_limits(streamers, 5.0, self.config)
+        # Admins first, then user id
+        self.assertEqual(limits['c'], 2.0)
+        self.assertEqual(limits['a'], 2.0)
+        self.assertEqual(limits['b'], 1.0)
+
+        # Incumbents keep their share when a new admin arrives
+        streamers['d'] = streamer(admin=True)
+        limits = self.algorithm.calculate_limits(streamers, 5.0, self.config)
+        self.assertEqual((limits['a'], limits['c']), (2.0, 2.0))
+        self.assertEqual(limits['d'], 0.5)
+
+    def test_redistributes_capacity_of_low_demand_users(self):
+        streamers = {'low': streamer(3), 'high': streamer(30), 'mid': streamer(8)}
+        limits = self.algorithm.calculate_limits(streamers, 20.0, self.config)
+        self.assertEqual(limits['low'], 3.0)
+        self.assertAlmostEqual(limits['mid'], 8.0)
+        self.assertAlmostEqual(limits['high'], 9.0)
+
+    def test_uses_whole_budget_up_to_max_per_user(self):
+        streamers = {'a': streamer(3), 'b': streamer(5)}
+        limits = self.algorithm.calculate_limits(streamers, 60.0, self.config)
+        self.assertAlmostEqual(sum(limits.values()), 60.0)
+        limits = self.algorithm.calculate_limits(streamers, 500.0, self.config)
+        self.assertEqual(limits, {'a': 50.0, 'b': 50.0})
+
+    def test_registered_with_manager(self):
+        manager = BandwidthManager(BandwidthConfig(algorithm='water_filling'))
+        self.assertIsInstance(manager.algorithm, WaterFillingAlgorithm)
+
+
+if __name__ == '__main__':
+    unittest.main()